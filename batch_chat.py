@@ -0,0 +1,107 @@
+"""
+Kirim banyak pertanyaan ke POST /chat/batch dan simpan hasilnya sebagai NDJSON.
+
+Input:
+  .txt   : 1 pertanyaan per baris
+  .jsonl : {"id": "...", "message": "..."} per baris (id opsional)
+
+Contoh:
+  APP_TOKEN=... python batch_chat.py pertanyaan.txt --out hasil.ndjson
+  python batch_chat.py eval.jsonl --retrieval-only --chunk-size 500
+
+Pertanyaan dikirim per --chunk-size dalam 1 request (1 koneksi HTTP, 1 pass
+retrieval di server). Baris hasil ditulis begitu diterima, dengan:
+  "index": urutan pertanyaan di input (baris kosong tidak dihitung)
+  "line" : nomor baris di file input (mulai dari 1)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+DEFAULT_URL = os.getenv("AGENT_URL", "http://127.0.0.1:8001")
+
+
+def load_items(path: Path) -> list:
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            if path.suffix == ".jsonl":
+                row = json.loads(line)
+                items.append({"id": str(row.get("id", n)), "message": row["message"], "line": n + 1})
+            else:
+                items.append({"id": str(n), "message": line, "line": n + 1})
+    return items
+
+
+def post_batch(url: str, token: str, body: dict, timeout: float):
+    req = urllib.request.Request(
+        f"{url.rstrip('/')}/chat/batch",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json", "x-app-token": token},
+        method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        for raw in resp:
+            if raw.strip():
+                yield json.loads(raw)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help=".txt (1 pertanyaan per baris) atau .jsonl")
+    parser.add_argument("--out", default=None, help="file NDJSON hasil (default: stdout)")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--token", default=os.getenv("APP_TOKEN"))
+    parser.add_argument("--user-id", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=200, help="pertanyaan per request (<= BATCH_MAX_ITEMS server)")
+    parser.add_argument("--retrieval-only", action="store_true", help="hanya citations, tanpa panggil model")
+    parser.add_argument("--timeout", type=float, default=3600)
+    args = parser.parse_args()
+
+    if not args.token:
+        parser.error("APP_TOKEN belum di-set (atau pakai --token)")
+
+    items = load_items(Path(args.input))
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+
+    t0 = time.perf_counter()
+    totals = {"items": 0, "errors": 0, "cache_hits": 0}
+    try:
+        for start in range(0, len(items), args.chunk_size):
+            chunk = items[start:start + args.chunk_size]
+            body = {
+                "user_id": args.user_id,
+                "items": [{"id": it["id"], "message": it["message"]} for it in chunk],
+                "retrieval_only": args.retrieval_only,
+            }
+            for row in post_batch(args.url, args.token, body, args.timeout):
+                if row.get("done"):
+                    for key in totals:
+                        totals[key] += row.get(key, 0)
+                    continue
+                row["line"] = chunk[row["index"]]["line"]
+                row["index"] += start
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+            print(f"[INFO] {min(start + len(chunk), len(items))}/{len(items)} selesai", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    wall = time.perf_counter() - t0
+    print(
+        f"✅ batch selesai: items={totals['items']} errors={totals['errors']} "
+        f"cache_hits={totals['cache_hits']} wall={wall:.1f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import json
+import math
+import platform
+import subprocess
+import time
+from typing import Dict, List
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    if not samples_ms:
+        return {"n": 0}
+    xs = sorted(samples_ms)
+
+    def pct(p: float) -> float:
+        # nearest-rank
+        idx = min(len(xs), max(1, math.ceil(p / 100 * len(xs)))) - 1
+        return round(xs[idx], 4)
+
+    return {
+        "n": len(xs),
+        "mean_ms": round(sum(xs) / len(xs), 4),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(xs[-1], 4),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def report(name: str, results: dict, out_path: str | None = None) -> dict:
+    """Bungkus hasil benchmark jadi JSON yang bisa dibandingkan antar commit."""
+    doc = {
+        "benchmark": name,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "timestamp": int(time.time()),
+        "results": results,
+    }
+    text = json.dumps(doc, indent=2, ensure_ascii=False)
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return doc
@@ -0,0 +1,90 @@
+"""
+Microbenchmark retrieval terhadap data/knowledge.db.
+
+  python -m bench.bench_retrieval --iterations 20 --out bench_retrieval.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import time
+from pathlib import Path
+
+from bench._stats import percentiles, report
+
+QUESTIONS_PATH = Path(__file__).resolve().parent / "questions.json"
+
+
+def _timed(fn, args_list, iterations: int) -> dict:
+    samples = []
+    t_start = time.perf_counter()
+    for _ in range(iterations):
+        for args in args_list:
+            t0 = time.perf_counter()
+            fn(*args)
+            samples.append((time.perf_counter() - t0) * 1000)
+    wall = time.perf_counter() - t_start
+    out = percentiles(samples)
+    out["ops_per_sec"] = round(len(samples) / wall, 2) if wall > 0 else None
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--questions", default=str(QUESTIONS_PATH))
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    os.environ.setdefault("APP_TOKEN", "bench")
+    questions = json.loads(Path(args.questions).read_text(encoding="utf-8"))
+
+    from my_agent import retrieval_tool as rt
+    from my_agent.app import server
+
+    results = {}
+    # search_report mencetak log per panggilan; jangan ikut diukur di terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        rt.search_report(questions[0], k=5)  # buka pool koneksi dulu
+
+        results["expand_queries"] = _timed(
+            lambda q: rt._expand_queries(rt._clean_query(q)),
+            [(q,) for q in questions],
+            args.iterations,
+        )
+
+        def uncached(q, k):
+            rt._result_cache.clear()
+            rt.search_report(q, k=k)
+
+        results["search_report_uncached"] = _timed(uncached, [(q, server.GENERAL_K) for q in questions], args.iterations)
+        for q in questions:
+            rt.search_report(q, k=server.GENERAL_K)
+        results["search_report_cached"] = _timed(
+            lambda q, k: rt.search_report(q, k=k),
+            [(q, server.GENERAL_K) for q in questions],
+            args.iterations,
+        )
+
+        rt._result_cache.clear()
+        retrieved = [(q, *asyncio.run(server._retrieve(q))) for q in questions]
+
+        results["retrieve_pipeline"] = _timed(
+            lambda q: asyncio.run(server._retrieve(q)),
+            [(q,) for q in questions],
+            max(1, args.iterations // 4),
+        )
+        results["build_context"] = _timed(
+            lambda q, is_recipe, hits: server._build_context(hits, q, is_recipe),
+            retrieved,
+            args.iterations,
+        )
+
+    results["corpus"] = {"questions": len(questions), "db": str(rt.DB_PATH)}
+    report("retrieval", results, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Benchmark cold start: waktu import my_agent.app.server dan init_runtime()
+(import ADK + pembuatan agent/runner), masing-masing di proses Python baru.
+
+  python -m bench.bench_startup --runs 5 --out bench_startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from bench._stats import percentiles, report
+
+PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+from my_agent.app import server
+t1 = time.perf_counter()
+server.init_runtime()
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "init_runtime_ms": (t2 - t1) * 1000}))
+"""
+
+
+def run_once() -> dict:
+    env = dict(os.environ)
+    env.setdefault("APP_TOKEN", "bench")
+    out = subprocess.check_output([sys.executable, "-c", PROBE], env=env, text=True)
+    # baris terakhir = JSON (baris lain log/WARN)
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+    results = {
+        "import": percentiles([s["import_ms"] for s in samples]),
+        "init_runtime": percentiles([s["init_runtime_ms"] for s in samples]),
+    }
+    report("startup", results, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Load test /chat in-process (FastAPI via httpx ASGITransport) dengan stub model.
+Tidak butuh Gemini key / jaringan.
+
+  python -m bench.load_chat --requests 200 --concurrency 20 \
+      --latency-ms 800 --overload-rate 0.1 --out bench_chat.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import time
+from pathlib import Path
+
+from bench._stats import percentiles, report
+
+QUESTIONS_PATH = Path(__file__).resolve().parent / "questions.json"
+
+
+async def run_load(app, questions, total: int, concurrency: int, endpoint: str, token: str, seed: int):
+    import httpx
+
+    rng = random.Random(seed)
+    sem = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://bench",
+        timeout=None,
+    ) as client:
+
+        async def one(i: int):
+            body = {"user_id": i % 50, "message": rng.choice(questions), "session_id": f"bench-{i}"}
+            async with sem:
+                t0 = time.perf_counter()
+                if endpoint == "/chat/stream":
+                    async with client.stream("POST", endpoint, json=body, headers={"x-app-token": token}) as r:
+                        async for _ in r.aiter_bytes():
+                            pass
+                        status = r.status_code
+                else:
+                    r = await client.post(endpoint, json=body, headers={"x-app-token": token})
+                    status = r.status_code
+                latencies.append((time.perf_counter() - t0) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        wall = time.perf_counter() - t_start
+
+    out = percentiles(latencies)
+    out["throughput_rps"] = round(total / wall, 2) if wall > 0 else None
+    out["wall_sec"] = round(wall, 3)
+    out["status"] = {str(k): v for k, v in sorted(statuses.items())}
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--endpoint", default="/chat", choices=["/chat", "/chat/stream"])
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--first-token-ms", type=float, default=150)
+    parser.add_argument("--overload-rate", type=float, default=0.0, help="peluang primary melempar 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="peluang primary macet sebelum event pertama")
+    parser.add_argument("--stall-ms", type=float, default=10000)
+    parser.add_argument("--fallback-latency-ms", type=float, default=1200)
+    parser.add_argument("--answer-cache", action="store_true", help="aktifkan answer cache (default off)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--questions", default=str(QUESTIONS_PATH))
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    token = os.environ.setdefault("APP_TOKEN", "bench")
+    if not args.answer_cache:
+        os.environ["ANSWER_CACHE_BACKEND"] = "off"
+
+    from bench.stub_model import StubRunner
+    from my_agent.app import server
+
+    primary = StubRunner(
+        "primary",
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        first_token_ms=args.first_token_ms,
+        overload_rate=args.overload_rate,
+        stall_rate=args.stall_rate,
+        stall_ms=args.stall_ms,
+        seed=args.seed,
+    )
+    fallback = StubRunner(
+        "fallback",
+        latency_ms=args.fallback_latency_ms,
+        jitter_ms=args.jitter_ms,
+        first_token_ms=args.first_token_ms,
+        seed=args.seed + 1,
+    )
+    server.adk_runner = primary
+    server.fallback_runner = fallback
+
+    questions = json.loads(Path(args.questions).read_text(encoding="utf-8"))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(
+            run_load(server.app, questions, args.requests, args.concurrency, args.endpoint, token, args.seed)
+        )
+
+    results["config"] = {
+        k: getattr(args, k)
+        for k in ["requests", "concurrency", "endpoint", "latency_ms", "jitter_ms",
+                  "first_token_ms", "overload_rate", "stall_rate", "stall_ms", "fallback_latency_ms",
+                  "answer_cache"]
+    }
+    results["model_calls"] = {
+        "primary": primary.calls,
+        "primary_overloads": primary.overloads,
+        "primary_stalls": primary.stalls,
+        "fallback": fallback.calls,
+    }
+    results["hedge"] = {
+        "delay_sec": round(server.hedge_policy.delay(), 3),
+        "breaker_state": server.breaker.state,
+        "breaker_trips": server.breaker.trips,
+    }
+    report("chat_load", results, args.out)
+
+
+if __name__ == "__main__":
+    main()
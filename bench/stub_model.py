@@ -0,0 +1,76 @@
+"""
+Stub pengganti adk_runner / fallback_runner untuk benchmark offline
+(tanpa Gemini key). Meniru event ADK: beberapa event parsial lalu 1 event final.
+"""
+import asyncio
+import random
+
+from google.adk.events.event import Event
+from google.genai import types
+
+
+class StubOverloadError(Exception):
+    """Meniru error 503 dari Gemini (dideteksi _is_overloaded_error)."""
+
+    status_code = 503
+
+    def __init__(self):
+        super().__init__("503 UNAVAILABLE: model overloaded (stub)")
+
+
+class StubRunner:
+    def __init__(
+        self,
+        name: str = "stub",
+        latency_ms: float = 800,
+        jitter_ms: float = 200,
+        first_token_ms: float = 150,
+        overload_rate: float = 0.0,
+        stall_rate: float = 0.0,
+        stall_ms: float = 0.0,
+        chunks: int = 8,
+        seed: int | None = None,
+    ):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.first_token_ms = first_token_ms
+        self.overload_rate = overload_rate
+        # Meniru tail latency: sebagian request "macet" sebelum event pertama
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self.chunks = max(1, chunks)
+        self._rng = random.Random(seed)
+
+        self.calls = 0
+        self.overloads = 0
+        self.stalls = 0
+
+    async def run_async(self, *, user_id: str, session_id: str, new_message, run_config=None, **kwargs):
+        self.calls += 1
+        if self._rng.random() < self.stall_rate:
+            self.stalls += 1
+            await asyncio.sleep(self.stall_ms / 1000)
+        await asyncio.sleep(self.first_token_ms / 1000)
+        if self._rng.random() < self.overload_rate:
+            self.overloads += 1
+            raise StubOverloadError()
+
+        total = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms))
+        rest = max(0.0, total - self.first_token_ms) / 1000
+        words = [f"kata{i} " for i in range(self.chunks)]
+
+        for w in words:
+            yield Event(
+                author="tanya_dewi",
+                invocation_id="stub",
+                partial=True,
+                content=types.Content(role="model", parts=[types.Part(text=w)]),
+            )
+            await asyncio.sleep(rest / self.chunks)
+
+        yield Event(
+            author="tanya_dewi",
+            invocation_id="stub",
+            content=types.Content(role="model", parts=[types.Part(text=f"[{self.name}] " + "".join(words).strip())]),
+        )
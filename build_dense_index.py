@@ -0,0 +1,82 @@
+"""
+Build index dense (embedding) dari chunks_fr_ai.jsonl untuk hybrid retrieval.
+
+Contoh:
+  python build_dense_index.py              # float32
+  python build_dense_index.py --int8       # int8 + skala per baris (4x lebih kecil)
+
+Butuh: numpy, sentence-transformers (model jalan lokal di CPU).
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+JSONL_PATH = PROJECT_ROOT / "chunks_fr_ai.jsonl"
+OUT_DIR = PROJECT_ROOT / "data"
+DENSE_MODEL = os.getenv("DENSE_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+
+
+def load_chunks(path: Path):
+    ids, texts = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            title = row.get("section_title") or ""
+            ids.append(row["id"])
+            texts.append(f"{title}\n{row['text']}".strip())
+    return ids, texts
+
+
+def quantize_int8(mat: np.ndarray):
+    # Skala per baris supaya nilai maksimum |x| jadi 127
+    scale = np.abs(mat).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.round(mat / scale[:, None]).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--int8", action="store_true", help="simpan matriks terkuantisasi int8")
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    ids, texts = load_chunks(JSONL_PATH)
+    print(f"📥 {len(ids)} chunks, model={DENSE_MODEL}")
+
+    model = SentenceTransformer(DENSE_MODEL, device="cpu")
+    mat = model.encode(
+        texts,
+        batch_size=args.batch_size,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=True,
+    ).astype(np.float32)
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    dtype = "float32"
+    if args.int8:
+        mat, scale = quantize_int8(mat)
+        dtype = "int8"
+        np.save(OUT_DIR / "dense_scale.tmp.npy", scale)
+
+    np.save(OUT_DIR / "dense.tmp.npy", mat)
+    meta = {"model": DENSE_MODEL, "dtype": dtype, "dim": int(mat.shape[1]), "chunk_ids": ids}
+    (OUT_DIR / "dense_ids.tmp.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    # Ganti file lama secara atomik (matriks dulu, side table terakhir)
+    if args.int8:
+        os.replace(OUT_DIR / "dense_scale.tmp.npy", OUT_DIR / "dense_scale.npy")
+    os.replace(OUT_DIR / "dense.tmp.npy", OUT_DIR / "dense.npy")
+    os.replace(OUT_DIR / "dense_ids.tmp.json", OUT_DIR / "dense_ids.json")
+
+    print(f"✅ dense index saved: {OUT_DIR} ({dtype}, shape={mat.shape})")
+
+
+if __name__ == "__main__":
+    main()
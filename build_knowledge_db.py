@@ -1,55 +1,204 @@
-import sqlite3
+"""
+Build / update data/knowledge.db (FTS5) dari chunks_fr_ai.jsonl.
+
+Default: incremental + shadow swap
+- DB lama dicopy ke file shadow, lalu hanya chunk_id yang berubah
+  (dibandingkan lewat content hash) yang di-upsert, dalam 1 transaksi.
+- Setelah FTS5 `optimize`, file shadow menggantikan knowledge.db secara
+  atomik (os.replace). Server yang sedang jalan tetap membaca file lama
+  sampai engine retrieval mendeteksi perubahan dan membuka file baru.
+
+Schema:
+- chunks     : teks + metadata per chunk (index B-tree category, source)
+- report_fts : FTS5 external-content atas chunks (hanya chunk + stem)
+DB layout lama (semua kolom di report_fts) dimigrasi otomatis dengan rebuild penuh.
+
+Opsi:
+  --full      : bangun ulang dari nol (tetap lewat shadow)
+  --in-place  : tulis langsung ke knowledge.db (tanpa shadow; jangan dipakai
+                saat server jalan)
+"""
+import argparse
+import hashlib
 import json
+import os
+import sqlite3
 from pathlib import Path
 
+from my_agent.stemmer import stem_text
+
 PROJECT_ROOT = Path(__file__).resolve().parent
 DB_PATH = PROJECT_ROOT / "data" / "knowledge.db"
 JSONL_PATH = PROJECT_ROOT / "chunks_fr_ai.jsonl"
 
-DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-
-conn = sqlite3.connect(DB_PATH)
-cur = conn.cursor()
-
-print("🗑️ Drop old table (if exists)")
-cur.execute("DROP TABLE IF EXISTS report_fts")
-
-print("🆕 Create FTS table")
-cur.execute("""
-CREATE VIRTUAL TABLE report_fts USING fts5(
-  chunk,
-  source,
-  page,
-  section_title,
-  product,
-  fr_number,
-  chunk_id,
-  category
-)
-""")
-
-print("📥 Insert chunks")
-with open(JSONL_PATH, encoding="utf-8") as f:
-    for line in f:
-        row = json.loads(line)
-        cur.execute(
-            """
-            INSERT INTO report_fts
-            (chunk, source, page, section_title, fr_number, chunk_id, category)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                row["text"],
-                row["source"],
-                row["page"],
-                row.get("section_title"),
-                row.get("fr_number"),
-                row["id"],
-                row.get("category"),
-            )
+# Kolom tabel metadata `chunks` (urutan = row_values). Hanya chunk + stem yang
+# masuk index FTS5; sisanya kolom biasa, dengan index B-tree untuk filter.
+CHUNK_COLS = ["chunk", "source", "page", "section_title", "fr_number", "chunk_id", "category", "stem"]
+
+
+def row_values(row: dict) -> tuple:
+    return (
+        row["text"],
+        row["source"],
+        row["page"],
+        row.get("section_title"),
+        row.get("fr_number"),
+        row["id"],
+        row.get("category"),
+        # Versi ter-stem dari chunk, untuk pencocokan morfologis di search_report.
+        # Ikut di-hash, jadi perubahan aturan stemmer otomatis memicu upsert.
+        stem_text(row["text"]),
+    )
+
+
+def content_hash(values: tuple) -> str:
+    raw = json.dumps(values, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def load_jsonl(path: Path) -> dict:
+    rows = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            rows[row["id"]] = row_values(row)
+    return rows
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    fts_cols = [r[1] for r in conn.execute("PRAGMA table_info(report_fts)")]
+    if fts_cols and "source" in fts_cols:
+        # Layout lama: metadata ikut ter-index di report_fts (+ chunk_meta).
+        # FTS5 tidak bisa ALTER TABLE, jadi index dibuang lalu diisi ulang penuh.
+        print("[INFO] report_fts masih layout lama, index dibangun ulang")
+        conn.execute("DROP TABLE report_fts")
+        conn.execute("DROP TABLE IF EXISTS chunk_meta")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS chunks (
+      id INTEGER PRIMARY KEY,
+      chunk_id TEXT NOT NULL UNIQUE,
+      chunk TEXT NOT NULL,
+      source TEXT,
+      page INTEGER,
+      section_title TEXT,
+      fr_number TEXT,
+      category TEXT,
+      stem TEXT,
+      content_hash TEXT NOT NULL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_category ON chunks(category)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source)")
+
+    # External-content FTS5: teks disimpan sekali (di chunks), index hanya
+    # berisi term chunk + stem. rowid FTS = chunks.id.
+    conn.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS report_fts USING fts5(
+      chunk,
+      stem,
+      content='chunks',
+      content_rowid='id'
+    )
+    """)
+    # Trigger menjaga index tetap sinkron dengan isi chunks
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+      INSERT INTO report_fts(rowid, chunk, stem) VALUES (new.id, new.chunk, new.stem);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+      INSERT INTO report_fts(report_fts, rowid, chunk, stem) VALUES ('delete', old.id, old.chunk, old.stem);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS chunks_au AFTER UPDATE ON chunks BEGIN
+      INSERT INTO report_fts(report_fts, rowid, chunk, stem) VALUES ('delete', old.id, old.chunk, old.stem);
+      INSERT INTO report_fts(rowid, chunk, stem) VALUES (new.id, new.chunk, new.stem);
+    END
+    """)
+
+
+def sync(conn: sqlite3.Connection, rows: dict) -> dict:
+    """Upsert chunk yang berubah + hapus chunk yang hilang, dalam 1 transaksi."""
+    with conn:
+        ensure_schema(conn)
+
+        existing = dict(conn.execute("SELECT chunk_id, content_hash FROM chunks"))
+        hashes = {cid: content_hash(values) for cid, values in rows.items()}
+
+        stale = [cid for cid, h in existing.items() if cid not in rows or hashes[cid] != h]
+        fresh = [cid for cid in rows if existing.get(cid) != hashes[cid]]
+
+        if stale:
+            # Trigger chunks_ad ikut menghapus entri FTS-nya
+            conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(c,) for c in stale])
+
+        marks = ", ".join("?" for _ in range(len(CHUNK_COLS) + 1))
+        conn.executemany(
+            f"INSERT INTO chunks ({', '.join(CHUNK_COLS)}, content_hash) VALUES ({marks})",
+            [(*rows[cid], hashes[cid]) for cid in fresh],
         )
 
-conn.commit()
-conn.close()
+        conn.execute("INSERT INTO report_fts(report_fts) VALUES('optimize')")
+
+    return {
+        "total": len(rows),
+        "upserted": len(fresh),
+        "deleted": len([c for c in stale if c not in rows]),
+        "unchanged": len(rows) - len(fresh),
+    }
+
+
+def build(db_path: Path, jsonl_path: Path, full: bool = False, in_place: bool = False) -> dict:
+    rows = load_jsonl(jsonl_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if in_place:
+        conn = sqlite3.connect(db_path)
+        if full:
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS report_fts")
+                conn.execute("DROP TABLE IF EXISTS chunk_meta")
+                conn.execute("DROP TABLE IF EXISTS chunks")
+        stats = sync(conn, rows)
+        conn.close()
+        return stats
+
+    shadow = db_path.with_name(db_path.name + ".building")
+    if shadow.exists():
+        shadow.unlink()
+
+    conn = sqlite3.connect(shadow)
+    if db_path.exists() and not full:
+        # Mulai dari isi DB sekarang supaya yang di-upsert hanya diff-nya
+        src = sqlite3.connect(f"{db_path.resolve().as_uri()}?mode=ro", uri=True)
+        src.backup(conn)
+        src.close()
+    stats = sync(conn, rows)
+    conn.execute("VACUUM")
+    conn.close()
+
+    os.replace(shadow, db_path)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=str(DB_PATH))
+    parser.add_argument("--jsonl", default=str(JSONL_PATH))
+    parser.add_argument("--full", action="store_true", help="bangun ulang dari nol")
+    parser.add_argument("--in-place", action="store_true", help="tulis langsung tanpa shadow DB")
+    args = parser.parse_args()
+
+    stats = build(Path(args.db), Path(args.jsonl), full=args.full, in_place=args.in_place)
+
+    print(
+        f"✅ knowledge.db updated: total={stats['total']} upserted={stats['upserted']} "
+        f"deleted={stats['deleted']} unchanged={stats['unchanged']}"
+    )
+
 
-print("✅ knowledge.db rebuilt successfully")
+if __name__ == "__main__":
+    main()
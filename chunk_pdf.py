@@ -1,18 +1,16 @@
+import argparse
+import hashlib
+import os
 import re
 import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from pypdf import PdfReader
 
+from my_agent.categories import CATEGORY_MAP
+
 HD_RE = re.compile(r"^(#{1,3})\s+(.+)$", re.MULTILINE)
-CATEGORY_MAP = {
-    "Knowledge_Branding_dan_Konten_Promosi_UMKM_Pala": "Branding & Konten Promosi",
-    "Knowledge_Digital_Marketing_dan_Penjualan_UMKM_Pala": "Digital Marketing & Penjualan",
-    "Knowledge_Kemasan_Warna_dan_Visual_Produk_Pala": "Kemasan, Warna & Visual",
-    "Knowledge_Penentuan_Harga_Jual_UMKM_Pala": "Penentuan Harga",
-    "Knowledge_Pengolahan_dan_Kualitas_Buah_Pala": "Pengolahan & Kualitas",
-    "Knowledge_Resep_Olahan_Buah_Pala_UMKM": "Resep Olahan",
-}
 
 def clean_text(t: str) -> str:
     t = (t or "").replace("\u00a0", " ")
@@ -129,32 +127,149 @@ def save_jsonl(chunks: List[Dict[str, Any]], out_path: str):
         for row in chunks:
             f.write(json.dumps(row, ensure_ascii=False) + "\n")
 
-if __name__ == "__main__":
-    pdf_dir = Path("knowledge_pala")  
-    out_path = "chunks_fr_ai.jsonl"
-
-    if not pdf_dir.exists():
-        raise FileNotFoundError(f"Folder not found: {pdf_dir}")
-
-    all_chunks = []
-
+# =========================
+# Pipeline paralel + incremental
+# =========================
+MANIFEST_VERSION = 1
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def load_previous_chunks(out_path: Path, sources: set) -> Dict[str, List[Dict[str, Any]]]:
+    """Ambil chunk lama (dari JSONL sebelumnya) hanya untuk source yang mau dipakai ulang."""
+    prev: Dict[str, List[Dict[str, Any]]] = {s: [] for s in sources}
+    if not sources or not out_path.exists():
+        return prev
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            if row.get("source") in prev:
+                prev[row["source"]].append(row)
+    return prev
+
+def _chunk_worker(pdf_path: str, max_chars: int, overlap_chars: int) -> List[Dict[str, Any]]:
+    return build_chunks(pdf_path, max_chars=max_chars, overlap_chars=overlap_chars)
+
+def run_pipeline(
+    pdf_dir: Path,
+    out_path: Path,
+    manifest_path: Path,
+    workers: int | None = None,
+    force: bool = False,
+    max_chars: int = 1500,
+    overlap_chars: int = 0,
+) -> Dict[str, Any]:
+    """
+    - PDF diproses paralel di process pool.
+    - Chunk langsung ditulis ke JSONL (tmp) begitu satu PDF selesai, tidak
+      ditampung semua di memori.
+    - Manifest menyimpan sha256 per PDF; PDF yang tidak berubah dilewati dan
+      chunk lamanya dipakai ulang.
+    """
     pdf_files = sorted(pdf_dir.glob("*.pdf"))
     if not pdf_files:
         raise FileNotFoundError("No PDF files found in folder")
 
-    for pdf_path in pdf_files:
-        print(f"📄 Processing: {pdf_path.name}")
-        chunks = build_chunks(str(pdf_path))
-        all_chunks.extend(chunks)
+    params = {"max_chars": max_chars, "overlap_chars": overlap_chars}
+    old = load_manifest(manifest_path)
+    old_files = old.get("files", {}) if old.get("version") == MANIFEST_VERSION and old.get("params") == params else {}
+
+    hashes = {p.name: file_sha256(p) for p in pdf_files}
+    unchanged = {
+        name for name, digest in hashes.items()
+        if not force and old_files.get(name, {}).get("sha256") == digest
+    }
+    prev = load_previous_chunks(out_path, unchanged)
+    # Kalau chunk lama tidak lengkap di JSONL, proses ulang saja
+    for name in list(unchanged):
+        if len(prev[name]) != old_files[name].get("chunks"):
+            unchanged.discard(name)
+
+    todo = [p for p in pdf_files if p.name not in unchanged]
+    files: Dict[str, Any] = {}
+    preview: List[Dict[str, Any]] = []
+    total = 0
+
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        def write(rows: List[Dict[str, Any]]):
+            nonlocal total
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            total += len(rows)
+            preview.extend(rows[: max(0, 3 - len(preview))])
+
+        for name in sorted(unchanged):
+            print(f"⏭️  Unchanged, reuse {len(prev[name])} chunks: {name}")
+            write(prev[name])
+            files[name] = {"sha256": hashes[name], "chunks": len(prev[name])}
+
+        if todo:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(_chunk_worker, str(p), max_chars, overlap_chars): p
+                    for p in todo
+                }
+                for fut in as_completed(futures):
+                    pdf_path = futures[fut]
+                    rows = fut.result()
+                    print(f"📄 Processed: {pdf_path.name} ({len(rows)} chunks)")
+                    write(rows)
+                    files[pdf_path.name] = {"sha256": hashes[pdf_path.name], "chunks": len(rows)}
+
+    os.replace(tmp_path, out_path)
+    manifest = {"version": MANIFEST_VERSION, "params": params, "files": files}
+    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    return {
+        "pdfs": len(pdf_files),
+        "processed": len(todo),
+        "reused": len(unchanged),
+        "chunks": total,
+        "preview": preview,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf-dir", default="knowledge_pala")
+    parser.add_argument("--out", default="chunks_fr_ai.jsonl")
+    parser.add_argument("--manifest", default="chunks_manifest.json")
+    parser.add_argument("--workers", type=int, default=None, help="jumlah proses (default: jumlah CPU)")
+    parser.add_argument("--force", action="store_true", help="proses ulang semua PDF")
+    args = parser.parse_args()
+
+    pdf_dir = Path(args.pdf_dir)
+    out_path = Path(args.out)
+
+    if not pdf_dir.exists():
+        raise FileNotFoundError(f"Folder not found: {pdf_dir}")
 
-    save_jsonl(all_chunks, out_path)
+    stats = run_pipeline(
+        pdf_dir,
+        out_path,
+        Path(args.manifest),
+        workers=args.workers,
+        force=args.force,
+    )
 
-    print(f"\n✅ Done. Total PDFs: {len(pdf_files)}")
-    print(f"✅ Total chunks: {len(all_chunks)}")
+    print(f"\n✅ Done. Total PDFs: {stats['pdfs']} (processed {stats['processed']}, reused {stats['reused']})")
+    print(f"✅ Total chunks: {stats['chunks']}")
     print(f"✅ Saved: {out_path}")
 
     # contoh 3 chunk pertama
-    for c in all_chunks[:3]:
+    for c in stats["preview"]:
         print("\n---")
-        print({k: c[k] for k in ["id", "source", "page", "h1", "h2", "h3"]})
+        print({k: c.get(k) for k in ["id", "source", "page", "h1", "h2", "h3"]})
         print(c["text"][:200], "...")
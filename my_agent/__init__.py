@@ -1 +1,9 @@
-from . import agent
+import importlib
+
+
+def __getattr__(name):
+    # `my_agent.agent` (ADK + google.genai, ~1 detik) di-import saat pertama dipakai,
+    # bukan setiap kali modul my_agent.* lain di-import.
+    if name == "agent":
+        return importlib.import_module(".agent", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from my_agent.cache import TTLCache
+
+
+def normalize_question(text: str) -> str:
+    return " ".join(re.findall(r"[\w]+", (text or "").lower()))
+
+
+def answer_cache_key(
+    question: str, is_recipe: bool, chunk_ids: List[str], model: str, generation: tuple | None = None
+) -> str:
+    """
+    Key cache jawaban: pertanyaan yang dinormalisasi + jalur (resep/umum)
+    + urutan chunk_id yang dikirim ke model + nama model yang menjawab
+    + generasi knowledge.db (setelah rebuild, chunk_id yang sama bisa berisi teks lain).
+    """
+    raw = json.dumps(
+        [normalize_question(question), bool(is_recipe), list(chunk_ids), model, generation],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryAnswerCache:
+    """Backend in-memory (LRU, dibatasi jumlah entry dan umur)."""
+
+    def __init__(self, max_entries: int = 512, max_age_sec: float = 86400):
+        self._cache = TTLCache(max_size=max_entries, ttl_sec=max_age_sec)
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._cache.get(key)
+
+    def set(self, key: str, payload: dict):
+        self._cache.set(key, payload)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class SqliteAnswerCache:
+    """
+    Backend SQLite (file terpisah di samping data/chat.db), tahan restart.
+    Eviction: entry lebih tua dari max_age_sec dibuang, lalu entry yang paling
+    lama tidak dipakai dibuang sampai jumlahnya <= max_entries.
+    """
+
+    def __init__(self, db_path: str | Path, max_entries: int = 5000, max_age_sec: float = 86400):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.max_age_sec = max_age_sec
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS answers (
+            cache_key TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_hit_at REAL NOT NULL
+        )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_last_hit ON answers(last_hit_at)")
+        self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM answers WHERE cache_key = ? AND created_at >= ?",
+                (key, now - self.max_age_sec),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_hit_at = ? WHERE cache_key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, payload: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (cache_key, payload, created_at, last_hit_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(payload, ensure_ascii=False), now, now),
+            )
+            self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.max_age_sec,))
+            self._conn.execute(
+                """
+                DELETE FROM answers WHERE cache_key IN (
+                    SELECT cache_key FROM answers
+                    ORDER BY last_hit_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "size": size,
+            "max_size": self.max_entries,
+            "ttl_sec": self.max_age_sec,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def make_answer_cache(backend: str, db_path: str | Path, max_entries: int, max_age_sec: float):
+    """backend: "memory" | "sqlite" | "off" (None = cache mati)."""
+    backend = (backend or "off").lower()
+    if backend == "memory":
+        return MemoryAnswerCache(max_entries=max_entries, max_age_sec=max_age_sec)
+    if backend == "sqlite":
+        return SqliteAnswerCache(db_path, max_entries=max_entries, max_age_sec=max_age_sec)
+    return None
@@ -0,0 +1,156 @@
+import re
+from typing import List, Set
+
+from my_agent.retrieval_tool import STOPWORDS
+
+SENT_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+WORD_RE = re.compile(r"[\w]+")
+
+# Minimal sisa budget (token) supaya chunk terakhir masih layak dipotong & dimasukkan
+MIN_PARTIAL_TOKENS = 60
+
+# Header tiap chunk di REFERENSI. Hanya chunk yang dikirim utuh memakai "chunk_id=":
+# header itulah yang dibaca ulang (conversation.seen_chunk_ids) sebagai "sudah dilihat".
+CHUNK_HEADER = "[S{i}] source={source} page={page} chunk_id={chunk_id}"
+# Chunk yang dipotong (trim_to_query / budget): bagian yang dibuang belum pernah dilihat
+# model, jadi turn berikutnya chunk ini dikirim lagi.
+PARTIAL_CHUNK_HEADER = "[S{i}] source={source} page={page} chunk_part={chunk_id} (potongan)"
+# Chunk yang isinya masih ada di session hanya dirujuk lewat baris ini (tanpa isi).
+SEEN_STUB = "[S{i}] source={source} page={page} (isi sama dengan chunk {chunk_id} di pesan sebelumnya)"
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 karakter per token; cukup akurat untuk teks Indonesia di Gemini
+    return max(1, len(text) // 4) if text else 0
+
+
+def _words(text: str) -> List[str]:
+    return WORD_RE.findall((text or "").lower())
+
+
+def _shingles(words: List[str], n: int = 5) -> Set[tuple]:
+    if len(words) < n:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def is_near_duplicate(a: Set[tuple], b: Set[tuple], threshold: float) -> bool:
+    """
+    Containment (bukan Jaccard): chunk overlap dari chunk_by_paragraphs
+    adalah potongan ekor chunk sebelumnya, jadi yang kecil "terkandung" di yang besar.
+    """
+    if not a or not b:
+        return False
+    inter = len(a & b)
+    return inter / min(len(a), len(b)) >= threshold
+
+
+def trim_to_query(text: str, query_terms: Set[str]) -> str:
+    """Ambil kalimat yang memuat term query (urutan asli dipertahankan)."""
+    if not query_terms:
+        return text
+    sentences = [s.strip() for s in SENT_SPLIT_RE.split(text) if s and s.strip()]
+    keep = []
+    for s in sentences:
+        words = set(_words(s))
+        if words & query_terms or any(w.startswith(t) for t in query_terms if len(t) >= 4 for w in words):
+            keep.append(s)
+    return " ".join(keep) if keep else text
+
+
+def _header_tokens(r: dict, template: str) -> int:
+    header = template.format(i="00", source=r.get("source"), page=r.get("page"), chunk_id=r.get("chunk_id"))
+    return estimate_tokens(header + "\n\n")
+
+
+def _same_text(a: str, b: str) -> bool:
+    return a.split() == b.split()
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    limit = max_tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    # Potong di akhir kalimat / baris terakhir kalau bisa
+    pos = max(cut.rfind(". "), cut.rfind("\n"))
+    if pos > limit // 2:
+        cut = cut[:pos + 1]
+    return cut.rstrip() + " ..."
+
+
+def assemble_context(
+    results: List[dict],
+    query: str,
+    token_budget: int,
+    trim: bool = True,
+    dedup_threshold: float = 0.8,
+    seen: Set[str] | None = None,
+) -> List[dict]:
+    """
+    Pilih chunk untuk REFERENSI dalam batas token_budget:
+    1. urutkan berdasarkan skor (rerank_score / score),
+    2. buang chunk yang hampir sama dengan chunk yang sudah dipilih,
+    3. (opsional) potong chunk ke kalimat yang cocok dengan query,
+    4. isi budget secara greedy; chunk terakhir boleh dipotong.
+
+    seen: chunk_id yang isinya masih ada di session. Chunk ini hanya dihitung
+    seukuran SEEN_STUB (isinya tidak dikirim ulang) dan context_text-nya kosong.
+
+    Return list item (dict asli + key "context_text" + key "partial": True kalau
+    context_text bukan teks chunk yang utuh).
+    """
+    seen = seen or set()
+    query_terms = {w for w in _words(query) if w not in STOPWORDS}
+    ranked = sorted(
+        (r for r in results if (r.get("text") or "").strip()),
+        key=lambda r: float(r.get("rerank_score", r.get("score")) or 0.0),
+        reverse=True,
+    )
+
+    picked: List[dict] = []
+    picked_shingles: List[Set[tuple]] = []
+    used = 0
+
+    for r in ranked:
+        text = (r.get("text") or "").strip()
+        sh = _shingles(_words(text))
+        if any(is_near_duplicate(sh, other, dedup_threshold) for other in picked_shingles):
+            continue
+
+        if r.get("chunk_id") and str(r.get("chunk_id")) in seen:
+            cost = _header_tokens(r, SEEN_STUB)
+            if cost > token_budget - used:
+                break
+            item = dict(r)
+            item["context_text"] = ""
+            item["partial"] = False
+            picked.append(item)
+            picked_shingles.append(sh)
+            used += cost
+            continue
+
+        body = trim_to_query(text, query_terms) if trim else text
+        # Header chunk ikut dihitung
+        header = _header_tokens(r, CHUNK_HEADER if _same_text(body, text) else PARTIAL_CHUNK_HEADER)
+        cost = estimate_tokens(body) + header
+        remaining = token_budget - used
+
+        if cost > remaining:
+            header = _header_tokens(r, PARTIAL_CHUNK_HEADER)
+            if remaining - header < MIN_PARTIAL_TOKENS:
+                break
+            body = _truncate_to_tokens(body, remaining - header)
+            cost = estimate_tokens(body) + header
+
+        item = dict(r)
+        item["context_text"] = body
+        item["partial"] = not _same_text(body, text)
+        picked.append(item)
+        picked_shingles.append(sh)
+        used += cost
+
+        if used >= token_budget:
+            break
+
+    return picked
@@ -0,0 +1,131 @@
+import os
+import re
+from typing import Dict, Hashable, List, Optional
+
+from my_agent.cache import TTLCache
+from my_agent.retrieval_tool import STOPWORDS
+
+# State retrieval per session (query + hasil turn terakhir), in-process.
+# Isi session ADK tetap sumber kebenaran untuk chunk yang sudah dilihat model.
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "2000"))
+CONVERSATION_TTL_SEC = float(os.getenv("CONVERSATION_TTL_SEC", "3600"))
+
+# Pesan lanjutan harus pendek (jumlah kata) dan memuat rujukan eksplisit;
+# term isi (selain kata rujukan / pengisi) paling banyak FOLLOWUP_MAX_TERMS.
+FOLLOWUP_MAX_WORDS = int(os.getenv("FOLLOWUP_MAX_WORDS", "6"))
+FOLLOWUP_MAX_TERMS = int(os.getenv("FOLLOWUP_MAX_TERMS", "3"))
+
+WORD_RE = re.compile(r"[\w]+")
+# Header chunk utuh di blok REFERENSI: "[S1] source=... page=... chunk_id=..."
+# (context_builder.CHUNK_HEADER). Chunk yang dipotong memakai "chunk_part=", jadi tidak ikut.
+CHUNK_ID_RE = re.compile(r"(?<!\S)chunk_id=(\S+)")
+
+ORDINALS = {
+    "pertama": 1, "kesatu": 1, "satu": 1,
+    "kedua": 2, "dua": 2,
+    "ketiga": 3, "tiga": 3,
+    "keempat": 4, "empat": 4,
+    "kelima": 5, "lima": 5,
+    "terakhir": -1,
+}
+# Ordinal hanya dihitung sebagai rujukan setelah kata ini: "yang kedua", "nomor 3"
+# ("dua sendok gula" bukan rujukan)
+ORDINAL_MARKERS = {"yang", "yg", "nomor", "no"}
+# Rujukan eksplisit ke turn sebelumnya ("apa itu ..." tidak dihitung)
+REFERRING_WORDS = {"itu", "tersebut", "tsb", "tadi", "sebelumnya", "lanjut", "lanjutkan"}
+FILLER_WORDS = {"kalau", "kalo", "gmn", "gitu", "sih", "nah", "kok", "kenapa", "mana", "berapa"}
+
+
+def _ordinal(words: List[str]) -> Optional[int]:
+    for prev, w in zip([""] + words, words):
+        if prev not in ORDINAL_MARKERS:
+            continue
+        if w in ORDINALS:
+            return ORDINALS[w]
+        if prev in ("nomor", "no") and w.isdigit() and 0 < int(w) <= 10:
+            return int(w)
+    return None
+
+
+def _referring(words: List[str]) -> bool:
+    return any(w in REFERRING_WORDS and not (w == "itu" and prev == "apa") for prev, w in zip([""] + words, words))
+
+
+def seen_chunk_ids(user_texts: List[str]) -> set:
+    """chunk_id yang isinya utuh masih ada di session (dari header [S#] di prompt user sebelumnya)."""
+    seen = set()
+    for text in user_texts:
+        seen.update(CHUNK_ID_RE.findall(text or ""))
+    seen.discard("")
+    return seen
+
+
+def last_user_message(history: list) -> Optional[str]:
+    """Pertanyaan user terakhir dari ChatRequest.history (kalau state in-process kosong)."""
+    for h in reversed(history or []):
+        if getattr(h, "role", None) == "user" and (h.content or "").strip():
+            return h.content.strip()
+    return None
+
+
+class Resolution:
+    def __init__(self, query: str, followup: bool = False, focus: Optional[List[dict]] = None):
+        self.query = query
+        self.followup = followup
+        self.focus = focus or []
+
+
+class ConversationTracker:
+    """
+    Per session: query (yang sudah di-resolve) dan daftar chunk turn terakhir,
+    urut seperti [S1], [S2], ... di prompt. Dipakai untuk menjawab lanjutan
+    seperti "yang kedua gimana?" tanpa retrieval ulang dari nol.
+    """
+
+    def __init__(self, max_sessions: int = CONVERSATION_MAX_SESSIONS, ttl_sec: float = CONVERSATION_TTL_SEC):
+        self._states = TTLCache(max_size=max_sessions, ttl_sec=ttl_sec)
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        return self._states.get(key)
+
+    def remember(self, key: Hashable, query: str, results: List[dict], category: Optional[str]):
+        self._states.set(key, {"query": query, "results": results, "category": category})
+
+    def reset(self, key: Hashable):
+        # TTLCache tidak punya delete; entry kosong = belum ada state
+        self._states.set(key, None)
+
+    def resolve(self, message: str, state: Optional[dict], history: list) -> Resolution:
+        prev_query = state["query"] if state else last_user_message(history)
+        if not prev_query:
+            return Resolution(message)
+
+        words = WORD_RE.findall(message.lower())
+        if not words or len(words) > FOLLOWUP_MAX_WORDS:
+            return Resolution(message)
+
+        ordinal = _ordinal(words)
+        if ordinal is None and not _referring(words):
+            return Resolution(message)
+
+        terms = [
+            w for w in words
+            if w not in STOPWORDS and w not in REFERRING_WORDS and w not in FILLER_WORDS
+            and w not in ORDINAL_MARKERS and w not in ORDINALS
+            and not (ordinal is not None and w.isdigit())
+        ]
+        if len(terms) > FOLLOWUP_MAX_TERMS:
+            return Resolution(message)
+
+        focus = []
+        results = (state or {}).get("results") or []
+        if ordinal is not None and results:
+            idx = ordinal - 1 if ordinal > 0 else len(results) - 1
+            if 0 <= idx < len(results):
+                focus = [results[idx]]
+        # Query retrieval = pertanyaan sebelumnya + term isi pesan ini
+        # ("kedua", "itu", ... tidak ikut supaya tidak mempersempit MATCH)
+        return Resolution(" ".join([prev_query] + terms), followup=True, focus=focus)
+
+    def stats(self) -> Dict[str, float]:
+        return self._states.stats()
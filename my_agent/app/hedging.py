@@ -0,0 +1,101 @@
+import math
+import time
+from collections import deque
+
+
+class LatencyTracker:
+    """Simpan N sampel latency terakhir (detik) untuk menghitung persentil."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        if not self._samples:
+            return None
+        xs = sorted(self._samples)
+        idx = min(len(xs), max(1, math.ceil(p / 100 * len(xs)))) - 1
+        return xs[idx]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class HedgePolicy:
+    """
+    Delay sebelum request cadangan (fallback) dimulai:
+    persentil ke-p dari latency event pertama primary, dijepit di [min_delay, max_delay].
+    Sebelum ada cukup sampel, pakai initial_delay.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        min_delay: float = 2.0,
+        max_delay: float = 20.0,
+        initial_delay: float = 8.0,
+        min_samples: int = 20,
+        window: int = 200,
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.first_event = LatencyTracker(window)
+
+    def delay(self) -> float:
+        if len(self.first_event) < self.min_samples:
+            return self.initial_delay
+        p = self.first_event.percentile(self.percentile) or self.initial_delay
+        return min(self.max_delay, max(self.min_delay, p))
+
+
+class CircuitBreaker:
+    """
+    closed    : semua request ke primary
+    open      : primary dianggap overload, langsung ke fallback selama cooldown_sec
+    half_open : setelah cooldown, 1 request percobaan ke primary;
+                sukses -> closed, gagal -> open lagi
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown_sec: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_sec = cooldown_sec
+
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def allow_primary(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown_sec:
+            self.state = "half_open"
+            return True
+        # open (masih cooldown) atau half_open (percobaan sedang jalan)
+        return False
+
+    def record_success(self):
+        if self.state == "open":
+            # Sukses dari request lama yang mulai sebelum breaker terbuka
+            return
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        # Percobaan half_open selesai tanpa sukses/gagal yang jelas (mis. dibatalkan)
+        if self.state == "half_open":
+            self.state = "open"
+            self.opened_at = time.monotonic()
@@ -1,23 +1,46 @@
+import time
+_IMPORT_T0 = time.perf_counter()
+
 from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import json
+import hashlib
 import traceback
-import time
 import asyncio
+import threading
 import uuid
-from typing import List, Literal, Optional, Dict, Any
+from contextlib import aclosing, asynccontextmanager
+from typing import TYPE_CHECKING, List, Literal, Optional, Dict, Any
 
 from fastapi import FastAPI, Depends, HTTPException, Header
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse, Response
 from pydantic import BaseModel
 
-from google.genai import types
-from google.adk.runners import Runner
-from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from my_agent import metrics
+from my_agent.app.answer_cache import answer_cache_key, make_answer_cache
+from my_agent.app.context_builder import (
+    CHUNK_HEADER,
+    PARTIAL_CHUNK_HEADER,
+    SEEN_STUB,
+    assemble_context,
+    estimate_tokens,
+)
+from my_agent.app.conversation import ConversationTracker, seen_chunk_ids
+from my_agent.app.hedging import CircuitBreaker, HedgePolicy
+from my_agent.app.single_flight import SingleFlight
+from my_agent.rerank import get_reranker
+from my_agent.dense_index import get_dense_index
+from my_agent.intent_router import get_router
+from my_agent.retrieval_engine import get_engine
+from my_agent.retrieval_tool import SearchBatch, asearch_report, search_cache_stats
 
-from my_agent.agent import root_agent, make_agent
-from my_agent.retrieval_tool import search_report
+# google.genai / google.adk / my_agent.agent (~1 detik) baru di-import saat
+# runtime dibuat (init_runtime) atau di dalam fungsi yang memakainya.
+if TYPE_CHECKING:
+    from google.genai import types
+    from google.adk.runners import Runner
 
 # =========================
 # Config
@@ -40,6 +63,21 @@ PROMPT_LEN_USE_FALLBACK = int(os.getenv("PROMPT_LEN_USE_FALLBACK", "9000"))
 # Timeout untuk panggilan model (Python-side). Pastikan layer Laravel/proxy juga diset cukup.
 MODEL_TIMEOUT_SEC = int(os.getenv("MODEL_TIMEOUT_SEC", "170"))
 
+# Hedging: kalau primary belum mengirim event pertama setelah delay ini,
+# fallback_runner dijalankan paralel dan yang selesai duluan dipakai.
+# Delay = persentil latency event pertama primary, dijepit [MIN, MAX].
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY_SEC = float(os.getenv("HEDGE_MIN_DELAY_SEC", "2"))
+HEDGE_MAX_DELAY_SEC = float(os.getenv("HEDGE_MAX_DELAY_SEC", "20"))
+HEDGE_INITIAL_DELAY_SEC = float(os.getenv("HEDGE_INITIAL_DELAY_SEC", "8"))
+
+# Circuit breaker: setelah N kegagalan primary berturut-turut, semua request langsung
+# ke fallback selama cooldown. Gagal = error (overload dll.) atau tidak ada event pertama
+# dalam HEDGE_MAX_DELAY_SEC; primary yang sekadar kalah cepat dari hedge tidak dihitung.
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN_SEC = float(os.getenv("BREAKER_COOLDOWN_SEC", "30"))
+
 # Retrieval controls
 RECIPE_K_BASE = int(os.getenv("RECIPE_K_BASE", "5"))
 RECIPE_K_BOOST = int(os.getenv("RECIPE_K_BOOST", "10"))
@@ -47,34 +85,239 @@ RECIPE_TOP_N = int(os.getenv("RECIPE_TOP_N", "8"))
 
 GENERAL_K = int(os.getenv("GENERAL_K", "6"))  # dulu 10
 
+# Budget token untuk blok REFERENSI. Resep butuh langkah lengkap, jadi budget
+# lebih besar dan chunk tidak dipotong per kalimat.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+RECIPE_CONTEXT_TOKEN_BUDGET = int(os.getenv("RECIPE_CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+
+# Answer cache (di depan panggilan model)
+# backend: memory | sqlite | off
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB", "data/answer_cache.db")
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+ANSWER_CACHE_MAX_AGE_SEC = float(os.getenv("ANSWER_CACHE_MAX_AGE_SEC", "86400"))
+
+# Single-flight: request identik (pertanyaan ternormalisasi + chunk_id + prompt sama) yang
+# datang bersamaan menunggu 1 panggilan model yang sama. Sama seperti answer cache,
+# tidak dipakai untuk pesan lanjutan (jawabannya bergantung pada percakapan); session
+# yang sudah punya history hanya digabung dengan request dari session yang sama.
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1"
+
+# /chat/batch: jumlah pertanyaan maksimum per request, dan panggilan model
+# yang boleh jalan bersamaan per batch (retrieval tidak dibatasi: 1 pass).
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_MODEL_CONCURRENCY = int(os.getenv("BATCH_MODEL_CONCURRENCY", "4"))
+
+# Batas memori session ADK (InMemory). Tiap turn menyimpan prompt + REFERENSI,
+# jadi tanpa batas ini memori VM terus naik.
+# SESSION_BACKEND=sqlite: session disimpan di SESSION_DB (tahan restart); memori jadi cache.
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB = os.getenv("SESSION_DB", "data/chat.db")
+SESSION_MAX = int(os.getenv("SESSION_MAX", "2000"))
+SESSION_IDLE_TTL_SEC = float(os.getenv("SESSION_IDLE_TTL_SEC", "3600"))
+SESSION_MAX_EVENTS = int(os.getenv("SESSION_MAX_EVENTS", "40"))
+SESSION_MAX_TOKENS = int(os.getenv("SESSION_MAX_TOKENS", "24000"))
+
+# /metrics Prometheus. Di port app (publik) butuh x-app-token seperti endpoint lain.
+# METRICS_PORT > 0: /metrics juga dilayani tanpa token di port internal ini
+# (untuk scraper, mis. [metrics] di fly.toml); port ini jangan diekspos ke publik.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+
+# Startup:
+# - lazy  : proses langsung menerima request (/healthz); import ADK, pembuatan agent
+#           dan warm-up jalan di background. /readyz 503 sampai selesai.
+# - eager : startup menunggu semua itu selesai dulu.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy").lower()
+# Query contoh untuk warm-up retrieval (dipisah "|"). Default diambil dari topik korpus
+# pala (jalur resep + beberapa kategori umum), supaya yang di-warm jalur yang ada hasilnya.
+WARMUP_QUERIES = [
+    q.strip()
+    for q in os.getenv(
+        "WARMUP_QUERIES",
+        "resep sirup pala|cara membuat manisan pala|harga jual pala|strategi promosi produk pala|kemasan produk pala",
+    ).split("|")
+    if q.strip()
+]
+
+TIMEOUT_ANSWER = "Pertanyaan membutuhkan analisis lebih dalam. Mohon tunggu atau sederhanakan pertanyaan."
+
+# =========================
+# Runtime (session service, agent, runner)
+# =========================
+# Dibuat di lifespan (per proses worker), bukan saat import. init_runtime()
+# idempotent: nilai yang sudah diisi (mis. stub runner di bench/) tidak ditimpa,
+# dan dipanggil juga di awal request kalau lifespan tidak jalan / belum selesai.
+adk_session_service = None
+root_agent = None
+adk_runner: "Runner | None" = None
+fallback_agent = None
+fallback_runner: "Runner | None" = None
+
+_runtime_lock = threading.Lock()
+
+IMPORT_MS = None  # diisi di akhir modul
+
+# Status startup untuk /healthz dan /readyz
+warmup: Dict[str, Any] = {
+    "ready": False,
+    "agents": False,
+    "runtime_ms": None,
+    "retrieval": False,
+    "queries": None,
+    "error": None,
+}
+
+def _runtime_ready() -> bool:
+    return None not in (adk_session_service, root_agent, adk_runner, fallback_runner)
+
+def init_runtime():
+    global adk_session_service, root_agent, adk_runner, fallback_agent, fallback_runner
+    if _runtime_ready():
+        return
+    with _runtime_lock:
+        if _runtime_ready():
+            return
+        t0 = time.perf_counter()
+        from google.adk.runners import Runner
+        from my_agent.agent import make_agent, root_agent as primary_agent
+        from my_agent.app.session_service import make_session_service
+
+        if root_agent is None:
+            root_agent = primary_agent
+        if adk_session_service is None:
+            adk_session_service = make_session_service(
+                SESSION_BACKEND,
+                SESSION_DB,
+                max_sessions=SESSION_MAX,
+                idle_ttl_sec=SESSION_IDLE_TTL_SEC,
+                max_events=SESSION_MAX_EVENTS,
+                max_tokens=SESSION_MAX_TOKENS,
+            )
+        if adk_runner is None:
+            adk_runner = Runner(
+                app_name=ADK_APP_NAME,
+                agent=root_agent,
+                session_service=adk_session_service,
+            )
+        if fallback_runner is None:
+            fallback_agent = make_agent(FALLBACK_MODEL)
+            fallback_runner = Runner(
+                app_name=ADK_APP_NAME,
+                agent=fallback_agent,
+                session_service=adk_session_service,
+            )
+        warmup["agents"] = True
+        warmup["runtime_ms"] = int((time.perf_counter() - t0) * 1000)
+
+async def ensure_runtime():
+    """Versi async init_runtime: import ADK yang berat tidak memblok event loop."""
+    if not _runtime_ready():
+        await asyncio.to_thread(init_runtime)
+
+def _warm_retrieval() -> dict:
+    t0 = time.perf_counter()
+    engine = get_engine()
+    read = engine.warm()
+    dense = get_dense_index()
+    return {
+        "bytes_read": read,
+        "dense": dense is not None,
+        "ms": int((time.perf_counter() - t0) * 1000),
+    }
+
+async def _warm_queries() -> dict:
+    # Jalur penuh retrieval + context (regex, prepared statement, halaman FTS yang sering dipakai)
+    t0 = time.perf_counter()
+    for q in WARMUP_QUERIES:
+        is_recipe, hits = await _retrieve(q)
+        _build_context(hits, q, is_recipe)
+    return {"n": len(WARMUP_QUERIES), "ms": int((time.perf_counter() - t0) * 1000)}
+
+async def _warm_up():
+    try:
+        await ensure_runtime()
+        warmup["retrieval"] = await asyncio.to_thread(_warm_retrieval)
+        warmup["queries"] = await _warm_queries()
+        warmup["ready"] = True
+        print(f"[INFO] warm-up done (pid={os.getpid()}, import_ms={IMPORT_MS}): {warmup}")
+    except Exception as e:
+        warmup["error"] = str(e)
+        print(f"[WARN] warm-up failed: {e}")
+
+async def _serve_internal_metrics():
+    """
+    Server kecil untuk /metrics di METRICS_PORT. Dengan >1 worker hanya worker
+    yang pertama bind yang melayani (counter per proses); worker lain cukup skip.
+    """
+    import socket
+    import uvicorn
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind((METRICS_HOST, METRICS_PORT))
+    except OSError as e:
+        sock.close()
+        print(f"[INFO] metrics port {METRICS_PORT} not bound in pid={os.getpid()}: {e}")
+        return
+    server = uvicorn.Server(uvicorn.Config(metrics_app, log_level="warning", lifespan="off"))
+    # Sinyal shutdown tetap ditangani server utama
+    server.install_signal_handlers = lambda: None
+    try:
+        await server.serve(sockets=[sock])
+    finally:
+        sock.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    task = None
+    metrics_task = asyncio.create_task(_serve_internal_metrics()) if METRICS_PORT > 0 else None
+    if STARTUP_MODE == "eager":
+        await _warm_up()
+    else:
+        # /readyz baru 200 setelah selesai
+        task = asyncio.create_task(_warm_up())
+    yield
+    for t in (task, metrics_task):
+        if t is not None:
+            t.cancel()
+
 # =========================
 # FastAPI
 # =========================
-app = FastAPI(title="Tanya Dewi Agent API (Laravel Integrated)")
-
-# ADK runner setup
-adk_session_service = InMemorySessionService()
-adk_runner = Runner(
-    app_name=ADK_APP_NAME,
-    agent=root_agent,
-    session_service=adk_session_service,
+app = FastAPI(title="Tanya Dewi Agent API (Laravel Integrated)", lifespan=lifespan)
+
+reranker = get_reranker()
+intent_router = get_router()
+
+hedge_policy = HedgePolicy(
+    percentile=HEDGE_PERCENTILE,
+    min_delay=HEDGE_MIN_DELAY_SEC,
+    max_delay=HEDGE_MAX_DELAY_SEC,
+    initial_delay=HEDGE_INITIAL_DELAY_SEC,
 )
+inflight = SingleFlight()
+conversations = ConversationTracker()
+breaker = CircuitBreaker(failure_threshold=BREAKER_FAILURES, cooldown_sec=BREAKER_COOLDOWN_SEC)
 
-fallback_agent = make_agent(FALLBACK_MODEL)
-fallback_runner = Runner(
-    app_name=ADK_APP_NAME,
-    agent=fallback_agent,
-    session_service=adk_session_service,
+answer_cache = make_answer_cache(
+    ANSWER_CACHE_BACKEND,
+    db_path=ANSWER_CACHE_DB,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    max_age_sec=ANSWER_CACHE_MAX_AGE_SEC,
 )
 
 # =========================
 # Auth: server-to-server token
 # =========================
 def verify_app_token(x_app_token: Optional[str] = Header(default=None)):
-    if not APP_TOKEN:
-        raise HTTPException(status_code=500, detail="APP_TOKEN not configured on agent server")
-    if x_app_token != APP_TOKEN:
-        raise HTTPException(status_code=401, detail="Unauthorized")
+    with metrics.timer("auth"):
+        if not APP_TOKEN:
+            raise HTTPException(status_code=500, detail="APP_TOKEN not configured on agent server")
+        if x_app_token != APP_TOKEN:
+            raise HTTPException(status_code=401, detail="Unauthorized")
     return True
 
 def _normalize_session_id(session_id: Optional[str]) -> str:
@@ -107,30 +350,57 @@ class ChatResponse(BaseModel):
     citations: List[Citation] = []
     meta: Dict[str, Any] = {}
 
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    message: str
+
+class BatchRequest(BaseModel):
+    user_id: int
+    items: List[BatchItem]
+    # True: hanya retrieval + citations (tanpa model), mis. untuk evaluasi retrieval
+    retrieval_only: bool = False
+
 # =========================
 # Helpers
 # =========================
-def _build_context(hits: dict) -> tuple[str, List[Citation]]:
+def _build_context(hits: dict, query: str, is_recipe: bool, seen: set | None = None) -> tuple[str, List[Citation]]:
+    """
+    seen: chunk_id yang isinya masih ada di session ADK. Chunk ini tetap jadi
+    citation, tapi di REFERENSI hanya dirujuk (tanpa isi) supaya tidak dikirim ulang.
+    """
+    seen = seen or set()
     ctx_parts: List[str] = []
     cites: List[Citation] = []
 
-    for i, r in enumerate(hits.get("results", []), start=1):
+    picked = assemble_context(
+        hits.get("results", []),
+        query,
+        token_budget=RECIPE_CONTEXT_TOKEN_BUDGET if is_recipe else CONTEXT_TOKEN_BUDGET,
+        trim=not is_recipe,
+        dedup_threshold=CONTEXT_DEDUP_THRESHOLD,
+        seen=seen,
+    )
+
+    for i, r in enumerate(picked, start=1):
         text = (r.get("text") or "").strip()
         source = r.get("source") or ""
         page = int(r.get("page") or 0)
         chunk_id = str(r.get("chunk_id") or "")
 
-        if not text:
-            continue
-
-        ctx_parts.append(f"[S{i}] source={source} page={page} chunk_id={chunk_id}\n{text}")
+        if chunk_id and chunk_id in seen:
+            ctx_parts.append(SEEN_STUB.format(i=i, source=source, page=page, chunk_id=chunk_id))
+        else:
+            # Chunk yang dipotong tidak memakai header chunk_id=, jadi turn berikutnya dikirim lagi
+            header = PARTIAL_CHUNK_HEADER if r.get("partial") else CHUNK_HEADER
+            header = header.format(i=i, source=source, page=page, chunk_id=chunk_id)
+            ctx_parts.append(f"{header}\n{r['context_text']}")
 
         cites.append(
             Citation(
                 source=source,
                 page=page,
                 chunk_id=chunk_id,
-                score=float(r.get("score") or 0.0),  # kalau tool kamu belum ada score, tetap aman
+                score=float(r.get("score") or 0.0),
                 excerpt=text[:240],
             )
         )
@@ -138,26 +408,44 @@ def _build_context(hits: dict) -> tuple[str, List[Citation]]:
     ctx = "\n\n".join(ctx_parts)
     return ctx, cites
 
-def _content_to_text(content: types.Content | None) -> str:
+def _parts_text(content: "types.Content | None") -> str:
     if not content or not content.parts:
         return ""
     texts = []
     for part in content.parts:
         if part.text:
             texts.append(part.text)
-    return "".join(texts).strip()
+    return "".join(texts)
+
+def _content_to_text(content: "types.Content | None") -> str:
+    return _parts_text(content).strip()
 
 async def _ensure_adk_session(session_id: str, user_id: int):
+    from my_agent.app.session_service import SessionOwnershipError
+
     try:
-        await adk_session_service.create_session(
-            app_name=ADK_APP_NAME,
-            user_id=str(user_id),
-            session_id=session_id,
-        )
+        with metrics.timer("session_create"):
+            await adk_session_service.create_session(
+                app_name=ADK_APP_NAME,
+                user_id=str(user_id),
+                session_id=session_id,
+            )
+    except SessionOwnershipError:
+        # session_id milik user lain: jangan sampai turn user ini ikut tertulis di sana
+        raise
     except Exception as e:
         # create_session mungkin fail kalau session sudah ada; itu aman
         print(f"[WARN] create_session failed: {e}")
 
+async def _claim_session(session_id: str, user_id: int):
+    """Buat / pakai session untuk user ini; 403 kalau session_id sudah dipakai user lain."""
+    from my_agent.app.session_service import SessionOwnershipError
+
+    try:
+        await _ensure_adk_session(session_id, user_id)
+    except SessionOwnershipError:
+        raise HTTPException(status_code=403, detail="Session belongs to another user")
+
 def _is_overloaded_error(exc: Exception) -> bool:
     text = str(exc).lower()
     if "overload" in text or "unavailable" in text or "503" in text:
@@ -170,81 +458,312 @@ def _is_overloaded_error(exc: Exception) -> bool:
         return True
     return False
 
-async def _run_with_runner(runner: Runner, message: str, session_id: str, user_id: int) -> str:
+def _runner_label(runner: "Runner") -> str:
+    return "fallback" if runner is fallback_runner else "primary"
+
+def _runner_model(runner: "Runner") -> str:
+    return FALLBACK_MODEL if runner is fallback_runner else str(root_agent.model)
+
+def _served_by(served: Dict[str, Any] | None, runner: "Runner"):
+    # served: diisi pemanggil untuk tahu model mana yang menghasilkan jawaban
+    if served is not None:
+        served["model"] = _runner_model(runner)
+
+async def _run_with_runner(
+    runner: "Runner",
+    message: str,
+    session_id: str,
+    user_id: int,
+    first_event: asyncio.Event | None = None,
+) -> str:
+    from google.genai import types
+
     await _ensure_adk_session(session_id, user_id)
 
     new_message = types.Content(role="user", parts=[types.Part(text=message)])
 
     last_text = ""
-    async for event in runner.run_async(
+    t0 = time.perf_counter()
+    with metrics.timer("model_call", runner=_runner_label(runner)):
+        async for event in runner.run_async(
+            user_id=str(user_id),
+            session_id=session_id,
+            new_message=new_message,
+        ):
+            if first_event is not None and not first_event.is_set():
+                first_event.set()
+                if runner is adk_runner:
+                    hedge_policy.first_event.observe(time.perf_counter() - t0)
+
+            text = _content_to_text(event.content)
+            if text:
+                last_text = text
+
+            if event.is_final_response():
+                break
+
+    return last_text.strip()
+
+class HedgeFailed(Exception):
+    """Primary dan hedge (fallback) sama-sama gagal; jangan retry fallback lagi."""
+
+async def _cancel(*tasks: asyncio.Task):
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _hedged_call(message: str, session_id: str, user_id: int, served: Dict[str, Any] | None = None) -> str:
+    """
+    Jalankan primary; kalau event pertamanya belum datang setelah hedge_policy.delay(),
+    jalankan fallback_runner paralel di session salinan. Yang selesai duluan menang,
+    yang kalah dibatalkan. Kalau fallback menang, isi session salinan menggantikan
+    session asli (turn primary yang setengah jalan dibuang).
+    """
+    first = asyncio.Event()
+    t0 = time.perf_counter()
+    primary = asyncio.create_task(_run_with_runner(adk_runner, message, session_id, user_id, first_event=first))
+
+    delay = hedge_policy.delay()
+    if HEDGE_ENABLED:
+        waiter = asyncio.create_task(first.wait())
+        try:
+            await asyncio.wait({primary, waiter}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # asyncio.wait tidak ikut membatalkan task-nya
+            await _cancel(primary)
+            raise
+        finally:
+            await _cancel(waiter)
+
+    if not HEDGE_ENABLED or primary.done() or first.is_set():
+        answer = await primary
+        breaker.record_success()
+        _served_by(served, adk_runner)
+        return answer
+
+    # ===== Hedge =====
+    metrics.inc("tanya_dewi_hedge_total", outcome="started")
+    hedge_sid = f"{session_id}::hedge-{uuid.uuid4().hex[:8]}"
+    await adk_session_service.fork_session(
+        app_name=ADK_APP_NAME,
         user_id=str(user_id),
         session_id=session_id,
-        new_message=new_message,
-    ):
-        text = _content_to_text(event.content)
-        if text:
-            last_text = text
+        new_session_id=hedge_sid,
+        pending_message=message,
+    )
+    hedge = asyncio.create_task(_run_with_runner(fallback_runner, message, hedge_sid, user_id))
+
+    pending = {primary, hedge}
+    winner = None
+    errors: Dict[str, BaseException] = {}
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    winner = winner or t
+                else:
+                    errors["primary" if t is primary else "fallback"] = t.exception()
+    finally:
+        await _cancel(*pending)
+        if winner is not hedge:
+            await adk_session_service.delete_session(
+                app_name=ADK_APP_NAME, user_id=str(user_id), session_id=hedge_sid
+            )
 
-        if event.is_final_response():
-            break
+    stalled = False
+    if not first.is_set():
+        # Sampel tersensor: event pertama primary > delay (batas bawah saja)
+        hedge_policy.first_event.observe(delay)
+        stalled = time.perf_counter() - t0 >= HEDGE_MAX_DELAY_SEC
 
-    return last_text.strip()
+    if winner is primary:
+        metrics.inc("tanya_dewi_hedge_total", outcome="primary_won")
+        breaker.record_success()
+        _served_by(served, adk_runner)
+        return primary.result()
 
-async def call_agent_async(message: str, session_id: str, user_id: int) -> str:
+    if winner is hedge:
+        print(f"[WARN] primary slow, hedge won with fallback model: {FALLBACK_MODEL}")
+        metrics.inc("tanya_dewi_hedge_total", outcome="fallback_won")
+        metrics.inc("tanya_dewi_fallback_switch_total", reason="hedge")
+        await adk_session_service.adopt_session(
+            app_name=ADK_APP_NAME, user_id=str(user_id), session_id=session_id, from_session_id=hedge_sid
+        )
+        # Kalah cepat saja (primary lambat tapi sehat) cukup masuk latency tracker;
+        # circuit breaker hanya menghitung error dan primary yang macet (timeout).
+        if "primary" in errors or stalled:
+            breaker.record_failure()
+        _served_by(served, fallback_runner)
+        return hedge.result()
+
+    metrics.inc("tanya_dewi_hedge_total", outcome="both_failed")
+    raise HedgeFailed(f"primary and fallback model failed: {errors}") from errors.get("fallback")
+
+async def call_agent_async(
+    message: str, session_id: str, user_id: int, served: Dict[str, Any] | None = None
+) -> str:
     """
     Strategy:
     1) Kalau prompt panjang banget -> pakai fallback_runner langsung (biasanya lebih kuat/stabil).
-    2) Normal -> pakai adk_runner.
-    3) Kalau overload 503 -> switch ke fallback_runner.
-    4) Kalau session missing -> recreate session and retry.
+    2) Kalau circuit breaker terbuka (primary sedang overload) -> langsung fallback_runner.
+    3) Normal -> pakai adk_runner, dengan hedge ke fallback_runner kalau primary lambat.
+    4) Kalau overload 503 -> switch ke fallback_runner.
+    5) Kalau session missing -> recreate session and retry.
+
+    served: dict opsional; served["model"] diisi nama model yang menghasilkan jawaban
+    (dipakai sebagai key answer cache).
     """
     # Heuristic: prompt kepanjangan => langsung fallback
     if len(message) >= PROMPT_LEN_USE_FALLBACK:
-        return await _run_with_runner(fallback_runner, message, session_id, user_id)
+        metrics.inc("tanya_dewi_fallback_switch_total", reason="long_prompt")
+        answer = await _run_with_runner(fallback_runner, message, session_id, user_id)
+        _served_by(served, fallback_runner)
+        return answer
+
+    if not breaker.allow_primary():
+        metrics.inc("tanya_dewi_fallback_switch_total", reason="circuit_open")
+        answer = await _run_with_runner(fallback_runner, message, session_id, user_id)
+        _served_by(served, fallback_runner)
+        return answer
+    # Request ini percobaan half_open: kalau selesai tanpa sukses/gagal yang jelas
+    # (timeout, dibatalkan, error lain), breaker dibuka lagi di finally.
+    trial = breaker.state == "half_open"
 
     try:
-        return await _run_with_runner(adk_runner, message, session_id, user_id)
+        return await _hedged_call(message, session_id, user_id, served)
 
     except ValueError as e:
-        if "Session not found" in str(e):
-            print(f"[WARN] {e}. Re-creating session and retrying: {session_id}")
-            await _ensure_adk_session(session_id, user_id)
-            return await _run_with_runner(adk_runner, message, session_id, user_id)
+        if "Session not found" not in str(e):
+            raise
+        print(f"[WARN] {e}. Re-creating session and retrying: {session_id}")
+        await _ensure_adk_session(session_id, user_id)
+        try:
+            answer = await _run_with_runner(adk_runner, message, session_id, user_id)
+        except Exception as retry_exc:
+            if _is_overloaded_error(retry_exc):
+                breaker.record_failure()
+            raise
+        breaker.record_success()
+        _served_by(served, adk_runner)
+        return answer
+
+    except HedgeFailed:
+        breaker.record_failure()
         raise
 
     except Exception as e:
         if not _is_overloaded_error(e):
             raise
+        breaker.record_failure()
         print(f"[WARN] model overload, switching to fallback model: {FALLBACK_MODEL}")
-        return await _run_with_runner(fallback_runner, message, session_id, user_id)
+        metrics.inc("tanya_dewi_fallback_switch_total", reason="overload")
+        answer = await _run_with_runner(fallback_runner, message, session_id, user_id)
+        _served_by(served, fallback_runner)
+        return answer
 
-# =========================
-# Main endpoint (called by Laravel)
-# =========================
-@app.post("/chat", response_model=ChatResponse, dependencies=[Depends(verify_app_token)])
-async def chat(req: ChatRequest):
-    sid = _normalize_session_id(req.session_id)
-    t0 = time.time()
+    finally:
+        # CancelledError (MODEL_TIMEOUT_SEC habis di /chat) juga lewat sini
+        if trial:
+            breaker.release_trial()
 
-    msg = (req.message or "").strip()
-    q = msg.lower()
+async def _stream_with_runner(runner: "Runner", message: str, session_id: str, user_id: int):
+    """
+    Sama seperti _run_with_runner, tapi yield potongan teks (delta) begitu event
+    parsial dari model datang. Kalau model tidak mengirim event parsial,
+    teks final dikirim sekaligus di akhir.
+    """
+    from google.adk.agents.run_config import RunConfig, StreamingMode
+    from google.genai import types
 
-    is_recipe = any(w in q for w in [
-        "resep", "alat", "bahan", "takaran", "langkah", "cara", "proses",
-        "berapa gram", "berapa gr", "berapa ml", "sdm", "sdt", "kg", "gr", "ml",
-        "rendam", "rebus", "masak", "kukus", "goreng", "oven", "kulkas", "hari",
-        "soap", "handsoap", "hand soap", "sabun", "sabun tangan", "sabun cair", "hand wash", "handwash",
-    ])
+    await _ensure_adk_session(session_id, user_id)
+
+    new_message = types.Content(role="user", parts=[types.Part(text=message)])
+
+    streamed = False
+    with metrics.timer("model_call", runner=_runner_label(runner), mode="stream"):
+        async for event in runner.run_async(
+            user_id=str(user_id),
+            session_id=session_id,
+            new_message=new_message,
+            run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+        ):
+            if event.partial:
+                text = _parts_text(event.content)
+                if text:
+                    streamed = True
+                    yield text
+                continue
+
+            if event.is_final_response():
+                # Event final berisi teks lengkap (gabungan semua delta)
+                if not streamed:
+                    final = _content_to_text(event.content)
+                    if final:
+                        yield final
+                break
+
+async def stream_agent_async(
+    message: str, session_id: str, user_id: int, served: Dict[str, Any] | None = None
+):
+    """
+    Versi streaming dari call_agent_async. Fallback ke fallback_runner hanya
+    mungkin sebelum token pertama terkirim (setelah itu teks sudah di client),
+    jadi di sini tidak ada hedging; circuit breaker tetap dipakai.
+    """
+    runner = adk_runner
+    if len(message) >= PROMPT_LEN_USE_FALLBACK:
+        runner = fallback_runner
+        metrics.inc("tanya_dewi_fallback_switch_total", reason="long_prompt")
+    elif not breaker.allow_primary():
+        runner = fallback_runner
+        metrics.inc("tanya_dewi_fallback_switch_total", reason="circuit_open")
+    trial = runner is adk_runner and breaker.state == "half_open"
+    started = False
+    try:
+        async for delta in _stream_with_runner(runner, message, session_id, user_id):
+            started = True
+            yield delta
+        if runner is adk_runner:
+            breaker.record_success()
+        _served_by(served, runner)
+    except Exception as e:
+        if started or runner is fallback_runner or not _is_overloaded_error(e):
+            raise
+        breaker.record_failure()
+        print(f"[WARN] model overload, switching to fallback model: {FALLBACK_MODEL}")
+        metrics.inc("tanya_dewi_fallback_switch_total", reason="overload")
+        async for delta in _stream_with_runner(fallback_runner, message, session_id, user_id):
+            yield delta
+        _served_by(served, fallback_runner)
+    finally:
+        # Timeout asyncio.timeout / client putus (CancelledError, GeneratorExit) tidak
+        # masuk except Exception; percobaan half_open tetap harus dilepas.
+        if trial:
+            breaker.release_trial()
+
+# =========================
+# Retrieval + prompt (dipakai /chat dan /chat/stream)
+# =========================
+async def _retrieve(msg: str, search=None) -> tuple[bool, dict]:
+    """search: pengganti asearch_report (mis. SearchBatch di /chat/batch)."""
+    search = search or asearch_report
+    # Generasi knowledge.db yang dipakai turn ini (bagian dari key answer cache)
+    generation = get_engine().generation
+    # Intent router menentukan kategori; kalau yakin, pencarian langsung dibatasi
+    # ke kategori itu (filter category di SQL, bukan scan substring seperti dulu).
+    intent = intent_router.route(msg)
+    metrics.inc("tanya_dewi_intent_total", category=intent.category or "none")
+    is_recipe = intent.is_recipe
 
-    # =========================
-    # 1) Retrieval
-    # =========================
     if is_recipe:
         base_q = msg
         boost_q = f'({base_q}) AND (alat OR bahan OR takaran OR langkah OR "langkah-langkah" OR cara OR proses OR "alat" NEAR "bahan")'
 
-        hits1 = search_report(base_q, k=RECIPE_K_BASE, source_like="%Resep%")
-        hits2 = search_report(boost_q, k=RECIPE_K_BOOST, source_like="%Resep%")
+        hits1, hits2 = await asyncio.gather(
+            search(base_q, k=RECIPE_K_BASE, category=intent.category),
+            search(boost_q, k=RECIPE_K_BOOST, category=intent.category),
+        )
 
         merged, seen = [], set()
         for r in (hits1.get("results", []) + hits2.get("results", [])):
@@ -254,24 +773,191 @@ async def chat(req: ChatRequest):
             seen.add(key)
             merged.append(r)
 
-        def _recipe_boost(item: dict) -> int:
-            t = (item.get("text") or "").lower()
-            s = 0
-            if "alat & bahan" in t or "alat dan bahan" in t:
-                s += 5
-            if "langkah" in t:
-                s += 5
-            return s
+        # TOP-N yang dikirim ke model harus kecil (biar cepat & fokus).
+        # Reranker: bm25 + boost bagian resep + prior kategori, dipilih via heap top-N.
+        hits = {"query": base_q, "results": reranker(merged, RECIPE_TOP_N, True)}
+    else:
+        hits = await search(msg, k=GENERAL_K, category=intent.category)
+        if intent.category and not hits.get("results"):
+            # Kategori salah tebak / belum ada dokumennya: ulangi tanpa filter
+            hits = await search(msg, k=GENERAL_K)
+        hits["results"] = reranker(hits.get("results", []), GENERAL_K, False)
+
+    hits["intent"] = intent.category
+    hits["generation"] = generation
+    return is_recipe, hits
 
-        merged.sort(key=_recipe_boost, reverse=True)
+RECIPE_PREAMBLE = (
+    "Gunakan REFERENSI untuk menjawab dan ekstrak resep.\n"
+    "WAJIB patuh referensi. Jangan menambah info di luar referensi.\n"
+    "Tuliskan semua langkah yang ada di referensi tanpa mengurangi atau menambahkan.\n"
+    "Gunakan format berikut:\n"
+    "Nama Resep:\n"
+    "Alat dan Bahan:\n"
+    "Langkah-langkah:\n\n"
+)
+GENERAL_PREAMBLE = (
+    "Gunakan REFERENSI untuk menjawab pertanyaan user secara spesifik dan praktis.\n"
+    "WAJIB patuh referensi. Jangan menambah info di luar referensi.\n"
+    "Gunakan teks biasa tanpa simbol markdown seperti #, *, atau -.\n"
+    "Jawab dengan ringkas namun tetap lengkap sesuai referensi.\n"
+    "Jika referensi tidak cukup, tulis 'tidak ada di potongan referensi' lalu berhenti.\n"
+    "Jika pertanyaan meminta langkah atau prosedur, susun secara berurutan menggunakan angka.\n"
+    "Jika pertanyaan meminta strategi atau penjelasan, susun dalam paragraf yang jelas.\n\n"
+)
+# Turn berikutnya di session yang sama: aturan lengkap masih ada di history
+LATER_TURN_NOTE = "Ikuti aturan jawaban sebelumnya. Referensi di pesan sebelumnya tetap berlaku.\n\n"
 
-        # TOP-N yang dikirim ke model harus kecil (biar cepat & fokus)
-        hits = {"query": base_q, "results": merged[:RECIPE_TOP_N]}
-        context, citations = _build_context(hits)
+def _preamble(is_recipe: bool) -> str:
+    return RECIPE_PREAMBLE if is_recipe else GENERAL_PREAMBLE
 
-    else:
-        hits = search_report(msg, k=GENERAL_K)
-        context, citations = _build_context(hits)
+def _build_prompt(msg: str, is_recipe: bool, context: str, preamble: bool = True) -> str:
+    return (
+        (_preamble(is_recipe) if preamble else LATER_TURN_NOTE)
+        + "=== REFERENSI ===\n"
+        f"{context}\n"
+        "=== END REFERENSI ===\n\n"
+        f"Pertanyaan user: {msg}"
+    )
+
+def _routed_model(prompt: str) -> str:
+    """Model yang (tanpa hedge / overload) akan menjawab prompt ini; untuk lookup answer cache."""
+    if len(prompt) >= PROMPT_LEN_USE_FALLBACK or breaker.state != "closed":
+        return FALLBACK_MODEL
+    return str(root_agent.model)
+
+def _answer_key(msg: str, is_recipe: bool, citations: List[Citation], hits: dict, model: str) -> str:
+    return answer_cache_key(msg, is_recipe, [c.chunk_id for c in citations], model, hits.get("generation"))
+
+def _flight_key(
+    msg: str, is_recipe: bool, citations: List[Citation], hits: dict, prompt: str, scope: str | None = None
+) -> str:
+    # Sidik prompt: preamble / LATER_TURN_NOTE dan chunk yang hanya dirujuk
+    # bergantung pada session, jadi prompt berbeda tidak boleh berbagi jawaban.
+    # scope: session yang sudah punya history; model juga membaca turn sebelumnya,
+    # jadi prompt yang sama pun hanya boleh berbagi jawaban di session itu sendiri.
+    fingerprint = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+    key = f"{_answer_key(msg, is_recipe, citations, hits, _routed_model(prompt))}:{fingerprint}"
+    return f"{key}:{scope}" if scope else key
+
+def _answer_cache_key(msg: str, is_recipe: bool, citations: List[Citation], hits: dict, model: str) -> str | None:
+    if answer_cache is None:
+        return None
+    return _answer_key(msg, is_recipe, citations, hits, model)
+
+async def _append_turn(session_id: str, user_id: int, prompt: str, answer: str):
+    """
+    Tulis turn (prompt + jawaban) ke session tanpa memanggil model.
+    Dipakai request yang ikut menunggu hasil single-flight dan request yang
+    dijawab dari answer cache, supaya history session-nya sendiri tetap lengkap
+    (pesan lanjutan berikutnya merujuk jawaban ini).
+    """
+    from google.adk.events.event import Event
+    from google.genai import types
+
+    await _ensure_adk_session(session_id, user_id)
+    session = await adk_session_service.get_session(
+        app_name=ADK_APP_NAME, user_id=str(user_id), session_id=session_id
+    )
+    if session is None:
+        return
+    invocation_id = f"e-{uuid.uuid4()}"
+    for author, role, text in (("user", "user", prompt), (root_agent.name, "model", answer)):
+        await adk_session_service.append_event(
+            session,
+            Event(
+                author=author,
+                invocation_id=invocation_id,
+                content=types.Content(role=role, parts=[types.Part(text=text)]),
+            ),
+        )
+
+async def _session_user_texts(session_id: str, user_id: int) -> List[str] | None:
+    """Teks pesan user yang masih tersimpan di session ADK; None kalau session belum/tidak ada."""
+    session = await adk_session_service.get_session(
+        app_name=ADK_APP_NAME, user_id=str(user_id), session_id=session_id
+    )
+    if session is None:
+        return None
+    return [_parts_text(e.content) for e in session.events if e.author == "user"]
+
+async def _prepare_turn(req: ChatRequest, sid: str, msg: str) -> dict:
+    """
+    Retrieval + context + prompt untuk 1 turn, sadar percakapan:
+    - pesan lanjutan ("yang kedua gimana?") di-resolve ke pertanyaan sebelumnya
+      (state in-process, atau req.history kalau state kosong)
+    - chunk yang isinya masih ada di session tidak dikirim ulang
+    - aturan lengkap (preamble) hanya dikirim kalau belum ada di session
+    """
+    key = (req.user_id, sid)
+    user_texts = await _session_user_texts(sid, req.user_id)
+    if user_texts is None:
+        # Session baru / sudah dibuang (LRU, idle): state retrieval ikut mulai dari nol
+        conversations.reset(key)
+        user_texts = []
+
+    resolution = conversations.resolve(msg, conversations.get(key), req.history)
+    seen = seen_chunk_ids(user_texts)
+
+    with metrics.timer("retrieval"):
+        is_recipe, hits = await _retrieve(resolution.query)
+    if resolution.focus:
+        # "yang kedua": chunk yang dirujuk dari turn sebelumnya dipastikan paling atas
+        top = max((float(r.get("rerank_score") or r.get("score") or 0.0) for r in hits["results"]), default=0.0)
+        focus_ids = {r.get("chunk_id") for r in resolution.focus}
+        hits["results"] = [dict(r, rerank_score=top + 1.0) for r in resolution.focus] + [
+            r for r in hits["results"] if r.get("chunk_id") not in focus_ids
+        ]
+    with metrics.timer("context_build"):
+        context, citations = _build_context(hits, resolution.query, is_recipe, seen)
+
+    first_turn = not any(_preamble(is_recipe) in t for t in user_texts)
+    prompt = _build_prompt(msg, is_recipe, context, preamble=first_turn)
+
+    by_id = {r.get("chunk_id"): r for r in hits["results"]}
+    conversations.remember(
+        key,
+        resolution.query,
+        [by_id[c.chunk_id] for c in citations if c.chunk_id in by_id],
+        hits.get("intent"),
+    )
+
+    reused = sum(1 for c in citations if c.chunk_id in seen)
+    return {
+        "is_recipe": is_recipe,
+        "hits": hits,
+        "context": context,
+        "citations": citations,
+        "prompt": prompt,
+        "followup": resolution.followup,
+        "flight_scope": f"{req.user_id}:{sid}" if user_texts else None,
+        "meta": {
+            "followup": resolution.followup,
+            "preamble": first_turn,
+            "chunks_new": len(citations) - reused,
+            "chunks_reused": reused,
+        },
+    }
+
+# =========================
+# Main endpoint (called by Laravel)
+# =========================
+@app.post("/chat", response_model=ChatResponse, dependencies=[Depends(verify_app_token)])
+async def chat(req: ChatRequest):
+    await ensure_runtime()
+    sid = _normalize_session_id(req.session_id)
+    t0 = time.time()
+    metrics.inc("tanya_dewi_requests_total", endpoint="/chat")
+    await _claim_session(sid, req.user_id)
+
+    msg = (req.message or "").strip()
+
+    # =========================
+    # 1) Retrieval + 2) Prompt (sadar percakapan)
+    # =========================
+    turn = await _prepare_turn(req, sid, msg)
+    is_recipe, hits = turn["is_recipe"], turn["hits"]
+    context, citations, prompt = turn["context"], turn["citations"], turn["prompt"]
 
     # Logging RAG
     print("[HIT] /chat", {
@@ -279,73 +965,424 @@ async def chat(req: ChatRequest):
         "user_id": req.user_id,
         "msg_len": len(msg),
         "is_recipe": is_recipe,
-        "chunks": len(hits.get("results", [])),
+        "intent": hits.get("intent"),
+        "chunks": len(citations),
         "ctx_len": len(context),
+        "ctx_tokens": estimate_tokens(context),
+        **turn["meta"],
     })
 
     # =========================
-    # 2) Prompt
+    # 3) Answer cache: pertanyaan + chunk yang sama => jawaban sama
+    #    (kecuali pesan lanjutan: jawabannya bergantung pada percakapan)
     # =========================
-    if is_recipe:
-        prompt = (
-            "Gunakan REFERENSI untuk menjawab dan ekstrak resep.\n"
-            "WAJIB patuh referensi. Jangan menambah info di luar referensi.\n"
-            "Tuliskan semua langkah yang ada di referensi tanpa mengurangi atau menambahkan.\n"
-            "Gunakan format berikut:\n"
-            "Nama Resep:\n"
-            "Alat dan Bahan:\n"
-            "Langkah-langkah:\n\n"
-            "=== REFERENSI ===\n"
-            f"{context}\n"
-            "=== END REFERENSI ===\n\n"
-            f"Pertanyaan user: {msg}" 
-        )
-    else:
-        prompt = (
-            "Gunakan REFERENSI untuk menjawab pertanyaan user secara spesifik dan praktis.\n"
-            "WAJIB patuh referensi. Jangan menambah info di luar referensi.\n"
-            "Gunakan teks biasa tanpa simbol markdown seperti #, *, atau -.\n"
-            "Jawab dengan ringkas namun tetap lengkap sesuai referensi.\n"
-            "Jika referensi tidak cukup, tulis 'tidak ada di potongan referensi' lalu berhenti.\n"
-            "Jika pertanyaan meminta langkah atau prosedur, susun secara berurutan menggunakan angka.\n"
-            "Jika pertanyaan meminta strategi atau penjelasan, susun dalam paragraf yang jelas.\n\n"
-            "=== REFERENSI ===\n"
-            f"{context}\n"
-            "=== END REFERENSI ===\n\n"
-            f"Pertanyaan user: {msg}"
-        )
+    cache_key = None
+    if not turn["followup"]:
+        cache_key = _answer_cache_key(msg, is_recipe, citations, hits, _routed_model(prompt))
+    if cache_key:
+        cached = await asyncio.to_thread(answer_cache.get, cache_key)
+        metrics.inc("tanya_dewi_cache_total", cache="answer", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            await _append_turn(sid, req.user_id, prompt, cached["answer"])
+            resp = ChatResponse(**cached)
+            resp.meta.update({
+                "latency_ms": int((time.time() - t0) * 1000),
+                "session_id": sid,
+                "cache": "hit",
+                "ctx_len": len(context),
+                "ctx_tokens": estimate_tokens(context),
+                **turn["meta"],
+            })
+            return resp
 
     # =========================
-    # 3) Call agent with safety timeout (FIXED INDENT)
+    # 4) Call agent with safety timeout (FIXED INDENT)
+    #    Request identik yang sedang jalan -> tunggu panggilan yang sama (single-flight)
     # =========================
+    served: Dict[str, Any] = {}
+
+    def model_call():
+        return call_agent_async(message=prompt, session_id=sid, user_id=req.user_id, served=served)
+
+    shared = False
     try:
-        answer = await asyncio.wait_for(
-            call_agent_async(
-                message=prompt,
-                session_id=sid,
-                user_id=req.user_id,
-            ),
-            timeout=MODEL_TIMEOUT_SEC
-        )
+        if SINGLE_FLIGHT_ENABLED and not turn["followup"]:
+            answer, shared = await asyncio.wait_for(
+                inflight.do(
+                    _flight_key(msg, is_recipe, citations, hits, prompt, turn["flight_scope"]), model_call
+                ),
+                timeout=MODEL_TIMEOUT_SEC,
+            )
+            metrics.inc("tanya_dewi_single_flight_total", role="follower" if shared else "leader")
+        else:
+            answer = await asyncio.wait_for(model_call(), timeout=MODEL_TIMEOUT_SEC)
     except asyncio.TimeoutError:
-        answer = "Pertanyaan membutuhkan analisis lebih dalam. Mohon tunggu atau sederhanakan pertanyaan."
+        metrics.inc("tanya_dewi_model_timeout_total", endpoint="/chat")
+        answer = TIMEOUT_ANSWER
+
+    if shared and answer:
+        # Model hanya dipanggil di session leader; session ini dapat turn-nya sendiri
+        await _append_turn(sid, req.user_id, prompt, answer)
 
     latency_ms = int((time.time() - t0) * 1000)
 
-    return ChatResponse(
+    resp = ChatResponse(
         answer=answer,
         citations=citations,
         meta={
             "latency_ms": latency_ms,
             "session_id": sid,
             "is_recipe": is_recipe,
-            "chunks": len(hits.get("results", [])),
+            "chunks": len(citations),
             "ctx_len": len(context),
+            "ctx_tokens": estimate_tokens(context),
             "timeout_sec": MODEL_TIMEOUT_SEC,
             "fallback_model": FALLBACK_MODEL,
+            "cache": "miss" if cache_key else "off",
+            "coalesced": shared,
+            **turn["meta"],
         },
     )
 
+    # Jangan cache jawaban timeout / kosong (follower: leader sudah menyimpan).
+    # Disimpan di bawah model yang benar-benar menjawab (mis. fallback yang menang hedge).
+    if cache_key and answer and answer != TIMEOUT_ANSWER and not shared and served:
+        key = _answer_cache_key(msg, is_recipe, citations, hits, served["model"])
+        await asyncio.to_thread(answer_cache.set, key, resp.model_dump())
+
+    return resp
+
+# =========================
+# Streaming endpoint (SSE)
+# =========================
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream", dependencies=[Depends(verify_app_token)])
+async def chat_stream(req: ChatRequest):
+    """
+    Server-Sent Events:
+      event: citations -> daftar citation (langsung setelah retrieval)
+      event: delta     -> potongan jawaban {"text": "..."}
+      event: meta      -> frame terakhir, berisi breakdown latency
+      event: error     -> kalau model gagal di tengah jalan
+    """
+    await ensure_runtime()
+    sid = _normalize_session_id(req.session_id)
+    msg = (req.message or "").strip()
+
+    metrics.inc("tanya_dewi_requests_total", endpoint="/chat/stream")
+    # Sebelum respons stream dimulai (setelah itu status 403 tidak bisa dikirim lagi)
+    await _claim_session(sid, req.user_id)
+
+    async def events():
+        t0 = time.time()
+
+        turn = await _prepare_turn(req, sid, msg)
+        is_recipe, hits = turn["is_recipe"], turn["hits"]
+        context, citations, prompt = turn["context"], turn["citations"], turn["prompt"]
+        t_retrieval = time.time()
+
+        print("[HIT] /chat/stream", {
+            "session_id": sid,
+            "user_id": req.user_id,
+            "msg_len": len(msg),
+            "is_recipe": is_recipe,
+            "intent": hits.get("intent"),
+            "chunks": len(citations),
+            "ctx_len": len(context),
+            "ctx_tokens": estimate_tokens(context),
+            **turn["meta"],
+        })
+
+        yield _sse("citations", {
+            "session_id": sid,
+            "citations": [c.model_dump() for c in citations],
+        })
+
+        meta = {
+            "session_id": sid,
+            "is_recipe": is_recipe,
+            "chunks": len(citations),
+            "ctx_len": len(context),
+            "ctx_tokens": estimate_tokens(context),
+            "timeout_sec": MODEL_TIMEOUT_SEC,
+            "fallback_model": FALLBACK_MODEL,
+            "retrieval_ms": int((t_retrieval - t0) * 1000),
+            **turn["meta"],
+        }
+
+        cache_key = None
+        if not turn["followup"]:
+            cache_key = _answer_cache_key(msg, is_recipe, citations, hits, _routed_model(prompt))
+        if cache_key:
+            cached = await asyncio.to_thread(answer_cache.get, cache_key)
+            metrics.inc("tanya_dewi_cache_total", cache="answer", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                await _append_turn(sid, req.user_id, prompt, cached["answer"])
+                yield _sse("delta", {"text": cached["answer"]})
+                meta.update({"cache": "hit", "latency_ms": int((time.time() - t0) * 1000)})
+                yield _sse("meta", meta)
+                return
+
+        parts: List[str] = []
+        served: Dict[str, Any] = {}
+        t_first = None
+        try:
+            async with asyncio.timeout(MODEL_TIMEOUT_SEC):
+                # aclosing: client putus -> generator model langsung ditutup (percobaan breaker dilepas)
+                async with aclosing(stream_agent_async(prompt, sid, req.user_id, served)) as stream:
+                    async for delta in stream:
+                        if t_first is None:
+                            t_first = time.time()
+                        parts.append(delta)
+                        yield _sse("delta", {"text": delta})
+        except TimeoutError:
+            metrics.inc("tanya_dewi_model_timeout_total", endpoint="/chat/stream")
+            if not parts:
+                parts.append(TIMEOUT_ANSWER)
+                yield _sse("delta", {"text": TIMEOUT_ANSWER})
+            meta["timeout"] = True
+        except Exception as e:
+            print(f"[ERROR] /chat/stream model failed: {e}")
+            yield _sse("error", {"detail": str(e)})
+            return
+
+        t_end = time.time()
+        answer = "".join(parts).strip()
+
+        meta.update({
+            "cache": "miss" if cache_key else "off",
+            "first_token_ms": int(((t_first or t_end) - t0) * 1000),
+            "model_ms": int((t_end - t_retrieval) * 1000),
+            "latency_ms": int((t_end - t0) * 1000),
+        })
+        yield _sse("meta", meta)
+
+        if cache_key and answer and not meta.get("timeout") and served:
+            resp = ChatResponse(answer=answer, citations=citations, meta=meta)
+            key = _answer_cache_key(msg, is_recipe, citations, hits, served["model"])
+            await asyncio.to_thread(answer_cache.set, key, resp.model_dump())
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# =========================
+# Batch endpoint (NDJSON)
+# =========================
+@app.post("/chat/batch", dependencies=[Depends(verify_app_token)])
+async def chat_batch(req: BatchRequest):
+    """
+    Banyak pertanyaan dalam 1 request (job konten / evaluasi malam).
+    - Retrieval semua pertanyaan sekaligus: SearchBatch mengumpulkan semua
+      search_report jadi 1 pass di 1 koneksi.
+    - Panggilan model paralel, maks BATCH_MODEL_CONCURRENCY; tiap pertanyaan
+      di session sendiri yang dihapus setelah selesai. Answer cache & single-flight tetap dipakai.
+    - Respons NDJSON: 1 baris per pertanyaan (urut selesai, bawa "index"),
+      ditutup 1 baris ringkasan {"done": true, ...}.
+    """
+    await ensure_runtime()
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many items (max {BATCH_MAX_ITEMS})")
+    metrics.inc("tanya_dewi_requests_total", endpoint="/chat/batch")
+
+    batch_id = uuid.uuid4().hex[:12]
+    msgs = [(it.message or "").strip() for it in req.items]
+    sem = asyncio.Semaphore(max(1, BATCH_MODEL_CONCURRENCY))
+
+    async def answer_one(i: int, is_recipe: bool, hits: dict) -> dict:
+        msg = msgs[i]
+        row: Dict[str, Any] = {"index": i, "id": req.items[i].id}
+        if not msg:
+            row["error"] = "empty message"
+            return row
+
+        context, citations = _build_context(hits, msg, is_recipe)
+        row["citations"] = [c.model_dump() for c in citations]
+        row["meta"] = {
+            "is_recipe": is_recipe,
+            "intent": hits.get("intent"),
+            "chunks": len(citations),
+            "ctx_tokens": estimate_tokens(context),
+        }
+        if req.retrieval_only:
+            return row
+
+        t0 = time.time()
+        prompt = _build_prompt(msg, is_recipe, context)
+        cache_key = _answer_cache_key(msg, is_recipe, citations, hits, _routed_model(prompt))
+        if cache_key:
+            cached = await asyncio.to_thread(answer_cache.get, cache_key)
+            metrics.inc("tanya_dewi_cache_total", cache="answer", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                row["answer"] = cached["answer"]
+                row["meta"].update({"cache": "hit", "latency_ms": int((time.time() - t0) * 1000)})
+                return row
+
+        sid = f"batch-{batch_id}-{i}"
+        served: Dict[str, Any] = {}
+
+        async def model_call():
+            # Session sementara dihapus saat panggilan model ini selesai, bukan saat item
+            # ini selesai: lewat single-flight, request /chat lain bisa masih menunggu task ini.
+            try:
+                return await call_agent_async(message=prompt, session_id=sid, user_id=req.user_id, served=served)
+            finally:
+                try:
+                    await adk_session_service.delete_session(
+                        app_name=ADK_APP_NAME, user_id=str(req.user_id), session_id=sid
+                    )
+                except Exception:
+                    pass
+
+        shared = False
+        async with sem:
+            try:
+                if SINGLE_FLIGHT_ENABLED:
+                    answer, shared = await asyncio.wait_for(
+                        inflight.do(_flight_key(msg, is_recipe, citations, hits, prompt), model_call),
+                        timeout=MODEL_TIMEOUT_SEC,
+                    )
+                else:
+                    answer = await asyncio.wait_for(model_call(), timeout=MODEL_TIMEOUT_SEC)
+            except asyncio.TimeoutError:
+                metrics.inc("tanya_dewi_model_timeout_total", endpoint="/chat/batch")
+                answer = TIMEOUT_ANSWER
+
+        row["answer"] = answer
+        row["meta"].update({
+            "cache": "miss" if cache_key else "off",
+            "coalesced": shared,
+            "latency_ms": int((time.time() - t0) * 1000),
+        })
+        if cache_key and answer and answer != TIMEOUT_ANSWER and not shared and served:
+            resp = ChatResponse(answer=answer, citations=citations, meta=row["meta"])
+            key = _answer_cache_key(msg, is_recipe, citations, hits, served["model"])
+            await asyncio.to_thread(answer_cache.set, key, resp.model_dump())
+        return row
+
+    async def safe_answer(i: int, is_recipe: bool, hits: dict) -> dict:
+        try:
+            return await answer_one(i, is_recipe, hits)
+        except Exception as e:
+            print(f"[ERROR] /chat/batch item {i} failed: {e}")
+            return {"index": i, "id": req.items[i].id, "error": str(e)}
+
+    async def lines():
+        t0 = time.time()
+        search = SearchBatch()
+        with metrics.timer("batch_retrieval"):
+            retrieved = await asyncio.gather(*(_retrieve(m, search) for m in msgs if m))
+        it = iter(retrieved)
+        retrieved = [next(it) if m else (False, {"results": []}) for m in msgs]
+        t_retrieval = time.time()
+
+        print("[HIT] /chat/batch", {
+            "batch_id": batch_id,
+            "user_id": req.user_id,
+            "items": len(msgs),
+            "retrieval_only": req.retrieval_only,
+            "search_batches": search.batches,
+            "searches": search.searches,
+            "retrieval_ms": int((t_retrieval - t0) * 1000),
+        })
+
+        tasks = [asyncio.create_task(safe_answer(i, *retrieved[i])) for i in range(len(msgs))]
+        errors = cache_hits = 0
+        try:
+            for fut in asyncio.as_completed(tasks):
+                row = await fut
+                errors += 1 if "error" in row else 0
+                cache_hits += 1 if row.get("meta", {}).get("cache") == "hit" else 0
+                yield json.dumps(row, ensure_ascii=False) + "\n"
+        finally:
+            # Client putus di tengah jalan: jangan lanjutkan panggilan model
+            for t in tasks:
+                t.cancel()
+
+        yield json.dumps({
+            "done": True,
+            "batch_id": batch_id,
+            "items": len(msgs),
+            "errors": errors,
+            "cache_hits": cache_hits,
+            "search_batches": search.batches,
+            "searches": search.searches,
+            "retrieval_ms": int((t_retrieval - t0) * 1000),
+            "latency_ms": int((time.time() - t0) * 1000),
+        }) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# =========================
+# Stats & metrics
+# =========================
+def _render_metrics() -> Response:
+    gauges = {}
+    rc = search_cache_stats()
+    gauges["tanya_dewi_retrieval_cache_entries"] = rc["size"]
+    if adk_session_service is not None:
+        ss = adk_session_service.stats()
+        gauges["tanya_dewi_sessions"] = ss["sessions"]
+        gauges["tanya_dewi_session_events"] = ss["events"]
+        gauges["tanya_dewi_session_approx_tokens"] = ss["approx_tokens"]
+    gauges["tanya_dewi_import_seconds"] = (IMPORT_MS or 0) / 1000
+    gauges["tanya_dewi_ready"] = 1 if warmup["ready"] else 0
+    gauges["tanya_dewi_single_flight_inflight"] = inflight.stats()["inflight"]
+    gauges["tanya_dewi_hedge_delay_seconds"] = hedge_policy.delay()
+    gauges["tanya_dewi_breaker_open"] = {"closed": 0, "half_open": 0.5, "open": 1}[breaker.state]
+    gauges["tanya_dewi_breaker_trips"] = breaker.trips
+    return Response(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics", dependencies=[Depends(verify_app_token)])
+async def prometheus_metrics():
+    return _render_metrics()
+
+# App terpisah tanpa token, hanya di METRICS_PORT (lihat _serve_internal_metrics)
+metrics_app = FastAPI(title="Tanya Dewi metrics", openapi_url=None)
+
+@metrics_app.get("/metrics")
+async def internal_prometheus_metrics():
+    return _render_metrics()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: proses hidup (selalu 200), plus status import & warm-up."""
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "startup_mode": STARTUP_MODE,
+        "import_ms": IMPORT_MS,
+        "warmup": warmup,
+    }
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 hanya setelah agent dibuat dan index retrieval sudah di-warm."""
+    return Response(
+        json.dumps(warmup),
+        status_code=200 if warmup["ready"] else 503,
+        media_type="application/json",
+    )
+
+@app.get("/stats/retrieval-cache", dependencies=[Depends(verify_app_token)])
+async def retrieval_cache_stats():
+    return search_cache_stats()
+
+@app.get("/stats/answer-cache", dependencies=[Depends(verify_app_token)])
+async def answer_cache_stats():
+    if answer_cache is None:
+        return {"backend": "off"}
+    return answer_cache.stats()
+
+@app.get("/stats/sessions", dependencies=[Depends(verify_app_token)])
+async def session_stats():
+    await ensure_runtime()
+    return adk_session_service.stats()
+
 # =========================
 # Debug handler
 # =========================
@@ -354,4 +1391,6 @@ async def debug_exception_handler(request, exc):
     return PlainTextResponse(
         "".join(traceback.format_exception(type(exc), exc, exc.__traceback__)),
         status_code=500
-    )
\ No newline at end of file
+    )
+
+IMPORT_MS = int((time.perf_counter() - _IMPORT_T0) * 1000)
@@ -0,0 +1,519 @@
+import asyncio
+import copy
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events.event import Event
+from google.adk.sessions.base_session_service import GetSessionConfig
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from google.adk.sessions.session import Session
+
+
+def _event_chars(event: Event) -> int:
+    content = event.content
+    if not content or not content.parts:
+        return 0
+    n = 0
+    for part in content.parts:
+        if part.text:
+            n += len(part.text)
+        elif part.function_call or part.function_response:
+            # Kira-kira saja; payload tool biasanya hasil search_report
+            n += len(str(part.function_call or part.function_response))
+    return n
+
+
+def _event_text(event: Event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(p.text for p in event.content.parts if p.text)
+
+
+def _events_before_pending(events: list, pending_message: Optional[str]) -> list:
+    """Buang turn terakhir kalau itu pending_message yang masih diproses runner lain."""
+    last_user = max((i for i, e in enumerate(events) if e.author == "user"), default=None)
+    if last_user is not None and pending_message is not None and _event_text(events[last_user]) == pending_message:
+        return events[:last_user]
+    return events
+
+
+class SessionOwnershipError(Exception):
+    """session_id yang diminta sudah dipakai user lain."""
+
+
+def estimate_tokens(chars: int) -> int:
+    # ~4 karakter per token (cukup untuk budget kasar)
+    return chars // 4
+
+
+class BoundedSessionService(InMemorySessionService):
+    """
+    InMemorySessionService dengan batas memori:
+    - max_sessions: jumlah session maksimum (LRU, yang paling lama tidak dipakai dibuang)
+    - idle_ttl_sec: session yang idle lebih lama dari ini dibuang
+    - max_events / max_tokens: budget per session; turn paling lama dipotong
+      (per turn utuh, mulai dari event user) supaya prompt REFERENSI lama tidak menumpuk.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 2000,
+        idle_ttl_sec: float = 3600,
+        max_events: int = 40,
+        max_tokens: int = 24000,
+    ):
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.idle_ttl_sec = idle_ttl_sec
+        self.max_events = max_events
+        self.max_tokens = max_tokens
+
+        # (app_name, user_id, session_id) -> waktu akses terakhir, urut LRU
+        self._last_access: "OrderedDict[tuple[str, str, str], float]" = OrderedDict()
+
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+        self.truncated_events = 0
+
+    # ---------- bookkeeping ----------
+    def _touch(self, app_name: str, user_id: str, session_id: str):
+        key = (app_name, user_id, session_id)
+        self._last_access[key] = time.monotonic()
+        self._last_access.move_to_end(key)
+
+    def _drop(self, key: tuple[str, str, str]):
+        app_name, user_id, session_id = key
+        self._last_access.pop(key, None)
+        user_sessions = self.sessions.get(app_name, {}).get(user_id)
+        if user_sessions is None:
+            return
+        user_sessions.pop(session_id, None)
+        if not user_sessions:
+            self.sessions[app_name].pop(user_id, None)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._last_access:
+            key, last = next(iter(self._last_access.items()))
+            if now - last > self.idle_ttl_sec:
+                self._drop(key)
+                self.evicted_idle += 1
+            elif len(self._last_access) > self.max_sessions:
+                self._drop(key)
+                self.evicted_lru += 1
+            else:
+                break
+
+    def _is_idle(self, app_name: str, user_id: str, session_id: str) -> bool:
+        last = self._last_access.get((app_name, user_id, session_id))
+        return last is not None and time.monotonic() - last > self.idle_ttl_sec
+
+    def _enforce_budget(self, session: Session):
+        events = session.events
+        drop = 0
+        total_chars = sum(_event_chars(e) for e in events)
+
+        while drop < len(events) and (
+            len(events) - drop > self.max_events
+            or estimate_tokens(total_chars) > self.max_tokens
+        ):
+            total_chars -= _event_chars(events[drop])
+            drop += 1
+
+        # Potong di batas turn: event pertama yang tersisa harus dari user,
+        # supaya tidak ada function_response tanpa function_call.
+        while drop and drop < len(events) and events[drop].author != "user":
+            drop += 1
+
+        if drop:
+            # Jangan hapus turn yang sedang berjalan
+            last_user = max((i for i, e in enumerate(events) if e.author == "user"), default=0)
+            drop = min(drop, last_user)
+        if drop > 0:
+            del events[:drop]
+            self.truncated_events += drop
+
+    # ---------- BaseSessionService ----------
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        if session_id and self._is_idle(app_name, user_id, session_id.strip()):
+            self._drop((app_name, user_id, session_id.strip()))
+            self.evicted_idle += 1
+
+        session = await super().create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        self._touch(app_name, user_id, session.id)
+        self._evict()
+        return session
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        if self._is_idle(app_name, user_id, session_id):
+            self._drop((app_name, user_id, session_id))
+            self.evicted_idle += 1
+            return None
+
+        session = await super().get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id, config=config
+        )
+        if session is not None:
+            self._touch(app_name, user_id, session_id)
+        return session
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await super().delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        self._last_access.pop((app_name, user_id, session_id), None)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session=session, event=event)
+        if event.partial:
+            return event
+
+        storage = self.sessions.get(session.app_name, {}).get(session.user_id, {}).get(session.id)
+        if storage is not None:
+            self._enforce_budget(storage)
+            self._touch(session.app_name, session.user_id, session.id)
+        return event
+
+    # ---------- hedging ----------
+    def _storage(self, app_name: str, user_id: str, session_id: str) -> Optional[Session]:
+        return self.sessions.get(app_name, {}).get(user_id, {}).get(session_id)
+
+    async def fork_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        new_session_id: str,
+        pending_message: Optional[str] = None,
+    ) -> Session:
+        """
+        Salin history + state session ke session baru (untuk request hedge ke
+        fallback_runner). Kalau turn terakhir adalah pending_message yang masih
+        diproses runner lain, turn itu tidak ikut disalin.
+        """
+        src = self._storage(app_name, user_id, session_id)
+        fork = await self.create_session(
+            app_name=app_name,
+            user_id=user_id,
+            state=copy.deepcopy(src.state) if src else None,
+            session_id=new_session_id,
+        )
+        if src is not None:
+            self._storage(app_name, user_id, fork.id).events = copy.deepcopy(
+                _events_before_pending(src.events, pending_message)
+            )
+        return fork
+
+    async def adopt_session(self, *, app_name: str, user_id: str, session_id: str, from_session_id: str) -> bool:
+        """
+        Ganti isi session_id dengan isi from_session_id lalu hapus from_session_id.
+        Dipakai kalau hedge menang: turn primary yang dibatalkan (mungkin
+        setengah jalan, mis. function_call tanpa response) dibuang.
+        """
+        target = self._storage(app_name, user_id, session_id)
+        source = self._storage(app_name, user_id, from_session_id)
+        if target is None or source is None:
+            return False
+        target.events = source.events
+        target.state = source.state
+        target.last_update_time = source.last_update_time
+        self._touch(app_name, user_id, session_id)
+        await self.delete_session(app_name=app_name, user_id=user_id, session_id=from_session_id)
+        return True
+
+    # ---------- metrics ----------
+    def stats(self) -> dict:
+        sessions = 0
+        events = 0
+        chars = 0
+        for users in self.sessions.values():
+            for user_sessions in users.values():
+                for s in user_sessions.values():
+                    sessions += 1
+                    events += len(s.events)
+                    chars += sum(_event_chars(e) for e in s.events)
+
+        return {
+            "sessions": sessions,
+            "events": events,
+            "approx_text_chars": chars,
+            "approx_tokens": estimate_tokens(chars),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_sec": self.idle_ttl_sec,
+            "max_events": self.max_events,
+            "max_tokens": self.max_tokens,
+            "evicted_lru": self.evicted_lru,
+            "evicted_idle": self.evicted_idle,
+            "truncated_events": self.truncated_events,
+        }
+
+
+class SqliteSessionService(BoundedSessionService):
+    """
+    Session ADK yang tahan restart, disimpan di chat.db (skema storage.DatabaseSessionService):
+    - baris sessions: conversation_id = session_id ADK
+    - tiap event ADK = 1 baris messages dengan role "adk_event" (content = JSON event)
+
+    Memori BoundedSessionService dipakai sebagai read-through cache session terbaru.
+    Saat session dibaca dan jumlah event di DB lebih banyak dari yang diketahui
+    proses ini (ditulis proses/mesin lain), session dimuat ulang dari DB.
+    Yang dimuat hanya ekor history (budget max_events/max_tokens), jadi state
+    session dibangun ulang dari event ekor itu saja.
+
+    Session hasil fork_session (hedging) hanya ada di memori.
+    """
+
+    EVENT_ROLE = "adk_event"
+
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        # session_id -> jumlah event yang sudah ditulis / dimuat proses ini
+        self._persisted: dict[str, int] = {}
+        self._ephemeral: set[str] = set()
+        # session fork -> (jumlah event di DB sebelum titik fork, id event yang disalin)
+        self._forks: dict[str, tuple[int, set]] = {}
+        # session_id -> tulisan event yang belum selesai (lihat append_event)
+        self._writes: dict[str, set[asyncio.Future]] = {}
+        self.loaded_from_db = 0
+
+    async def _load(self, app_name: str, user_id: str, session_id: str) -> Optional[Session]:
+        if not await self.store.asession_belongs_to_user(session_id, user_id):
+            return None
+
+        rows = await self.store.aget_messages(
+            session_id, before_id=2**63 - 1, limit=self.max_events, role=self.EVENT_ROLE
+        )
+        total = await asyncio.to_thread(self.store.count_messages, session_id, self.EVENT_ROLE)
+
+        self._drop((app_name, user_id, session_id))
+        await super().create_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        storage = self._storage(app_name, user_id, session_id)
+        for r in rows:
+            event = Event.model_validate_json(r["content"])
+            storage.events.append(event)
+            if event.actions and event.actions.state_delta:
+                storage.state.update(
+                    {k: v for k, v in event.actions.state_delta.items() if not k.startswith(("app:", "user:", "temp:"))}
+                )
+            storage.last_update_time = max(storage.last_update_time, event.timestamp)
+        self._enforce_budget(storage)
+
+        self._persisted[session_id] = total
+        self.loaded_from_db += 1
+        return storage
+
+    async def _is_stale(self, session_id: str) -> bool:
+        known = self._persisted.get(session_id)
+        if known is None:
+            return False
+        total = await asyncio.to_thread(self.store.count_messages, session_id, self.EVENT_ROLE)
+        return total > known
+
+    # ---------- BaseSessionService ----------
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = session_id.strip() if session_id else None
+        if session_id and (
+            self._storage(app_name, user_id, session_id) is None
+            or self._is_idle(app_name, user_id, session_id)
+        ):
+            # Dicek sebelum apa pun dibuat di memori: event session ini akan ditulis
+            # ke baris messages dengan conversation_id yang sama.
+            await self._check_owner(session_id, user_id)
+
+        session = await super().create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        try:
+            await self.store.acreate_session(session.id, user_id)
+        except sqlite3.IntegrityError:
+            # Dibuat proses lain di antara pengecekan dan INSERT
+            self._drop((app_name, user_id, session.id))
+            await self._check_owner(session.id, user_id)
+            raise
+        self._persisted[session.id] = 0
+        return session
+
+    async def _check_owner(self, session_id: str, user_id: str):
+        owner = await self.store.asession_owner(session_id)
+        if owner is None:
+            return
+        if str(owner) != str(user_id):
+            raise SessionOwnershipError(f"Session with id {session_id} belongs to another user.")
+        raise AlreadyExistsError(f"Session with id {session_id} already exists.")
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        if session_id not in self._ephemeral:
+            cached = self._storage(app_name, user_id, session_id)
+            if (
+                cached is None
+                or self._is_idle(app_name, user_id, session_id)
+                or await self._is_stale(session_id)
+            ):
+                if await self._load(app_name, user_id, session_id) is None:
+                    return None
+        return await super().get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id, config=config
+        )
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await super().delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        self._persisted.pop(session_id, None)
+        if session_id in self._ephemeral:
+            self._ephemeral.discard(session_id)
+            self._forks.pop(session_id, None)
+            return
+        await asyncio.to_thread(self.store.delete_session, session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session=session, event=event)
+        if event.partial or session.id in self._ephemeral:
+            return event
+        # Event final ditunggu sampai ter-commit: request berikutnya bisa saja
+        # ditangani worker/proses lain yang membaca dari DB.
+        write = asyncio.ensure_future(
+            self.store.aadd_message(
+                session.id,
+                self.EVENT_ROLE,
+                event.model_dump_json(exclude_none=True),
+                wait=event.is_final_response(),
+            )
+        )
+        pending = self._writes.setdefault(session.id, set())
+        pending.add(write)
+        write.add_done_callback(lambda f, sid=session.id: self._write_done(sid, f))
+        self._persisted[session.id] = self._persisted.get(session.id, 0) + 1
+        # shield: runner yang dibatalkan (mis. primary kalah hedge) tidak bisa menghentikan
+        # thread yang sedang mengantre baris ini; adopt_session menunggunya lewat _writes.
+        await asyncio.shield(write)
+        return event
+
+    def _write_done(self, session_id: str, write: asyncio.Future):
+        pending = self._writes.get(session_id)
+        if pending is not None:
+            pending.discard(write)
+            if not pending:
+                del self._writes[session_id]
+
+    async def _drain_writes(self, session_id: str):
+        pending = self._writes.get(session_id)
+        if pending:
+            await asyncio.gather(*list(pending), return_exceptions=True)
+
+    # ---------- hedging ----------
+    async def fork_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        new_session_id: str,
+        pending_message: Optional[str] = None,
+    ) -> Session:
+        self._ephemeral.add(new_session_id)
+        src = self._storage(app_name, user_id, session_id)
+        fork = await BoundedSessionService.create_session(
+            self,
+            app_name=app_name,
+            user_id=user_id,
+            state=copy.deepcopy(src.state) if src else None,
+            session_id=new_session_id,
+        )
+        kept = []
+        if src is not None:
+            kept = _events_before_pending(src.events, pending_message)
+            self._storage(app_name, user_id, fork.id).events = copy.deepcopy(kept)
+        # Titik fork di DB: semua baris yang diketahui, minus turn pending yang tidak ikut disalin.
+        # Memori hanya menyimpan ekor history, jadi dihitung dari jumlah baris, bukan dari events.
+        persisted = self._persisted.get(session_id)
+        if persisted is None:
+            persisted = await asyncio.to_thread(self.store.count_messages, session_id, self.EVENT_ROLE)
+        dropped = len(src.events) - len(kept) if src is not None else 0
+        self._forks[new_session_id] = (max(0, persisted - dropped), {e.id for e in kept})
+        return fork
+
+    async def adopt_session(self, *, app_name: str, user_id: str, session_id: str, from_session_id: str) -> bool:
+        keep, base_ids = self._forks.pop(from_session_id, (None, set()))
+        if not await super().adopt_session(
+            app_name=app_name, user_id=user_id, session_id=session_id, from_session_id=from_session_id
+        ):
+            return False
+        events = self._storage(app_name, user_id, session_id).events
+        if keep is None:
+            # Bukan hasil fork_session di proses ini: tidak tahu titik fork, DB dibiarkan
+            return True
+        # Turn primary yang dibatalkan sudah terlanjur ditulis: hanya baris setelah titik
+        # fork yang diganti dengan event baru dari fallback. History lama di DB (termasuk
+        # yang sudah dipotong dari memori oleh max_events) tetap utuh. Tulisan primary yang
+        # masih di jalan ditunggu dulu, supaya tidak mendarat setelah ekor yang baru.
+        await self._drain_writes(session_id)
+        new_events = [e for e in events if e.id not in base_ids]
+        await asyncio.to_thread(
+            self.store.replace_messages_after,
+            session_id,
+            self.EVENT_ROLE,
+            keep,
+            [e.model_dump_json(exclude_none=True) for e in new_events],
+        )
+        self._persisted[session_id] = keep + len(new_events)
+        return True
+
+    def _drop(self, key: tuple[str, str, str]):
+        super()._drop(key)
+        # Evict dari cache memori saja; data di DB tetap
+        self._persisted.pop(key[2], None)
+        self._ephemeral.discard(key[2])
+        self._forks.pop(key[2], None)
+
+    def stats(self) -> dict:
+        out = super().stats()
+        out.update({
+            "backend": "sqlite",
+            "db_path": self.store.db_path,
+            "loaded_from_db": self.loaded_from_db,
+        })
+        return out
+
+
+def make_session_service(backend: str, db_path: str, **limits) -> BoundedSessionService:
+    """backend: "memory" | "sqlite" (session tahan restart di chat.db)."""
+    backend = (backend or "memory").lower()
+    if backend == "sqlite":
+        from my_agent.app.storage import DatabaseSessionService
+
+        return SqliteSessionService(DatabaseSessionService(db_path), **limits)
+    if backend != "memory":
+        print(f"[WARN] unknown SESSION_BACKEND={backend!r}, using 'memory'")
+    return BoundedSessionService(**limits)
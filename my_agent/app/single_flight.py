@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Request identik yang sedang berjalan bersamaan hanya menjalankan fn() sekali;
+    pemanggil lain menunggu hasil task yang sama.
+
+    Tiap pemanggil boleh punya timeout / dibatalkan sendiri (task bersama
+    di-shield). Task bersama baru dibatalkan kalau semua penunggunya sudah pergi.
+    """
+
+    def __init__(self):
+        # key -> [task, jumlah penunggu]
+        self._inflight: Dict[str, list] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """Return (hasil, shared). shared=True kalau hasil dari panggilan pemanggil lain."""
+        entry = self._inflight.get(key)
+        shared = entry is not None
+        if entry is None:
+            task = asyncio.create_task(fn())
+            entry = self._inflight[key] = [task, 0]
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task), shared
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                task.cancel()
+
+    def _forget(self, key: str, task: asyncio.Task):
+        entry = self._inflight.get(key)
+        if entry is not None and entry[0] is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Hindari "Task exception was never retrieved" kalau semua penunggu sudah pergi
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
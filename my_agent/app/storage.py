@@ -1,118 +1,327 @@
+import asyncio
+import atexit
 import os
+import queue
 import sqlite3
+import threading
 from datetime import datetime
 
+# Writer latar belakang: pesan dikumpulkan lalu di-commit per batch
+# (1 fsync per batch, bukan per pesan).
+WRITE_BATCH_SIZE = int(os.getenv("CHAT_DB_WRITE_BATCH_SIZE", "128"))
+WRITE_FLUSH_INTERVAL_SEC = float(os.getenv("CHAT_DB_FLUSH_INTERVAL_SEC", "0.05"))
+
+_STOP = object()
+
+
 class DatabaseSessionService:
-    def __init__(self, db_path="data/chat.db"):
+    """
+    Penyimpanan chat (data/chat.db).
+
+    - 1 koneksi tulis + 1 koneksi baca yang hidup selama proses (WAL, synchronous=NORMAL)
+    - add_message masuk antrean; thread writer meng-commit per batch
+    - get_messages selalu melihat pesan yang sudah diantre (antrean di-flush dulu)
+    - versi async (acreate_session, aadd_message, aget_messages, ...) untuk handler FastAPI
+    """
+
+    def __init__(
+        self,
+        db_path="data/chat.db",
+        batch_size: int = WRITE_BATCH_SIZE,
+        flush_interval_sec: float = WRITE_FLUSH_INTERVAL_SEC,
+    ):
         self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval_sec = flush_interval_sec
 
         # pastikan folder ada
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+
+        self._write_conn = self._connect()
+        self._read_conn = self._connect()
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
 
         self._init_db()
 
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, name="chat-db-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
     def _connect(self):
-        return sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
 
     def _init_db(self):
-        conn = self._connect()
-        cur = conn.cursor()
-
-        # sessions sekarang punya user_id
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS sessions (
-            conversation_id TEXT PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            period_key TEXT,
-            created_at TEXT NOT NULL
-        )
-        """)
-
-        cur.execute("PRAGMA foreign_keys = ON")
-        cur.execute("PRAGMA table_info(sessions)")
-        cols = [row[1] for row in cur.fetchall()]
-        if "period_key" not in cols:
-            cur.execute("ALTER TABLE sessions ADD COLUMN period_key TEXT")
-
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    conversation_id TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TEXT NOT NULL,
-                    FOREIGN KEY(conversation_id) REFERENCES sessions(conversation_id)
-                )
-        """)
+        with self._write_lock, self._write_conn as conn:
+            # sessions sekarang punya user_id
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                conversation_id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                period_key TEXT,
+                created_at TEXT NOT NULL
+            )
+            """)
 
-        conn.commit()
-        conn.close()
+            cols = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+            if "period_key" not in cols:
+                conn.execute("ALTER TABLE sessions ADD COLUMN period_key TEXT")
 
-    def create_session(self, conversation_id: str, user_id: int, period_key: str | None = None):
-        conn = self._connect()
-        cur = conn.cursor()
-        if period_key is None:
-            cur.execute(
-                "INSERT INTO sessions (conversation_id, user_id, created_at) VALUES (?, ?, ?)",
-                (conversation_id, int(user_id), datetime.utcnow().isoformat()),
+            # Dulu tabel ini hanya dibuat saat migrasi period_key; sekarang selalu dipastikan ada
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY(conversation_id) REFERENCES sessions(conversation_id)
             )
-        else:
-            cur.execute(
+            """)
+
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, id)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_sessions_user_period ON sessions(user_id, period_key, created_at)"
+            )
+
+    # =========================
+    # Background writer
+    # =========================
+    def _writer_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    nxt = self._queue.get(timeout=self.flush_interval_sec)
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    stop = True
+                    break
+                batch.append(nxt)
+
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in range(len(batch) + (1 if stop else 0)):
+                    self._queue.task_done()
+
+            if stop:
+                return
+
+    def _write_batch(self, batch: list):
+        sql = "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)"
+        try:
+            with self._write_lock, self._write_conn as conn:
+                conn.executemany(sql, batch)
+            return
+        except Exception as e:
+            print(f"[WARN] chat.db batch write failed ({len(batch)} messages), retrying one by one: {e}")
+
+        # Jangan sampai 1 pesan bermasalah membuang seluruh batch
+        for row in batch:
+            try:
+                with self._write_lock, self._write_conn as conn:
+                    conn.execute(sql, row)
+            except Exception as e:
+                print(f"[WARN] chat.db message write failed (conversation_id={row[0]}): {e}")
+
+    def flush(self):
+        """Tunggu sampai semua pesan di antrean sudah di-commit."""
+        if self._queue.unfinished_tasks:
+            self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join(timeout=10)
+        self._write_conn.close()
+        self._read_conn.close()
+
+    # =========================
+    # Sessions
+    # =========================
+    def create_session(self, conversation_id: str, user_id: int, period_key: str | None = None):
+        with self._write_lock, self._write_conn as conn:
+            conn.execute(
                 "INSERT INTO sessions (conversation_id, user_id, period_key, created_at) VALUES (?, ?, ?, ?)",
                 (conversation_id, int(user_id), period_key, datetime.utcnow().isoformat()),
             )
-        conn.commit()
-        conn.close()
 
     def get_session_by_user_and_period(self, user_id: int, period_key: str) -> str | None:
-        conn = self._connect()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT conversation_id
-            FROM sessions
-            WHERE user_id = ? AND period_key = ?
-            ORDER BY created_at DESC
-            LIMIT 1
-            """,
-            (int(user_id), period_key),
-        )
-        row = cur.fetchone()
-        conn.close()
+        with self._read_lock:
+            row = self._read_conn.execute(
+                """
+                SELECT conversation_id
+                FROM sessions
+                WHERE user_id = ? AND period_key = ?
+                ORDER BY created_at DESC
+                LIMIT 1
+                """,
+                (int(user_id), period_key),
+            ).fetchone()
+        return row[0] if row else None
+
+    def delete_session(self, conversation_id: str):
+        self.flush()
+        with self._write_lock, self._write_conn as conn:
+            conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            conn.execute("DELETE FROM sessions WHERE conversation_id = ?", (conversation_id,))
+
+    def session_owner(self, conversation_id: str) -> int | None:
+        """user_id pemilik session, atau None kalau session belum ada."""
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT user_id FROM sessions WHERE conversation_id = ? LIMIT 1",
+                (conversation_id,),
+            ).fetchone()
         return row[0] if row else None
 
     def session_belongs_to_user(self, conversation_id: str, user_id: int) -> bool:
-        conn = self._connect()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT 1 FROM sessions WHERE conversation_id = ? AND user_id = ? LIMIT 1",
-            (conversation_id, int(user_id)),
-        )
-        row = cur.fetchone()
-        conn.close()
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT 1 FROM sessions WHERE conversation_id = ? AND user_id = ? LIMIT 1",
+                (conversation_id, int(user_id)),
+            ).fetchone()
         return row is not None
 
-    def add_message(self, conversation_id: str, role: str, content: str):
-        conn = self._connect()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
-            (conversation_id, role, content, datetime.utcnow().isoformat()),
-        )
-        conn.commit()
-        conn.close()
-
-    def get_messages(self, conversation_id: str):
-        conn = self._connect()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT role, content, created_at FROM messages WHERE conversation_id = ? ORDER BY id ASC",
-            (conversation_id,),
-        )
-        rows = cur.fetchall()
-        conn.close()
+    # =========================
+    # Messages
+    # =========================
+    def add_message(self, conversation_id: str, role: str, content: str, wait: bool = False):
+        """
+        Antre pesan untuk writer latar belakang.
+        wait=True: tunggu sampai sudah di-commit.
+        """
+        if self._closed:
+            raise RuntimeError("DatabaseSessionService is closed")
+        self._queue.put((conversation_id, role, content, datetime.utcnow().isoformat()))
+        if wait:
+            self.flush()
+
+    def replace_messages_after(self, conversation_id: str, role: str, keep: int, contents: list[str]):
+        """
+        Pertahankan `keep` pesan pertama dengan role tsb, hapus sisanya, lalu
+        tambahkan contents (1 transaksi). History sebelum titik itu tidak disentuh.
+        """
+        self.flush()
+        now = datetime.utcnow().isoformat()
+        with self._write_lock, self._write_conn as conn:
+            boundary = 0
+            if keep > 0:
+                row = conn.execute(
+                    "SELECT id FROM messages WHERE conversation_id = ? AND role = ? ORDER BY id LIMIT 1 OFFSET ?",
+                    (conversation_id, role, keep - 1),
+                ).fetchone()
+                # Pesan lebih sedikit dari keep: tidak ada yang dihapus
+                boundary = row[0] if row else None
+            if boundary is not None:
+                conn.execute(
+                    "DELETE FROM messages WHERE conversation_id = ? AND role = ? AND id > ?",
+                    (conversation_id, role, boundary),
+                )
+            conn.executemany(
+                "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                [(conversation_id, role, c, now) for c in contents],
+            )
+
+    def count_messages(self, conversation_id: str, role: str | None = None) -> int:
+        sql = "SELECT COUNT(*) FROM messages WHERE conversation_id = ?"
+        params: list = [conversation_id]
+        if role is not None:
+            sql += " AND role = ?"
+            params.append(role)
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchone()[0]
+
+    def get_messages(
+        self,
+        conversation_id: str,
+        after_id: int | None = None,
+        before_id: int | None = None,
+        limit: int | None = None,
+        role: str | None = None,
+    ):
+        """
+        Keyset pagination berdasarkan id pesan (urut naik):
+        - after_id : pesan dengan id > after_id (halaman berikutnya; mulai dari yang paling lama)
+        - before_id: pesan dengan id < before_id (halaman sebelumnya; `limit` pesan terbaru)
+        Tanpa parameter: semua pesan (perilaku lama).
+        """
+        self.flush()
+
+        where = ["conversation_id = ?"]
+        params: list = [conversation_id]
+        if after_id is not None:
+            where.append("id > ?")
+            params.append(int(after_id))
+        if before_id is not None:
+            where.append("id < ?")
+            params.append(int(before_id))
+        if role is not None:
+            where.append("role = ?")
+            params.append(role)
+
+        # before_id: ambil yang terbaru dulu, lalu dibalik supaya tetap urut naik
+        newest_first = before_id is not None and after_id is None and limit is not None
+        sql = f"SELECT id, role, content, created_at FROM messages WHERE {' AND '.join(where)} ORDER BY id {'DESC' if newest_first else 'ASC'}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        with self._read_lock:
+            rows = self._read_conn.execute(sql, params).fetchall()
+        if newest_first:
+            rows.reverse()
 
         return [
-            {"role": r[0], "content": r[1], "created_at": r[2]}
+            {"id": r[0], "role": r[1], "content": r[2], "created_at": r[3]}
             for r in rows
         ]
+
+    # =========================
+    # Async API (untuk handler FastAPI)
+    # =========================
+    async def acreate_session(self, conversation_id: str, user_id: int, period_key: str | None = None):
+        await asyncio.to_thread(self.create_session, conversation_id, user_id, period_key)
+
+    async def aget_session_by_user_and_period(self, user_id: int, period_key: str) -> str | None:
+        return await asyncio.to_thread(self.get_session_by_user_and_period, user_id, period_key)
+
+    async def asession_owner(self, conversation_id: str) -> int | None:
+        return await asyncio.to_thread(self.session_owner, conversation_id)
+
+    async def asession_belongs_to_user(self, conversation_id: str, user_id: int) -> bool:
+        return await asyncio.to_thread(self.session_belongs_to_user, conversation_id, user_id)
+
+    async def aadd_message(self, conversation_id: str, role: str, content: str, wait: bool = False):
+        if wait:
+            await asyncio.to_thread(self.add_message, conversation_id, role, content, True)
+        else:
+            # queue.put tidak blocking (antrean tanpa batas)
+            self.add_message(conversation_id, role, content)
+
+    async def aget_messages(
+        self,
+        conversation_id: str,
+        after_id: int | None = None,
+        before_id: int | None = None,
+        limit: int | None = None,
+        role: str | None = None,
+    ):
+        return await asyncio.to_thread(self.get_messages, conversation_id, after_id, before_id, limit, role)
@@ -0,0 +1,18 @@
+# my_agent/categories.py
+"""
+Kategori knowledge base. Data saja (tanpa import lain), supaya script ingest
+(chunk_pdf.py) dan jalur serving (intent router, search_report) memakai peta
+yang sama tanpa saling bergantung.
+"""
+
+# Nama file PDF (tanpa .pdf) -> kategori
+CATEGORY_MAP = {
+    "Knowledge_Branding_dan_Konten_Promosi_UMKM_Pala": "Branding & Konten Promosi",
+    "Knowledge_Digital_Marketing_dan_Penjualan_UMKM_Pala": "Digital Marketing & Penjualan",
+    "Knowledge_Kemasan_Warna_dan_Visual_Produk_Pala": "Kemasan, Warna & Visual",
+    "Knowledge_Penentuan_Harga_Jual_UMKM_Pala": "Penentuan Harga",
+    "Knowledge_Pengolahan_dan_Kualitas_Buah_Pala": "Pengolahan & Kualitas",
+    "Knowledge_Resep_Olahan_Buah_Pala_UMKM": "Resep Olahan",
+}
+# Kategori -> nama file PDF (untuk DB lama yang belum punya kolom category)
+CATEGORY_SOURCES = {category: name for name, category in CATEGORY_MAP.items()}
@@ -0,0 +1,156 @@
+# my_agent/dense_index.py
+"""
+Index dense (embedding) opsional di samping FTS5.
+
+File index (dibuat oleh build_dense_index.py):
+- data/dense.npy        : matriks [n_chunk, dim], float32 atau int8 (sudah dinormalisasi L2)
+- data/dense_scale.npy  : skala per baris (hanya untuk int8)
+- data/dense_ids.json   : side table chunk_id + info model
+
+numpy dan sentence-transformers tidak wajib. Kalau salah satu tidak ada
+(atau file index belum dibuat), dense retrieval otomatis mati dan
+search_report tetap pakai FTS5 saja.
+"""
+import importlib.util
+import json
+import os
+import threading
+from pathlib import Path
+from typing import List
+
+from my_agent.retrieval_engine import PROJECT_ROOT, db_generation
+
+DENSE_DIR = Path(os.getenv("DENSE_DIR", str(PROJECT_ROOT / "data")))
+# auto: aktif kalau file index ada | on | off
+DENSE_ENABLED = os.getenv("DENSE_ENABLED", "auto").lower()
+DENSE_MODEL = os.getenv("DENSE_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+
+MATRIX_FILE = "dense.npy"
+SCALE_FILE = "dense_scale.npy"
+IDS_FILE = "dense_ids.json"
+
+
+class DenseIndex:
+    def __init__(self, index_dir: Path = DENSE_DIR):
+        import numpy as np
+
+        if importlib.util.find_spec("sentence_transformers") is None:
+            raise ImportError("sentence-transformers is not installed")
+
+        self.np = np
+        self.index_dir = Path(index_dir)
+        # Side table ditulis terakhir oleh build_dense_index.py, jadi identitas
+        # file ini (inode/mtime/size) menandai versi index.
+        self.generation = db_generation(self.index_dir / IDS_FILE)
+
+        meta = json.loads((self.index_dir / IDS_FILE).read_text(encoding="utf-8"))
+        self.chunk_ids: List[str] = meta["chunk_ids"]
+        self.model_name: str = meta.get("model") or DENSE_MODEL
+        self.dtype: str = meta.get("dtype", "float32")
+
+        # mmap: halaman matriks dishare lewat page cache OS, tidak dicopy per proses
+        self.matrix = np.load(self.index_dir / MATRIX_FILE, mmap_mode="r")
+        self.scale = None
+        if self.dtype == "int8":
+            self.scale = np.load(self.index_dir / SCALE_FILE, mmap_mode="r")
+
+        if self.matrix.shape[0] != len(self.chunk_ids):
+            raise ValueError(
+                f"dense index mismatch: {self.matrix.shape[0]} rows vs {len(self.chunk_ids)} chunk_ids"
+            )
+
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    def _encoder(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    # Model lokal (CPU), tidak butuh API / jaringan setelah diunduh sekali
+                    self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def embed(self, texts: List[str]):
+        vecs = self._encoder().encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return vecs.astype(self.np.float32)
+
+    def search_vectors(self, qvecs, k: int) -> List[List[tuple[str, float]]]:
+        """Top-k untuk banyak query sekaligus (1 perkalian matriks)."""
+        np = self.np
+        # [n_chunk, dim] @ [dim, n_query] -> [n_chunk, n_query]
+        scores = self.matrix @ qvecs.T
+        if self.scale is not None:
+            scores = scores * self.scale[:, None]
+
+        n = scores.shape[0]
+        k = min(k, n)
+        out: List[List[tuple[str, float]]] = []
+        if k <= 0:
+            return [[] for _ in range(qvecs.shape[0])]
+
+        for j in range(scores.shape[1]):
+            col = scores[:, j]
+            top = np.argpartition(-col, k - 1)[:k]
+            top = top[np.argsort(-col[top])]
+            out.append([(self.chunk_ids[i], float(col[i])) for i in top])
+        return out
+
+    def search(self, query: str, k: int) -> List[tuple[str, float]]:
+        return self.search_vectors(self.embed([query]), k)[0]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], rrf_k: int = 60) -> dict:
+    """RRF: skor(d) = sum(1 / (rrf_k + rank)), rank mulai dari 1."""
+    fused: dict = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (rrf_k + rank)
+    return fused
+
+
+_dense: DenseIndex | None = None
+_dense_generation: tuple | None = None
+_dense_loaded = False
+_dense_lock = threading.Lock()
+
+
+def get_dense_index() -> DenseIndex | None:
+    """
+    Index dense global (lazy). None kalau dimatikan / tidak tersedia.
+    Dimuat ulang otomatis kalau build_dense_index.py menulis index baru
+    (sama seperti get_engine() untuk knowledge.db).
+    """
+    global _dense, _dense_generation, _dense_loaded
+    if DENSE_ENABLED == "off":
+        return None
+
+    generation = db_generation(DENSE_DIR / IDS_FILE)
+    if _dense_loaded and generation == _dense_generation:
+        return _dense
+
+    with _dense_lock:
+        if _dense_loaded and generation == _dense_generation:
+            return _dense
+
+        dense = None
+        if generation is None:
+            if DENSE_ENABLED == "on":
+                print(f"[WARN] DENSE_ENABLED=on but index not found in {DENSE_DIR}")
+        else:
+            try:
+                dense = DenseIndex(DENSE_DIR)
+            except ImportError as e:
+                print(f"[WARN] dense retrieval disabled (missing dependency): {e}")
+            except Exception as e:
+                print(f"[WARN] dense retrieval disabled: {e}")
+
+        if dense is not None and _dense is not None:
+            print(f"[INFO] dense index changed, reloaded: {dense.generation}")
+            if _dense.model_name == dense.model_name:
+                # Encoder tidak ikut berubah: jangan load model lagi
+                dense._model = _dense._model
+        # Diisi terakhir: thread lain tidak pernah melihat generation baru dengan index lama/None
+        _dense, _dense_generation, _dense_loaded = dense, generation, True
+        return _dense
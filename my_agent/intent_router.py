@@ -0,0 +1,111 @@
+# my_agent/intent_router.py
+"""
+Intent router: pesan user -> salah satu kategori CATEGORY_MAP (my_agent/categories.py) atau None.
+
+Kata kunci per kategori ada di intents.json. Saat load, tiap kata kunci
+di-stem (my_agent.stemmer) lalu dimasukkan ke trie token; pesan di-tokenize
+sekali dan di-scan 1 pass dengan longest match. Yang dicocokkan token utuh,
+jadi "gr" tidak lagi kena di "program" dan "hari" tidak kena di "harian".
+
+Kategori dipilih kalau skornya >= INTENT_MIN_SCORE dan unggul minimal
+INTENT_MIN_MARGIN dari kategori kedua; selain itu None (pencarian umum).
+"""
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List
+
+from my_agent.stemmer import WORD_RE, stem
+
+RECIPE_CATEGORY = "Resep Olahan"
+
+INTENTS_PATH = Path(os.getenv("INTENTS_PATH", str(Path(__file__).with_name("intents.json"))))
+INTENT_MIN_SCORE = float(os.getenv("INTENT_MIN_SCORE", "2"))
+INTENT_MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", "1"))
+
+_END = object()
+
+
+def _stems(text: str) -> List[str]:
+    return [stem(t) for t in WORD_RE.findall((text or "").lower())]
+
+
+class Intent:
+    def __init__(self, category: str | None, scores: Dict[str, float]):
+        self.category = category
+        self.scores = scores
+
+    @property
+    def is_recipe(self) -> bool:
+        return self.category == RECIPE_CATEGORY
+
+    def __repr__(self) -> str:
+        return f"Intent(category={self.category!r}, scores={self.scores})"
+
+
+class IntentRouter:
+    def __init__(self, keywords: Dict[str, Dict[str, float]], min_score: float = INTENT_MIN_SCORE, min_margin: float = INTENT_MIN_MARGIN):
+        self.min_score = min_score
+        self.min_margin = min_margin
+
+        self._trie: dict = {}
+        for category, terms in keywords.items():
+            for term, weight in terms.items():
+                toks = _stems(term)
+                if not toks:
+                    continue
+                node = self._trie
+                for tok in toks:
+                    node = node.setdefault(tok, {})
+                # Kata kunci yang stem-nya sama (jualan / penjualan): ambil bobot terbesar
+                hits = node.setdefault(_END, {})
+                hits[category] = max(hits.get(category, 0.0), float(weight))
+
+    @classmethod
+    def from_file(cls, path: Path = INTENTS_PATH) -> "IntentRouter":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls({k: v for k, v in data.items() if not k.startswith("_")})
+
+    def scores(self, message: str) -> Dict[str, float]:
+        tokens = _stems(message)
+        matched: Dict[int, Dict[str, float]] = {}
+        i = 0
+        while i < len(tokens):
+            node, j = self._trie, i
+            hit, end = None, i + 1
+            while j < len(tokens) and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if _END in node:
+                    hit, end = node[_END], j
+            if hit is not None:
+                # Kata kunci yang sama dihitung sekali per pesan
+                matched[id(hit)] = hit
+            i = end
+
+        out: Dict[str, float] = {}
+        for hits in matched.values():
+            for category, weight in hits.items():
+                out[category] = out.get(category, 0.0) + weight
+        return out
+
+    def route(self, message: str) -> Intent:
+        scores = self.scores(message)
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        if not ranked or ranked[0][1] < self.min_score:
+            return Intent(None, scores)
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if ranked[0][1] - runner_up < self.min_margin:
+            return Intent(None, scores)
+        return Intent(ranked[0][0], scores)
+
+
+@lru_cache(maxsize=1)
+def get_router() -> IntentRouter:
+    try:
+        return IntentRouter.from_file(INTENTS_PATH)
+    except Exception as e:
+        print(f"[WARN] intents load failed ({INTENTS_PATH}): {e}")
+        return IntentRouter({})
@@ -0,0 +1,163 @@
+# my_agent/metrics.py
+"""
+Metrics in-process sederhana dengan format teks Prometheus (tanpa dependency).
+
+    from my_agent import metrics
+    with metrics.timer("retrieval"):            # tanya_dewi_stage_seconds{stage="retrieval"}
+        ...
+    with metrics.timer("model_call", runner="primary"):
+        ...
+    metrics.inc("tanya_dewi_fallback_switch_total", reason="overload")
+    metrics.observe("tanya_dewi_query_variants", 3)
+
+Nama untuk inc()/observe() harus terdaftar di COUNTERS/HISTOGRAMS di bawah.
+GET /metrics di server mengembalikan metrics.render().
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Tuple
+
+# Bucket default (detik): cocok untuk tahap ms (FTS) sampai menit (model)
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 180.0,
+)
+COUNT_BUCKETS = (1, 2, 3, 4, 6, 8, 12, 16, 24)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [count per bucket..., +Inf, sum]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[idx] += 1
+            series[-1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for key, series in items:
+            cum = 0
+            for bound, n in zip(self.buckets, series):
+                cum += n
+                lines.append(f"{self.name}_bucket{_labels(key, le=_fmt(bound))} {cum}")
+            cum += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{_labels(key, le="+Inf")} {cum}')
+            lines.append(f"{self.name}_sum{_labels(key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(key)} {cum}")
+        return "\n".join(lines)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._series: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._series.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_labels(key)} {value}")
+        return "\n".join(lines)
+
+
+def _fmt(v: float) -> str:
+    return repr(float(v))
+
+
+def _labels(key: LabelKey, **extra: str) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+# =========================
+# Registry
+# =========================
+HISTOGRAMS: Dict[str, Histogram] = {
+    "tanya_dewi_stage_seconds": Histogram(
+        "tanya_dewi_stage_seconds",
+        "Durasi per tahap hot path (auth, query_expand, fts_query, context_build, model_call, session_create, ...)",
+    ),
+    "tanya_dewi_query_variants": Histogram(
+        "tanya_dewi_query_variants",
+        "Jumlah varian query per search_report",
+        buckets=COUNT_BUCKETS,
+    ),
+}
+
+COUNTERS: Dict[str, Counter] = {
+    "tanya_dewi_fallback_switch_total": Counter(
+        "tanya_dewi_fallback_switch_total", "Jumlah perpindahan ke fallback_runner"
+    ),
+    "tanya_dewi_hedge_total": Counter(
+        "tanya_dewi_hedge_total", "Hedge ke fallback_runner (outcome=started|primary_won|fallback_won|both_failed)"
+    ),
+    "tanya_dewi_single_flight_total": Counter(
+        "tanya_dewi_single_flight_total", "Request /chat per peran single-flight (role=leader|follower)"
+    ),
+    "tanya_dewi_intent_total": Counter(
+        "tanya_dewi_intent_total", "Hasil intent router per request (category=<kategori>|none)"
+    ),
+    "tanya_dewi_model_timeout_total": Counter(
+        "tanya_dewi_model_timeout_total", "Jumlah panggilan model yang kena MODEL_TIMEOUT_SEC"
+    ),
+    "tanya_dewi_cache_total": Counter(
+        "tanya_dewi_cache_total", "Hit/miss cache (cache=retrieval|answer, result=hit|miss)"
+    ),
+    "tanya_dewi_requests_total": Counter(
+        "tanya_dewi_requests_total", "Jumlah request per endpoint"
+    ),
+}
+
+
+def observe(name: str, value: float, **labels: str):
+    HISTOGRAMS[name].observe(value, **labels)
+
+
+def inc(name: str, amount: float = 1, **labels: str):
+    COUNTERS[name].inc(amount, **labels)
+
+
+@contextmanager
+def timer(stage: str, **labels: str):
+    """Catat durasi blok ke tanya_dewi_stage_seconds{stage=...}."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        HISTOGRAMS["tanya_dewi_stage_seconds"].observe(time.perf_counter() - t0, stage=stage, **labels)
+
+
+def render(extra_gauges: Dict[str, float] | None = None) -> str:
+    parts = [h.render() for h in HISTOGRAMS.values()]
+    parts += [c.render() for c in COUNTERS.values()]
+    for name, value in (extra_gauges or {}).items():
+        parts.append(f"# TYPE {name} gauge\n{name} {value}")
+    return "\n".join(parts) + "\n"
@@ -0,0 +1,156 @@
+# my_agent/query_normalizer.py
+"""
+Normalisasi query untuk search_report, dikompilasi sekali dari lexicon.json:
+
+- singkatan (fb, ig, tokped, ...) -> bentuk baku
+- grup sinonim (jualan/berjualan/menjual, promosi/pemasaran/marketing, ...)
+
+Semua kunci (boleh multi-kata) dimasukkan ke trie token, lalu query di-scan
+satu kali dari kiri ke kanan dengan longest match. Hasilnya daftar "slot":
+tiap slot = tuple alternatif frasa untuk satu posisi di query.
+
+    "jualan fb"  ->  [("jualan", "berjualan", "menjual"), ("facebook", "fac ebook")]
+
+Dari slot dibangun 1 ekspresi MATCH FTS5 (AND antar slot, OR di dalam slot),
+ter-stem kalau index punya kolom `stem`.
+"""
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from my_agent.stemmer import WORD_RE, stem
+
+LEXICON_PATH = Path(os.getenv("LEXICON_PATH", str(Path(__file__).with_name("lexicon.json"))))
+
+Slot = Tuple[str, ...]
+
+_END = object()
+
+
+def _tokens(text: str) -> List[str]:
+    return WORD_RE.findall((text or "").lower())
+
+
+def _phrase(text: str) -> str:
+    return " ".join(_tokens(text))
+
+
+class QueryNormalizer:
+    def __init__(self, abbreviations: Dict[str, str], synonyms: List[List[str]]):
+        groups: Dict[str, Slot] = {}
+        for group in synonyms:
+            members = tuple(dict.fromkeys(_phrase(m) for m in group if _phrase(m)))
+            for m in members:
+                # Kata yang ada di beberapa grup: alternatifnya digabung
+                groups[m] = tuple(dict.fromkeys(groups.get(m, ()) + members))
+
+        entries: Dict[str, Slot] = dict(groups)
+        for abbr, canonical in abbreviations.items():
+            canonical = _phrase(canonical)
+            # Bentuk baku di depan, lalu sinonim dari bentuk baku
+            entries[_phrase(abbr)] = tuple(dict.fromkeys((canonical,) + groups.get(canonical, ())))
+
+        self._trie: dict = {}
+        for key, alts in entries.items():
+            node = self._trie
+            for tok in key.split():
+                node = node.setdefault(tok, {})
+            node[_END] = alts
+
+    @classmethod
+    def from_file(cls, path: Path = LEXICON_PATH) -> "QueryNormalizer":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("abbreviations", {}), data.get("synonyms", []))
+
+    def slots(self, query: str) -> List[Slot]:
+        """Satu pass longest-match di atas token query."""
+        tokens = _tokens(query)
+        out: List[Slot] = []
+        i = 0
+        while i < len(tokens):
+            node, j = self._trie, i
+            match, end = None, i
+            while j < len(tokens) and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if _END in node:
+                    match, end = node[_END], j
+            if match is None:
+                out.append((tokens[i],))
+                i += 1
+            else:
+                out.append(match)
+                i = end
+        return out
+
+    def variants(self, slots: List[Slot], limit: int = 6) -> List[str]:
+        """
+        Slot -> string query biasa (untuk RETRIEVAL_MODE=multi, dense, log):
+        bentuk baku dulu, lalu tiap alternatif diganti satu per satu.
+        """
+        if not slots:
+            return []
+        base = [s[0] for s in slots]
+        out = [" ".join(base)]
+        for i, slot in enumerate(slots):
+            for alt in slot[1:]:
+                v = " ".join(base[:i] + [alt] + base[i + 1:])
+                if v not in out:
+                    out.append(v)
+        return out[:limit]
+
+    def match_expression(self, slots: List[Slot], stemmed: bool = False) -> str | None:
+        """
+        "jualan fb" -> ("jualan" OR "berjualan" OR "menjual") AND ("facebook" OR "fac ebook")
+        stemmed=True  -> stem : ("jual" AND ("facebook" OR "fac ebook"))
+        (alternatif yang stem-nya sama cukup muncul sekali). Tiap frasa di-quote
+        supaya input user tidak bisa merusak sintaks MATCH.
+        """
+        parts: List[str] = []
+        for slot in slots:
+            alts: List[str] = []
+            for alt in slot:
+                words = _tokens(alt)
+                if stemmed:
+                    words = [stem(w) for w in words]
+                if not words:
+                    continue
+                quoted = '"' + " ".join(words) + '"'
+                if quoted not in alts:
+                    alts.append(quoted)
+            if not alts:
+                continue
+            part = alts[0] if len(alts) == 1 else "(" + " OR ".join(alts) + ")"
+            if part not in parts:
+                parts.append(part)
+        if not parts:
+            return None
+        # AND eksplisit: FTS5 menolak AND implisit setelah grup berkurung
+        expr = " AND ".join(parts)
+        return f"stem : ({expr})" if stemmed else expr
+
+    def fallback_expression(self, slots: List[Slot], stemmed: bool = False) -> str | None:
+        """Prefix OR dari semua term (>= 3 huruf) di semua alternatif."""
+        terms: List[str] = []
+        for slot in slots:
+            for alt in slot:
+                for w in _tokens(alt):
+                    t = stem(w) if stemmed else w
+                    if len(t) >= 3 and t not in terms:
+                        terms.append(t)
+        if not terms:
+            return None
+        expr = " OR ".join(f'"{t}"*' for t in terms)
+        return f"stem : ({expr})" if stemmed else expr
+
+
+@lru_cache(maxsize=1)
+def get_normalizer() -> QueryNormalizer:
+    try:
+        return QueryNormalizer.from_file(LEXICON_PATH)
+    except Exception as e:
+        print(f"[WARN] lexicon load failed ({LEXICON_PATH}): {e}")
+        return QueryNormalizer({}, [])
@@ -0,0 +1,83 @@
+# my_agent/rerank.py
+"""
+Tahap reranking setelah search_report.
+
+Reranker = callable (items, top_n, recipe) -> top_n item terbaik.
+Pilih lewat env RERANKER (lihat RERANKERS di bawah); default "weighted".
+"""
+import heapq
+import json
+import os
+from typing import Callable, Dict, List
+
+Reranker = Callable[[List[dict], int, bool], List[dict]]
+
+RERANK_W_BM25 = float(os.getenv("RERANK_W_BM25", "1.0"))
+RERANK_W_RECIPE = float(os.getenv("RERANK_W_RECIPE", "2.0"))
+# Prior per kategori / source, JSON: {"Resep Olahan": 0.2}
+RERANK_CATEGORY_PRIORS: Dict[str, float] = json.loads(os.getenv("RERANK_CATEGORY_PRIORS", "{}"))
+RERANK_SOURCE_PRIORS: Dict[str, float] = json.loads(os.getenv("RERANK_SOURCE_PRIORS", "{}"))
+
+
+def recipe_section_boost(item: dict) -> float:
+    """0..1: chunk yang memuat bagian alat/bahan dan langkah dapat nilai penuh."""
+    t = (item.get("text") or "").lower()
+    s = 0
+    if "alat & bahan" in t or "alat dan bahan" in t:
+        s += 5
+    if "langkah" in t:
+        s += 5
+    return s / 10
+
+
+class WeightedReranker:
+    """skor = w_bm25 * score + w_recipe * recipe_boost (jalur resep) + prior kategori/source."""
+
+    def __init__(
+        self,
+        w_bm25: float = RERANK_W_BM25,
+        w_recipe: float = RERANK_W_RECIPE,
+        category_priors: Dict[str, float] | None = None,
+        source_priors: Dict[str, float] | None = None,
+    ):
+        self.w_bm25 = w_bm25
+        self.w_recipe = w_recipe
+        self.category_priors = RERANK_CATEGORY_PRIORS if category_priors is None else category_priors
+        self.source_priors = RERANK_SOURCE_PRIORS if source_priors is None else source_priors
+
+    def score(self, item: dict, recipe: bool) -> float:
+        s = self.w_bm25 * float(item.get("score") or 0.0)
+        if recipe:
+            s += self.w_recipe * recipe_section_boost(item)
+        s += self.category_priors.get(item.get("category") or "", 0.0)
+        s += self.source_priors.get(item.get("source") or "", 0.0)
+        return s
+
+    def __call__(self, items: List[dict], top_n: int, recipe: bool = False) -> List[dict]:
+        # heap top-N: tidak perlu sort seluruh kandidat
+        scored = ((self.score(it, recipe), -i, it) for i, it in enumerate(items))
+        best = heapq.nlargest(top_n, scored, key=lambda x: (x[0], x[1]))
+        out = []
+        for s, _, it in best:
+            it["rerank_score"] = round(s, 4)
+            out.append(it)
+        return out
+
+
+def passthrough(items: List[dict], top_n: int, recipe: bool = False) -> List[dict]:
+    return items[:top_n]
+
+
+RERANKERS: Dict[str, Callable[[], Reranker]] = {
+    "weighted": WeightedReranker,
+    "none": lambda: passthrough,
+}
+
+
+def get_reranker(name: str | None = None) -> Reranker:
+    name = (name or os.getenv("RERANKER", "weighted")).lower()
+    factory = RERANKERS.get(name)
+    if factory is None:
+        print(f"[WARN] unknown RERANKER={name!r}, using 'weighted'")
+        factory = WeightedReranker
+    return factory()
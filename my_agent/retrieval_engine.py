@@ -0,0 +1,300 @@
+# my_agent/retrieval_engine.py
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List
+
+from my_agent import metrics
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = PROJECT_ROOT / "data" / "knowledge.db"
+
+# Pool koneksi read-only ke knowledge.db. Index hanya berubah saat rebuild,
+# jadi koneksi aman dibuka sekali lalu dipakai ulang oleh semua thread worker.
+RETRIEVAL_POOL_SIZE = int(os.getenv("RETRIEVAL_POOL_SIZE", "4"))
+RETRIEVAL_MMAP_BYTES = int(os.getenv("RETRIEVAL_MMAP_BYTES", str(64 * 1024 * 1024)))
+RETRIEVAL_CACHE_KIB = int(os.getenv("RETRIEVAL_CACHE_KIB", "16384"))
+
+BASE_COLS = ["chunk", "source", "page"]
+OPTIONAL_COLS = ["category", "section_title", "fr_number", "chunk_id"]
+
+
+def db_generation(db_path: Path) -> tuple | None:
+    try:
+        st = os.stat(db_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class RetrievalEngine:
+    """
+    Pemilik pool koneksi read-only ke index FTS5.
+
+    - Koneksi dibuka dengan URI `mode=ro&immutable=1` + mmap, lalu dikembalikan
+      ke pool setelah dipakai (thread-safe, bisa dishare antar worker thread).
+    - Schema `report_fts` (+ tabel metadata `chunks` kalau ada) dibaca sekali
+      saat engine dibuat; filter category/source memakai index B-tree `chunks`.
+    - SQL dibangun sekali; sqlite3 menyimpan prepared statement per koneksi
+      (cached_statements), jadi query berikutnya tidak di-parse ulang.
+    """
+
+    def __init__(self, db_path: Path = DB_PATH, pool_size: int = RETRIEVAL_POOL_SIZE):
+        self.db_path = Path(db_path)
+        self.pool_size = max(1, pool_size)
+
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+        # Koneksi yang sedang di-pin thread ini (lihat pinned())
+        self._local = threading.local()
+
+        # Identitas file DB saat engine dibuka. Rebuild knowledge.db mengubah
+        # inode/mtime/size, jadi engine (dan cache hasil query) tahu harus di-refresh.
+        self.generation = db_generation(self.db_path)
+
+        self.select_cols = self._discover_schema()
+        # Kolom `stem` (hasil my_agent.stemmer) hanya ada di DB hasil build baru;
+        # DB lama tetap dicari dengan term apa adanya.
+        self.has_stem = "stem" in self.fts_cols
+        # Tiap baris hasil = select_cols + skor bm25 (negatif, makin kecil makin relevan)
+        self.row_cols = self.select_cols + ["bm25"]
+        self._sql_cache: dict = {}
+
+    def _open(self) -> sqlite3.Connection:
+        uri = f"{self.db_path.resolve().as_uri()}?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=64)
+        conn.execute(f"PRAGMA mmap_size={int(RETRIEVAL_MMAP_BYTES)}")
+        conn.execute(f"PRAGMA cache_size=-{int(RETRIEVAL_CACHE_KIB)}")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        pinned = getattr(self._local, "conn", None)
+        if pinned is not None:
+            yield pinned
+            return
+
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.pool_size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                # Pool penuh: tunggu koneksi yang sedang dipakai thread lain
+                conn = self._pool.get()
+
+        try:
+            yield conn
+        finally:
+            if self._closed:
+                conn.close()
+            else:
+                self._pool.put(conn)
+
+    @contextmanager
+    def pinned(self) -> Iterator[sqlite3.Connection]:
+        """
+        Pinjam 1 koneksi untuk seluruh blok: semua connection() di thread ini
+        memakai koneksi yang sama (dipakai search_many untuk banyak query sekaligus).
+        """
+        pinned = getattr(self._local, "conn", None)
+        if pinned is not None:
+            yield pinned
+            return
+        with self.connection() as conn:
+            self._local.conn = conn
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+
+    def _discover_schema(self) -> List[str]:
+        with self.connection() as conn:
+            self.fts_cols = [r[1] for r in conn.execute("PRAGMA table_info(report_fts)").fetchall()]
+            meta_cols = [r[1] for r in conn.execute("PRAGMA table_info(chunks)").fetchall()]
+
+        # Layout baru: metadata di tabel `chunks` (B-tree index category/source),
+        # report_fts external-content hanya mengindeks teks. Layout lama: semua
+        # kolom ada di report_fts.
+        self.has_meta_table = bool(meta_cols)
+        cols = meta_cols if self.has_meta_table else self.fts_cols
+
+        select_cols = list(BASE_COLS)
+        for extra in OPTIONAL_COLS:
+            if extra in cols:
+                select_cols.append(extra)
+        return select_cols
+
+    def _col(self, name: str) -> str:
+        return f"c.{name}" if self.has_meta_table else name
+
+    def _from(self) -> str:
+        if self.has_meta_table:
+            return "FROM report_fts JOIN chunks c ON c.id = report_fts.rowid"
+        return "FROM report_fts"
+
+    @staticmethod
+    def _filters(source_like: str | None, category: str | None, prefix: str = "") -> tuple[str, list]:
+        where, params = [], []
+        if category:
+            where.append(f"{prefix}category = ?")
+            params.append(category)
+        if source_like:
+            where.append(f"{prefix}source LIKE ?")
+            params.append(source_like)
+        return "".join(f" AND {w}" for w in where), params
+
+    def _match_sql(self, has_source: bool, has_category: bool) -> str:
+        # 1 string SQL per kombinasi filter, supaya statement cache sqlite3 tetap kena
+        key = (has_source, has_category)
+        sql = self._sql_cache.get(key)
+        if sql is None:
+            where, _ = self._filters(
+                "x" if has_source else None,
+                "x" if has_category else None,
+                "c." if self.has_meta_table else "",
+            )
+            select_sql = ", ".join(self._col(c) for c in self.select_cols)
+            sql = (
+                f"SELECT {select_sql}, bm25(report_fts) AS score {self._from()} "
+                f"WHERE report_fts MATCH ?{where} "
+                "ORDER BY score LIMIT ?"
+            )
+            self._sql_cache[key] = sql
+        return sql
+
+    def supports_category(self) -> bool:
+        return "category" in self.select_cols
+
+    def match(
+        self,
+        conn: sqlite3.Connection,
+        q: str,
+        k: int,
+        source_like: str | None = None,
+        category: str | None = None,
+    ) -> list:
+        # ALWAYS return a list
+        sql = self._match_sql(bool(source_like), bool(category))
+        _, params = self._filters(source_like, category)
+        with metrics.timer("fts_query"):
+            return conn.execute(sql, [q, *params, k]).fetchall()
+
+    def fetch_by_chunk_ids(
+        self,
+        chunk_ids: List[str],
+        source_like: str | None = None,
+        category: str | None = None,
+    ) -> list:
+        """Ambil baris untuk chunk_id tertentu (urutan mengikuti chunk_ids)."""
+        if not chunk_ids or "chunk_id" not in self.select_cols:
+            return []
+
+        table = "chunks" if self.has_meta_table else "report_fts"
+        marks = ", ".join("?" for _ in chunk_ids)
+        where, params = self._filters(source_like, category)
+        sql = (
+            f"SELECT {', '.join(self.select_cols)}, NULL FROM {table} "
+            f"WHERE chunk_id IN ({marks}){where}"
+        )
+
+        idx = self.select_cols.index("chunk_id")
+        with self.connection() as conn, metrics.timer("fts_fetch_ids"):
+            rows = conn.execute(sql, [*chunk_ids, *params]).fetchall()
+        order = {cid: i for i, cid in enumerate(chunk_ids)}
+        rows.sort(key=lambda r: order.get(r[idx], len(order)))
+        return rows
+
+    def search_tiers(
+        self,
+        exprs: List[str | None],
+        k: int,
+        source_like: str | None = None,
+        category: str | None = None,
+    ) -> list:
+        """
+        Jalankan tiap tier (1 MATCH per tier) berurutan, berhenti di tier
+        pertama yang menghasilkan baris. Semua tier memakai 1 koneksi.
+        """
+        with self.connection() as conn:
+            for expr in exprs:
+                if not expr:
+                    continue
+                try:
+                    rows = self.match(conn, expr, k, source_like, category)
+                except sqlite3.OperationalError:
+                    continue
+                if rows:
+                    return rows
+        return []
+
+    def warm(self) -> int:
+        """
+        Baca file DB sekali (sampai RETRIEVAL_MMAP_BYTES) supaya halamannya ada di
+        page cache OS. Page cache dipakai bersama semua proses worker yang
+        membuka file yang sama (mode=ro + mmap), jadi cukup sekali per mesin.
+        Return jumlah byte yang dibaca.
+        """
+        read = 0
+        with open(self.db_path, "rb") as f:
+            while read < RETRIEVAL_MMAP_BYTES:
+                block = f.read(1024 * 1024)
+                if not block:
+                    break
+                read += len(block)
+        # Buka 1 koneksi pool (PRAGMA + schema) sebelum request pertama
+        with self.connection() as conn:
+            conn.execute("SELECT 1 FROM report_fts LIMIT 1").fetchall()
+        return read
+
+    def is_stale(self) -> bool:
+        return db_generation(self.db_path) != self.generation
+
+    def close(self):
+        # Koneksi yang masih dipinjam thread lain ditutup saat dikembalikan
+        self._closed = True
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+_engine: RetrievalEngine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> RetrievalEngine:
+    """
+    Engine global (lazy), dibuat sekali per proses.
+    Dibuka ulang otomatis kalau knowledge.db di-rebuild.
+    """
+    global _engine
+    engine = _engine
+    if engine is None or engine.is_stale():
+        with _engine_lock:
+            if _engine is None or _engine.is_stale():
+                old = _engine
+                _engine = RetrievalEngine(DB_PATH)
+                if old is not None:
+                    print(f"[INFO] knowledge.db changed, reopening retrieval engine: {_engine.generation}")
+                    old.close()
+            engine = _engine
+    return engine
@@ -1,11 +1,39 @@
 # my_agent/retrieval_tool.py
+import asyncio
+import os
 import re
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
-from pathlib import Path
 
-PROJECT_ROOT = Path(__file__).resolve().parents[1]
-DB_PATH = PROJECT_ROOT / "data" / "knowledge.db"
+from my_agent import metrics
+from my_agent.cache import TTLCache
+from my_agent.dense_index import get_dense_index, reciprocal_rank_fusion
+from my_agent.categories import CATEGORY_SOURCES
+from my_agent.query_normalizer import get_normalizer
+from my_agent.retrieval_engine import DB_PATH, RETRIEVAL_POOL_SIZE, get_engine
+
+# "single": query dinormalisasi (lexicon + stem) jadi 1 ekspresi MATCH (1-2 query per search)
+# "multi": 1 MATCH per varian (perilaku lama)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "single")
+
+# Hybrid retrieval (kalau index dense tersedia): bm25 + dense digabung pakai RRF.
+# Dense sudah menangkap sinonim, jadi varian query lexical cukup sedikit.
+RRF_K = int(os.getenv("RRF_K", "60"))
+DENSE_MAX_VARIANTS = int(os.getenv("DENSE_MAX_VARIANTS", "2"))
+
+# Jumlah maksimum search_report yang jalan bersamaan dari jalur async.
+# Default = ukuran pool koneksi, supaya thread tidak antre koneksi.
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", str(RETRIEVAL_POOL_SIZE)))
+
+# Cache hasil search_report. Key menyertakan generation DB (dan index dense), jadi entry lama
+# otomatis tidak terpakai lagi setelah knowledge.db / index dense di-rebuild.
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL_SEC = float(os.getenv("RETRIEVAL_CACHE_TTL_SEC", "600"))
+
+_result_cache = TTLCache(max_size=RETRIEVAL_CACHE_SIZE, ttl_sec=RETRIEVAL_CACHE_TTL_SEC)
+
+_executor = ThreadPoolExecutor(max_workers=max(1, RETRIEVAL_WORKERS), thread_name_prefix="retrieval")
 
 STOPWORDS = {
     "yang", "untuk", "dengan", "pada", "dan", "adalah", "atau", "dari",
@@ -19,10 +47,11 @@ STOPWORDS = {
 
 def _build_fallback_query(query: str) -> str | None:
     terms = [t for t in re.findall(r"[\w]+", query.lower()) if len(t) >= 3]
+    terms = list(dict.fromkeys(terms))
     if not terms:
         return None
     # Use OR so multi-word questions still return partial matches.
-    return " OR ".join(f"{t}*" for t in terms)
+    return " OR ".join(f'"{t}"*' for t in terms)
 
 def _clean_query(query: str) -> str:
     tokens = re.findall(r"[\w]+", query.lower())
@@ -30,124 +59,151 @@ def _clean_query(query: str) -> str:
     return " ".join(tokens)
 
 def _expand_queries(query: str) -> List[str]:
-    q = query.strip()
-    if not q:
-        return [query]
-
-    ql = q.lower()
-    ql = re.sub(r"\s+", " ", ql).strip()
-
-    variants = [ql]
-
-    # Singkatan umum UMKM / medsos
-    repl = {
-        r"\bfb\b": "facebook",
-        r"\big\b": "instagram",
-        r"\bwa\b": "whatsapp",
-        r"\btokped\b": "tokopedia",
-        r"\bshopeefood\b": "shopee food",
-        # keep tiktok as-is, but some docs might have "tik tok"
-    }
-
-    q2 = ql
-    for pat, rep in repl.items():
-        q2 = re.sub(pat, rep, q2)
-    if q2 != ql:
-        variants.append(q2)
-
-    # Variasi kata yang sering beda di dokumen vs pertanyaan user
-    variants.append(re.sub(r"\bjualan\b", "berjualan", q2))
-    variants.append(re.sub(r"\bjualan\b", "menjual", q2))
-    variants.append(re.sub(r"\bpromosi\b", "pemasaran", q2))
-    variants.append(re.sub(r"\bpromosi\b", "marketing", q2))
-    variants.append(re.sub(r"\bdigital marketing\b", "pemasaran digital", q2))
-
-    # Variasi tiktok kadang kepisah
-    if "tiktok" in q2:
-        variants.append(q2.replace("tiktok", "tik tok"))
-
-    # Workaround untuk kasus dokumen ada spasi aneh (misal: "fac ebook")
-    if "facebook" in q2:
-        variants.append(q2.replace("facebook", "fac ebook"))
-
-    # Dedup + buang kosong
-    out: List[str] = []
-    seen = set()
-    for v in variants:
-        v = v.strip()
-        if not v:
-            continue
-        if v not in seen:
-            seen.add(v)
-            out.append(v)
+    """Varian query (bentuk baku + sinonim dari lexicon.json), maks 6."""
+    normalizer = get_normalizer()
+    return normalizer.variants(normalizer.slots(query)) or [query]
 
-    return out[:6]
 
+def _to_items(engine, rows: list) -> List[dict]:
+    """
+    Baris SQL -> dict, plus `score` = bm25 yang dinormalisasi ke 0..1
+    (1.0 = hit terbaik di batch ini). bm25 FTS5 negatif, jadi dibalik dulu.
+    """
+    items = [dict(zip(engine.row_cols, row)) for row in rows]
+    best = max((-(it["bm25"] or 0.0) for it in items), default=0.0)
+    for it in items:
+        raw = -(it["bm25"] or 0.0)
+        it["bm25"] = raw if it["bm25"] is not None else None
+        it["score"] = raw / best if best > 0 else 0.0
+    return items
 
-def search_report(query: str, k: int = 5, source_like: str | None = None) -> dict:
-    print(f"[TOOL] search_report called: query={query!r}, k={k}, source_like={source_like}, db={DB_PATH}")
-    if not DB_PATH.exists():
-        return {"query": query, "results": [], "error": f"DB not found: {DB_PATH}"}
 
-    conn = sqlite3.connect(str(DB_PATH))
-    cur = conn.cursor()
-
-    cols = [r[1] for r in cur.execute("PRAGMA table_info(report_fts)").fetchall()]
-
-    select_cols = ["chunk", "source", "page"]
-    for extra in ["category", "section_title", "fr_number", "chunk_id"]:
-        if extra in cols:
-            select_cols.append(extra)
-
-    select_sql = ", ".join(select_cols)
-
-    def run(q: str):
-        # ALWAYS return a list
-        if source_like:
-            cur.execute(
-                f"SELECT {select_sql} FROM report_fts "
-                "WHERE report_fts MATCH ? AND source LIKE ? "
-                "ORDER BY bm25(report_fts) LIMIT ?",
-                (q, source_like, k),
-            )
-            return cur.fetchall()
-        else:
-            cur.execute(
-                f"SELECT {select_sql} FROM report_fts "
-                "WHERE report_fts MATCH ? "
-                "ORDER BY bm25(report_fts) LIMIT ?",
-                (q, k),
-            )
-            return cur.fetchall()
-
-    # --- expanded queries + fallback ---
-    query_clean = _clean_query(query)
-    variants = _expand_queries(query_clean)
-
-    all_rows = []
-
-    for qv in variants:
-        try:
-            rows = run(qv) or []
-            all_rows.extend(rows)
-        except sqlite3.OperationalError:
-            continue
+def _search_multi(engine, variants: List[str], k: int, source_like: str | None, category: str | None) -> List[dict]:
+    # Skor dinormalisasi per varian, lalu semua varian digabung urut skor
+    all_items: List[dict] = []
 
-    if not all_rows:
+    with engine.connection() as conn:
         for qv in variants:
-            fb = _build_fallback_query(qv)
-            if not fb:
-                continue
             try:
-                rows = run(fb) or []
-                all_rows.extend(rows)
+                rows = engine.match(conn, qv, k, source_like, category) or []
+                all_items.extend(_to_items(engine, rows))
             except sqlite3.OperationalError:
                 continue
 
+        if not all_items:
+            for qv in variants:
+                fb = _build_fallback_query(qv)
+                if not fb:
+                    continue
+                try:
+                    rows = engine.match(conn, fb, k, source_like, category) or []
+                    all_items.extend(_to_items(engine, rows))
+                except sqlite3.OperationalError:
+                    continue
+
+    all_items.sort(key=lambda it: it["score"], reverse=True)
+    return all_items
+
+
+def _fuse_dense(
+    engine,
+    dense,
+    query_clean: str,
+    fts_items: List[dict],
+    k: int,
+    source_like: str | None,
+    category: str | None,
+) -> List[dict]:
+    """Gabungkan ranking bm25 (fts_items) dengan ranking dense via reciprocal rank fusion."""
+    try:
+        # Ambil kandidat lebih banyak karena sebagian bisa tersaring filter
+        dense_hits = dense.search(query_clean, k * 3 if (source_like or category) else k)
+    except Exception as e:
+        print(f"[WARN] dense search failed: {e}")
+        return fts_items
+
+    dense_items = _to_items(engine, engine.fetch_by_chunk_ids([cid for cid, _ in dense_hits], source_like, category))
+
+    by_id = {}
+    for it in fts_items + dense_items:
+        by_id.setdefault(it["chunk_id"], it)
+
+    fused = reciprocal_rank_fusion(
+        [[it["chunk_id"] for it in fts_items], [it["chunk_id"] for it in dense_items]],
+        rrf_k=RRF_K,
+    )
+    ranked = sorted(fused, key=fused.get, reverse=True)
+    best = fused[ranked[0]] if ranked else 0.0
+    out = []
+    for cid in ranked:
+        it = by_id[cid]
+        it["score"] = fused[cid] / best if best > 0 else 0.0
+        out.append(it)
+    return out
+
+
+def search_report(query: str, k: int = 5, source_like: str | None = None, category: str | None = None) -> dict:
+    """
+    category: filter kategori persis (mis. "Resep Olahan"), dijalankan di SQL
+    lewat index tabel `chunks`. source_like: filter LIKE pada nama file PDF.
+    """
+    print(f"[TOOL] search_report called: query={query!r}, k={k}, source_like={source_like}, category={category}, db={DB_PATH}")
+    if not DB_PATH.exists():
+        return {"query": query, "results": [], "error": f"DB not found: {DB_PATH}"}
+
+    engine = get_engine()
+    select_cols = engine.select_cols
+
+    if category and not engine.supports_category():
+        # DB sangat lama tanpa kolom category: pakai nama file PDF kategori tsb
+        source_like = source_like or (f"{CATEGORY_SOURCES[category]}%" if category in CATEGORY_SOURCES else None)
+        category = None
+
+    with metrics.timer("query_clean"):
+        query_clean = _clean_query(query)
+
+    dense = get_dense_index() if "chunk_id" in select_cols else None
+
+    cache_key = (engine.generation, dense.generation if dense else None, query_clean, k, source_like, category)
+    cached = _result_cache.get(cache_key)
+    if cached is not None:
+        metrics.inc("tanya_dewi_cache_total", cache="retrieval", result="hit")
+        print(f"[TOOL] search_report cache hit hits={len(cached['results'])}")
+        return _copy_result(cached)
+    metrics.inc("tanya_dewi_cache_total", cache="retrieval", result="miss")
+
+    # --- normalisasi (singkatan, sinonim) + fallback ---
+    normalizer = get_normalizer()
+    with metrics.timer("query_expand"):
+        slots = normalizer.slots(query_clean)
+        variants = normalizer.variants(slots) or [query_clean]
+
+    if dense is not None:
+        variants = variants[:DENSE_MAX_VARIANTS]
+
+    metrics.observe("tanya_dewi_query_variants", len(variants))
+
+    if RETRIEVAL_MODE == "multi":
+        items = _search_multi(engine, variants, k, source_like, category)
+    else:
+        # Tier 1: AND antar slot, OR antar sinonim, top-k global by bm25.
+        # Tier 2: prefix OR dari semua term (hanya jika tier 1 kosong).
+        # DB dengan kolom stem: keduanya dicocokkan ke term yang sudah di-stem.
+        stemmed = engine.has_stem
+        items = _to_items(engine, engine.search_tiers(
+            [normalizer.match_expression(slots, stemmed), normalizer.fallback_expression(slots, stemmed)],
+            k,
+            source_like,
+            category,
+        ))
+
+    if dense is not None and query_clean:
+        with metrics.timer("dense_search"):
+            items = _fuse_dense(engine, dense, query_clean, items, k, source_like, category)
+
     results = []
     seen = set()
-    for row in all_rows:
-        item = dict(zip(select_cols, row))
+    for item in items:
         key = (
             item.get("source"),
             item.get("page"),
@@ -166,12 +222,92 @@ def search_report(query: str, k: int = 5, source_like: str | None = None) -> dic
             "section_title": item.get("section_title"),
             "fr_number": item.get("fr_number"),
             "chunk_id": item.get("chunk_id"),
+            "score": round(item["score"], 4),
+            "bm25": round(item["bm25"], 4) if item["bm25"] is not None else None,
         })
 
         if len(results) >= k:
             break
 
-    conn.close()
     print(f"[TOOL] search_report hits={len(results)} variants={variants}")
 
-    return {"query": query_clean, "results": results}
+    out = {"query": query_clean, "results": results}
+    _result_cache.set(cache_key, out)
+    return _copy_result(out)
+
+
+def _copy_result(out: dict) -> dict:
+    # Caller boleh mengubah hasil tanpa merusak isi cache
+    return {"query": out["query"], "results": [dict(r) for r in out["results"]]}
+
+
+def search_cache_stats() -> dict:
+    """Counter hit/miss cache search_report (untuk monitoring)."""
+    return _result_cache.stats()
+
+
+def search_many(specs: List[dict]) -> List[dict]:
+    """
+    Banyak search_report dalam 1 pass, urut sesuai specs.
+    spec = {"query": ..., "k": ..., "source_like": ..., "category": ...}
+    Semua query memakai 1 koneksi pool yang sama (tidak pinjam-kembalikan per query).
+    """
+    if not specs:
+        return []
+    if not DB_PATH.exists():
+        return [search_report(**spec) for spec in specs]
+    with metrics.timer("search_many"), get_engine().pinned():
+        return [search_report(**spec) for spec in specs]
+
+
+async def asearch_many(specs: List[dict]) -> List[dict]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, search_many, specs)
+
+
+class SearchBatch:
+    """
+    Pengganti asearch_report untuk banyak coroutine sekaligus (/chat/batch):
+    semua pemanggilan di 1 putaran event loop dikumpulkan lalu dijalankan
+    sebagai 1 search_many di 1 thread. Tahap berikutnya (mis. retry tanpa
+    filter) otomatis jadi batch berikutnya.
+    """
+
+    def __init__(self):
+        self._pending: List[tuple] = []
+        self.batches = 0
+        self.searches = 0
+
+    def __call__(self, query: str, k: int = 5, source_like: str | None = None, category: str | None = None):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        if not self._pending:
+            # Jalan setelah semua coroutine yang sudah siap sampai di await berikutnya
+            loop.call_soon(self._flush)
+        self._pending.append(({"query": query, "k": k, "source_like": source_like, "category": category}, fut))
+        return fut
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        self.batches += 1
+        self.searches += len(pending)
+        task = asyncio.ensure_future(asearch_many([spec for spec, _ in pending]))
+
+        def done(t: asyncio.Future):
+            for i, (_, fut) in enumerate(pending):
+                if fut.done():
+                    continue
+                if t.cancelled():
+                    fut.cancel()
+                elif t.exception() is not None:
+                    fut.set_exception(t.exception())
+                else:
+                    fut.set_result(t.result()[i])
+
+        task.add_done_callback(done)
+
+
+async def asearch_report(query: str, k: int = 5, source_like: str | None = None, category: str | None = None) -> dict:
+    """Versi async search_report: jalan di thread pool, tidak memblok event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, search_report, query, k, source_like, category)
@@ -0,0 +1,91 @@
+# my_agent/stemmer.py
+"""
+Stemmer imbuhan bahasa Indonesia (tanpa kamus), dipakai di dua sisi:
+- ingest  : build_knowledge_db.py mengisi kolom `stem` di report_fts
+- query   : search_report mencocokkan term yang sudah di-stem ke kolom `stem`
+
+Tanpa kamus kata dasar hasilnya tidak selalu kata dasar yang benar
+(mis. "simpan" -> "simp"), tapi selama aturan yang sama dipakai di ingest
+dan query, varian morfologis (jualan / berjualan / menjual / penjualan)
+jatuh ke stem yang sama. Kolom stem ikut di content hash build_knowledge_db,
+jadi setelah aturan diubah, build berikutnya meng-upsert chunk yang terdampak.
+"""
+import re
+from functools import lru_cache
+
+MIN_STEM = 4
+
+PARTICLES = ("lah", "kah", "tah", "pun")
+POSSESSIVES = ("nya", "ku", "mu")
+VOWELS = set("aeiou")
+
+WORD_RE = re.compile(r"\w+")
+
+
+def _strip_end(w: str, endings: tuple) -> str:
+    for e in endings:
+        if w.endswith(e) and len(w) - len(e) >= MIN_STEM:
+            return w[: -len(e)]
+    return w
+
+
+def _strip_prefix(w: str) -> str | None:
+    """Satu lapis awalan (dengan peluluhan me-/pe-). None kalau tidak ada."""
+    candidates = []
+    if w.startswith(("meny", "peny")) and w[4:5] in VOWELS:
+        candidates.append("s" + w[4:])
+    elif w.startswith(("meng", "peng")):
+        candidates.append(w[4:])
+    elif w.startswith(("mem", "pem")):
+        candidates.append(("p" + w[3:]) if w[3:4] in VOWELS else w[3:])
+    elif w.startswith(("men", "pen")):
+        candidates.append(("t" + w[3:]) if w[3:4] in VOWELS else w[3:])
+    elif w.startswith(("me", "pe")) and w[2:3] in set("lmnrwy"):
+        candidates.append(w[2:])
+    elif w.startswith(("ber", "ter", "per")):
+        candidates.append(w[3:])
+    elif w.startswith("be") and w[2:4] == "ke":
+        # bekerja -> kerja
+        candidates.append(w[2:])
+    elif w.startswith(("di", "se")):
+        # ke- sengaja tidak dibuang: kemas/kemasan, kecil, kentang
+        candidates.append(w[2:])
+
+    for c in candidates:
+        if len(c) >= MIN_STEM:
+            return c
+    return None
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    w = word.lower()
+    if len(w) <= MIN_STEM or not w.isalpha():
+        return w
+
+    # Awalan dulu: "mengolah" jangan sampai kehilangan "-lah" sebagai partikel
+    prefixed = False
+    for _ in range(2):
+        nxt = _strip_prefix(w)
+        if nxt is None:
+            break
+        w, prefixed = nxt, True
+
+    w = _strip_end(w, PARTICLES)
+    w = _strip_end(w, POSSESSIVES)
+
+    # Akhiran turunan: -kan / -an (boleh dua kali: simpanan -> simpan -> simp),
+    # -i hanya kalau ada awalan (mengatasi -> atas; "pasti" tetap)
+    for _ in range(2):
+        nxt = _strip_end(w, ("kan", "an"))
+        if nxt == w:
+            break
+        w = nxt
+    if prefixed:
+        w = _strip_end(w, ("i",))
+    return w
+
+
+def stem_text(text: str) -> str:
+    """Teks -> deretan stem dipisah spasi (isi kolom `stem`)."""
+    return " ".join(stem(t) for t in WORD_RE.findall((text or "").lower()))
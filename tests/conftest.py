@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+
+import build_knowledge_db
+
+from my_agent.app.answer_cache import MemoryAnswerCache
+from my_agent.app.conversation import ConversationTracker
+from my_agent.app.hedging import CircuitBreaker, HedgePolicy
+from my_agent.app.single_flight import SingleFlight
+
+
+def chunk(cid, text, category="Resep Olahan", source="Knowledge_Resep_Olahan_Buah_Pala_UMKM.pdf", page=1):
+    return {"id": cid, "text": text, "source": source, "page": page, "category": category, "section_title": None}
+
+
+@pytest.fixture
+def knowledge_db(tmp_path):
+    """build(rows) -> path knowledge.db sementara (lewat build_knowledge_db.build)."""
+    db = tmp_path / "knowledge.db"
+
+    def build(rows):
+        jsonl = tmp_path / "chunks.jsonl"
+        with open(jsonl, "w", encoding="utf-8") as f:
+            for r in rows:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        build_knowledge_db.build(db, jsonl)
+        return db
+
+    return build
+
+
+class Runner:
+    def __init__(self, name):
+        self.name = name
+
+
+class Agent:
+    name = "tanya_dewi"
+    model = "primary-model"
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Modul server dengan runner palsu, session di memori dan state per test."""
+    from my_agent.app import server as S
+    from my_agent.app.session_service import BoundedSessionService
+
+    primary, fallback = Runner("primary"), Runner("fallback")
+    monkeypatch.setattr(S, "root_agent", Agent())
+    monkeypatch.setattr(S, "adk_runner", primary)
+    monkeypatch.setattr(S, "fallback_runner", fallback)
+    monkeypatch.setattr(S, "FALLBACK_MODEL", "fallback-model")
+    monkeypatch.setattr(S, "adk_session_service", BoundedSessionService())
+    monkeypatch.setattr(S, "breaker", CircuitBreaker(failure_threshold=3, cooldown_sec=30))
+    monkeypatch.setattr(S, "hedge_policy", HedgePolicy(initial_delay=0.05, min_samples=1000))
+    monkeypatch.setattr(S, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(S, "answer_cache", MemoryAnswerCache())
+    monkeypatch.setattr(S, "inflight", SingleFlight())
+    monkeypatch.setattr(S, "conversations", ConversationTracker())
+    return S
+
+
+@pytest.fixture
+def fake_runs(server, monkeypatch):
+    """Ganti _run_with_runner; behaviour: nama runner -> (delay detik, jawaban atau exception)."""
+
+    def install(behaviour):
+        calls = {"started": [], "cancelled": []}
+
+        async def run(runner, message, session_id, user_id, first_event=None):
+            calls["started"].append((runner.name, session_id))
+            delay, result = behaviour[runner.name]
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                calls["cancelled"].append(runner.name)
+                raise
+            if isinstance(result, Exception):
+                raise result
+            # Seperti runner ADK: turn ditulis ke session yang menjalankan model
+            await server._append_turn(session_id, user_id, message, result)
+            return result
+
+        monkeypatch.setattr(server, "_run_with_runner", run)
+        return calls
+
+    return install
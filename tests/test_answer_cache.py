@@ -0,0 +1,47 @@
+from my_agent.app import answer_cache as answer_mod
+from my_agent.app.answer_cache import answer_cache_key, make_answer_cache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_answer_cache_key_normalizes_question():
+    k1 = answer_cache_key("Resep sirup pala?", False, ["c1", "c2"], "m")
+    assert k1 == answer_cache_key("resep  SIRUP pala", False, ["c1", "c2"], "m")
+    assert k1 != answer_cache_key("resep sirup pala", False, ["c2", "c1"], "m")
+    assert k1 != answer_cache_key("resep sirup pala", True, ["c1", "c2"], "m")
+
+
+def test_sqlite_answer_cache_lru_and_age(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(answer_mod.time, "time", clock)
+    c = make_answer_cache("sqlite", tmp_path / "answers.db", max_entries=2, max_age_sec=100)
+
+    c.set("a", {"answer": "A"})
+    clock.now += 1
+    c.set("b", {"answer": "B"})
+    clock.now += 1
+    assert c.get("a") == {"answer": "A"}
+    clock.now += 1
+    c.set("c", {"answer": "C"})
+    # b paling lama tidak dipakai
+    assert c.get("b") is None
+    assert c.get("a") == {"answer": "A"}
+
+    clock.now += 101
+    assert c.get("c") is None
+
+
+def test_answer_cache_off():
+    assert make_answer_cache("off", "unused.db", 10, 10) is None
+
+
+def test_answer_cache_key_includes_model_and_generation():
+    k = answer_cache_key("resep sirup pala", False, ["c1"], "m", (1, 2, 3))
+    assert k != answer_cache_key("resep sirup pala", False, ["c1"], "fallback", (1, 2, 3))
+    assert k != answer_cache_key("resep sirup pala", False, ["c1"], "m", (1, 2, 4))
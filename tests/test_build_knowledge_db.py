@@ -0,0 +1,141 @@
+import json
+import sqlite3
+
+import pytest
+
+import build_knowledge_db as kdb
+
+
+def write_jsonl(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+
+def row(cid, text, category="Resep Olahan", source="Knowledge_Resep_Olahan_Buah_Pala_UMKM.pdf", page=1):
+    return {"id": cid, "text": text, "source": source, "page": page, "category": category, "section_title": None}
+
+
+def match(db, expr):
+    conn = sqlite3.connect(db)
+    try:
+        return sorted(
+            r[0]
+            for r in conn.execute(
+                "SELECT c.chunk_id FROM report_fts JOIN chunks c ON c.id = report_fts.rowid WHERE report_fts MATCH ?",
+                (expr,),
+            )
+        )
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return tmp_path / "knowledge.db", tmp_path / "chunks.jsonl"
+
+
+ROWS = [
+    row("c1", "Cara membuat sirup pala dengan gula pasir."),
+    row("c2", "Menjual manisan pala lewat marketplace.", category="Digital Marketing & Penjualan"),
+    row("c3", "Penentuan harga jual produk pala.", category="Penentuan Harga"),
+]
+
+
+def test_full_build_indexes_text_and_stems(paths):
+    db, jsonl = paths
+    write_jsonl(jsonl, ROWS)
+
+    stats = kdb.build(db, jsonl)
+
+    assert stats == {"total": 3, "upserted": 3, "deleted": 0, "unchanged": 0}
+    assert match(db, "sirup") == ["c1"]
+    # menjual / jual jatuh ke stem yang sama
+    assert match(db, 'stem : "jual"') == ["c2", "c3"]
+    assert not db.with_name(db.name + ".building").exists()
+
+
+def test_rebuild_without_changes_upserts_nothing(paths):
+    db, jsonl = paths
+    write_jsonl(jsonl, ROWS)
+    kdb.build(db, jsonl)
+
+    stats = kdb.build(db, jsonl)
+
+    assert stats == {"total": 3, "upserted": 0, "deleted": 0, "unchanged": 3}
+    assert match(db, "pala") == ["c1", "c2", "c3"]
+
+
+def test_incremental_build_updates_changed_and_removes_missing(paths):
+    db, jsonl = paths
+    write_jsonl(jsonl, ROWS)
+    kdb.build(db, jsonl)
+
+    changed = [
+        row("c1", "Cara membuat selai pala."),
+        ROWS[1],
+        row("c4", "Kemasan toples kaca.", category="Kemasan, Warna & Visual"),
+    ]
+    write_jsonl(jsonl, changed)
+    stats = kdb.build(db, jsonl)
+
+    assert stats == {"total": 3, "upserted": 2, "deleted": 1, "unchanged": 1}
+    # Index FTS ikut sinkron lewat trigger: teks lama hilang, teks baru ditemukan
+    assert match(db, "sirup") == []
+    assert match(db, "selai") == ["c1"]
+    assert match(db, "harga") == []
+    assert match(db, "toples") == ["c4"]
+
+    conn = sqlite3.connect(db)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0] == 3
+        assert conn.execute("SELECT category FROM chunks WHERE chunk_id = 'c4'").fetchone()[0] == "Kemasan, Warna & Visual"
+        indexes = {r[1] for r in conn.execute("PRAGMA index_list(chunks)")}
+        assert {"idx_chunks_category", "idx_chunks_source"} <= indexes
+    finally:
+        conn.close()
+
+
+def test_in_place_full_rebuild(paths):
+    db, jsonl = paths
+    write_jsonl(jsonl, ROWS)
+    kdb.build(db, jsonl, in_place=True)
+
+    write_jsonl(jsonl, ROWS[:1])
+    stats = kdb.build(db, jsonl, full=True, in_place=True)
+
+    assert stats["upserted"] == 1
+    assert match(db, "pala") == ["c1"]
+
+
+def test_legacy_layout_is_migrated(paths):
+    db, jsonl = paths
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE VIRTUAL TABLE report_fts USING fts5(chunk, source, page UNINDEXED, chunk_id UNINDEXED)")
+    conn.execute("INSERT INTO report_fts VALUES ('teks lama', 'x.pdf', 1, 'old')")
+    conn.commit()
+    conn.close()
+    write_jsonl(jsonl, ROWS)
+
+    stats = kdb.build(db, jsonl)
+
+    assert stats["upserted"] == 3
+    conn = sqlite3.connect(db)
+    try:
+        cols = [r[1] for r in conn.execute("PRAGMA table_info(report_fts)")]
+    finally:
+        conn.close()
+    assert cols == ["chunk", "stem"]
+    assert match(db, "lama") == []
+    assert match(db, "sirup") == ["c1"]
+
+
+def test_stemmer_change_triggers_upsert(paths, monkeypatch):
+    db, jsonl = paths
+    write_jsonl(jsonl, ROWS)
+    kdb.build(db, jsonl)
+
+    monkeypatch.setattr(kdb, "stem_text", lambda text: text.lower())
+    stats = kdb.build(db, jsonl)
+
+    assert stats["upserted"] == 3
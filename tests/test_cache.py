@@ -0,0 +1,47 @@
+import pytest
+
+from my_agent import cache as cache_mod
+from my_agent.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(cache_mod.time, "monotonic", c)
+    return c
+
+
+def test_ttl_cache_evicts_least_recently_used(clock):
+    c = TTLCache(max_size=2, ttl_sec=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expires_entries(clock):
+    c = TTLCache(max_size=10, ttl_sec=60)
+    c.set("a", 1)
+    clock.now += 59
+    assert c.get("a") == 1
+    clock.now += 1
+    assert c.get("a") is None
+    assert c.stats()["expirations"] == 1
+    assert len(c) == 0
+
+
+def test_ttl_cache_disabled_with_zero_size():
+    c = TTLCache(max_size=0)
+    c.set("a", 1)
+    assert c.get("a", "miss") == "miss"
@@ -0,0 +1,268 @@
+import asyncio
+import json
+
+import pytest
+
+HITS = [
+    {"chunk_id": "c1", "source": "a.pdf", "page": 1, "score": 3.0, "text": "Sirup pala dibuat dari daging buah pala."},
+    {"chunk_id": "c2", "source": "a.pdf", "page": 2, "score": 2.0, "text": "Gula pasir dimasak bersama sari pala."},
+]
+
+
+@pytest.fixture
+def chat(server, fake_runs, monkeypatch):
+    """server + _retrieve palsu; chat(message, session_id) memanggil endpoint /chat langsung."""
+    S = server
+    state = {"generation": (1, 1, 1), "results": HITS}
+
+    async def retrieve(msg, search=None):
+        if search is not None:
+            # /chat/batch: retrieval lewat SearchBatch, seperti _retrieve asli
+            await search(msg, k=S.GENERAL_K)
+        results = [dict(r) for r in state["results"]]
+        return False, {"query": msg, "results": results, "intent": None, "generation": state["generation"]}
+
+    monkeypatch.setattr(S, "_retrieve", retrieve)
+    S.calls = fake_runs({"primary": (0, "jawaban primary"), "fallback": (0, "jawaban fallback")})
+    S.state = state
+
+    def call(message, session_id, user_id=1):
+        return asyncio.run(S.chat(S.ChatRequest(session_id=session_id, user_id=user_id, message=message)))
+
+    S.call = call
+    return S
+
+
+def session_texts(S, session_id, user_id=1):
+    async def get():
+        return await S.adk_session_service.get_session(
+            app_name=S.ADK_APP_NAME, user_id=str(user_id), session_id=session_id
+        )
+
+    s = asyncio.run(get())
+    return [S._parts_text(e.content) for e in s.events] if s else []
+
+
+def test_cache_hit_adds_turn_to_session(chat):
+    S = chat
+    assert S.call("resep sirup pala", "a").meta["cache"] == "miss"
+
+    resp = S.call("resep sirup pala", "b")
+
+    assert resp.meta["cache"] == "hit"
+    assert len(S.calls["started"]) == 1
+    texts = session_texts(S, "b")
+    assert len(texts) == 2
+    assert "Pertanyaan user: resep sirup pala" in texts[0]
+    assert texts[1] == "jawaban primary"
+
+
+def test_fallback_answer_is_cached_under_fallback_model(chat):
+    S = chat
+    for _ in range(3):
+        S.breaker.record_failure()
+    assert S.call("resep sirup pala", "a").answer == "jawaban fallback"
+    # Breaker masih terbuka: request berikutnya memang ke fallback, jadi cache dipakai
+    assert S.call("resep sirup pala", "b").meta["cache"] == "hit"
+
+    S.breaker.state = "closed"
+    resp = S.call("resep sirup pala", "c")
+
+    assert resp.meta["cache"] == "miss"
+    assert resp.answer == "jawaban primary"
+
+
+def test_knowledge_db_rebuild_invalidates_answers(chat):
+    S = chat
+    S.call("resep sirup pala", "a")
+    S.state["generation"] = (2, 2, 2)
+
+    resp = S.call("resep sirup pala", "b")
+
+    assert resp.meta["cache"] == "miss"
+    assert len(S.calls["started"]) == 2
+
+
+def test_stream_cache_hit_adds_turn_to_session(chat):
+    S = chat
+    S.call("resep sirup pala", "a")
+
+    async def stream():
+        resp = await S.chat_stream(S.ChatRequest(session_id="b", user_id=1, message="resep sirup pala"))
+        return "".join([chunk async for chunk in resp.body_iterator])
+
+    body = asyncio.run(stream())
+
+    assert '"cache": "hit"' in body
+    assert session_texts(S, "b")[1] == "jawaban primary"
+
+
+def _concurrent(S, message, session_ids):
+    async def go():
+        reqs = [S.ChatRequest(session_id=sid, user_id=1, message=message) for sid in session_ids]
+        return await asyncio.gather(*(S.chat(r) for r in reqs))
+
+    return asyncio.run(go())
+
+
+def test_fresh_sessions_share_one_model_call(chat):
+    S = chat
+    S.answer_cache = None
+    resps = _concurrent(S, "resep sirup pala", ["a", "b"])
+    assert len(S.calls["started"]) == 1
+    assert sorted(r.meta["coalesced"] for r in resps) == [False, True]
+
+
+def test_sessions_with_history_do_not_share_model_call(chat):
+    S = chat
+    S.answer_cache = None
+    _concurrent(S, "resep sirup pala", ["a", "b"])
+    assert session_texts(S, "a")[0] == session_texts(S, "b")[0]
+
+    resps = _concurrent(S, "cara membuat manisan pala", ["a", "b"])
+
+    assert len(S.calls["started"]) == 3
+    assert [r.meta["coalesced"] for r in resps] == [False, False]
+
+
+def test_session_of_another_user_is_rejected(chat, tmp_path, monkeypatch):
+    from fastapi import HTTPException
+
+    from my_agent.app.session_service import make_session_service
+
+    S = chat
+    svc = make_session_service("sqlite", str(tmp_path / "chat.db"))
+    monkeypatch.setattr(S, "adk_session_service", svc)
+    S.call("resep sirup pala", "a", user_id=1)
+
+    with pytest.raises(HTTPException) as exc:
+        S.call("resep sirup pala", "a", user_id=2)
+
+    assert exc.value.status_code == 403
+    assert svc.store.count_messages("a") == 2
+    svc.store.close()
+
+
+LONG = {
+    "chunk_id": "c9",
+    "source": "b.pdf",
+    "page": 3,
+    "score": 1.0,
+    "text": "Sirup pala rasanya manis dan segar. Kemasan botol kaca menjaga aroma sirup. Harga jual sepuluh ribu rupiah.",
+}
+
+
+def test_trimmed_chunk_is_sent_again_on_next_turn(chat):
+    S = chat
+    S.state["results"] = [LONG]
+    S.call("kemasan botol", "a")
+    first = session_texts(S, "a")[0]
+    assert "Harga jual" not in first
+    assert "chunk_part=c9" in first and "chunk_id=c9" not in first
+
+    S.call("harga jual", "a")
+
+    second = session_texts(S, "a")[2]
+    assert "Harga jual sepuluh ribu rupiah." in second
+    assert "isi sama dengan chunk c9" not in second
+
+
+def test_whole_chunk_is_only_referenced_on_next_turn(chat):
+    S = chat
+    S.call("resep sirup pala", "a")
+    S.call("gula pasir sari pala", "a")
+
+    second = session_texts(S, "a")[2]
+    assert "isi sama dengan chunk c1" in second
+    assert "daging buah" not in second
+
+
+
+@pytest.fixture
+def batch(chat, monkeypatch):
+    """chat + search_many palsu; batch(messages) -> (baris per item urut index, baris ringkasan)."""
+    from my_agent import retrieval_tool
+
+    S = chat
+    S.search_passes = []
+
+    async def asearch_many(specs):
+        S.search_passes.append([spec["query"] for spec in specs])
+        return [{"query": spec["query"], "results": []} for spec in specs]
+
+    monkeypatch.setattr(retrieval_tool, "asearch_many", asearch_many)
+
+    def run(messages, **kwargs):
+        async def go():
+            items = [S.BatchItem(id=f"q{i}", message=m) for i, m in enumerate(messages)]
+            resp = await S.chat_batch(S.BatchRequest(user_id=1, items=items, **kwargs))
+            return [json.loads(line) async for line in resp.body_iterator]
+
+        lines = asyncio.run(go())
+        return sorted(lines[:-1], key=lambda r: r["index"]), lines[-1]
+
+    S.batch = run
+    return S
+
+
+def test_batch_retrieves_all_items_in_one_pass(batch):
+    S = batch
+    rows, done = S.batch(["resep sirup pala", "harga manisan", "promosi pala"], retrieval_only=True)
+
+    assert S.search_passes == [["resep sirup pala", "harga manisan", "promosi pala"]]
+    assert (done["search_batches"], done["searches"]) == (1, 3)
+    assert [r["id"] for r in rows] == ["q0", "q1", "q2"]
+    assert all(len(r["citations"]) == 2 and "answer" not in r for r in rows)
+    assert S.calls["started"] == []
+
+
+def test_batch_answers_each_item_and_deletes_its_session(batch):
+    S = batch
+    S.answer_cache = None
+    rows, done = S.batch(["resep sirup pala", "cara membuat manisan pala"])
+
+    assert [r["answer"] for r in rows] == ["jawaban primary", "jawaban primary"]
+    assert len(S.calls["started"]) == 2
+    assert done["items"] == 2 and done["errors"] == 0
+    # Session sementara batch-<id>-<i> sudah dihapus
+    assert S.adk_session_service.stats()["sessions"] == 0
+
+
+def test_batch_reports_empty_messages_without_failing_others(batch):
+    S = batch
+    rows, done = S.batch(["resep sirup pala", "  "])
+
+    assert rows[0]["answer"] == "jawaban primary"
+    assert rows[1] == {"index": 1, "id": "q1", "error": "empty message"}
+    assert done["errors"] == 1
+    assert done["searches"] == 1
+
+
+def test_batch_shares_answer_cache_with_chat(batch):
+    S = batch
+    S.call("resep sirup pala", "a")
+
+    rows, done = S.batch(["resep sirup pala"])
+
+    assert rows[0]["meta"]["cache"] == "hit"
+    assert done["cache_hits"] == 1
+    assert len(S.calls["started"]) == 1
+
+
+def test_batch_coalesces_identical_questions(batch):
+    S = batch
+    S.answer_cache = None
+    rows, _ = S.batch(["resep sirup pala", "resep sirup pala"])
+
+    assert len(S.calls["started"]) == 1
+    assert sorted(r["meta"]["coalesced"] for r in rows) == [False, True]
+
+
+def test_batch_rejects_too_many_items(batch, monkeypatch):
+    from fastapi import HTTPException
+
+    S = batch
+    monkeypatch.setattr(S, "BATCH_MAX_ITEMS", 1)
+    with pytest.raises(HTTPException) as exc:
+        S.batch(["a", "b"])
+    assert exc.value.status_code == 413
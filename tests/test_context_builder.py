@@ -0,0 +1,40 @@
+from my_agent.app.context_builder import SEEN_STUB, assemble_context, estimate_tokens
+
+
+def chunk(cid, words, score):
+    return {"chunk_id": cid, "source": "s.pdf", "page": 1, "text": " ".join(f"{w}{cid}" for w in words), "score": score}
+
+
+def test_assemble_context_respects_budget_and_order():
+    results = [chunk(str(i), ["kata"] * 200, 10 - i) for i in range(5)]
+    picked = assemble_context(results, "kata", token_budget=700, trim=False)
+    assert [p["chunk_id"] for p in picked] == ["0", "1", "2"]
+    assert sum(estimate_tokens(p["context_text"]) for p in picked) <= 700
+    assert picked[-1]["context_text"].endswith("...")
+
+
+def test_assemble_context_drops_near_duplicates():
+    a = {"chunk_id": "a", "source": "s", "page": 1, "score": 2, "text": " ".join(f"w{i}" for i in range(50))}
+    b = dict(a, chunk_id="b", score=1)
+    picked = assemble_context([a, b], "w1", token_budget=1000, trim=False)
+    assert [p["chunk_id"] for p in picked] == ["a"]
+
+
+def test_assemble_context_counts_seen_chunks_as_stubs():
+    results = [chunk(str(i), ["kata"] * 200, 10 - i) for i in range(5)]
+    without = assemble_context(results, "kata", token_budget=1100, trim=False)
+    with_seen = assemble_context(results, "kata", token_budget=1100, trim=False, seen={"0", "1"})
+    assert len(with_seen) > len(without)
+    assert [p["context_text"] for p in with_seen[:2]] == ["", ""]
+    assert "chunk_id=" not in SEEN_STUB
+
+
+def test_assemble_context_marks_trimmed_and_truncated_chunks():
+    text = "Sirup pala manis. Kemasan botol kaca. Harga jual sepuluh ribu."
+    r = {"chunk_id": "a", "source": "s", "page": 1, "score": 1, "text": text}
+    assert assemble_context([r], "kemasan", token_budget=1000)[0]["partial"]
+    assert not assemble_context([r], "kemasan", token_budget=1000, trim=False)[0]["partial"]
+
+    long = chunk("x", ["kata"] * 400, 1)
+    picked = assemble_context([long], "kata", token_budget=300, trim=False)
+    assert picked[0]["partial"] and picked[0]["context_text"].endswith("...")
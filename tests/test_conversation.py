@@ -0,0 +1,54 @@
+import pytest
+
+from my_agent.app.context_builder import CHUNK_HEADER, PARTIAL_CHUNK_HEADER, SEEN_STUB
+from my_agent.app.conversation import ConversationTracker, seen_chunk_ids
+
+
+def test_seen_chunk_ids_reads_reference_headers():
+    prompt = "\n\n".join([
+        CHUNK_HEADER.format(i=1, source="a", page=1, chunk_id="x1") + "\nisi",
+        SEEN_STUB.format(i=2, source="a", page=1, chunk_id="x2"),
+        PARTIAL_CHUNK_HEADER.format(i=3, source="a", page=1, chunk_id="x3") + "\nsebagian isi",
+    ])
+    assert seen_chunk_ids([prompt]) == {"x1"}
+
+
+STATE = {"query": "resep sirup pala", "results": [{"chunk_id": "a"}, {"chunk_id": "b"}], "category": None}
+
+
+@pytest.mark.parametrize("message", [
+    "berapa harganya?",
+    "apa itu hpp",
+    "yg bagus kemasan apa",
+    "dua sendok gula untuk apa",
+    "cara jualan lagi di shopee no ribet",
+    "tadi kamu bilang pakai gula pasir atau gula aren ya kak",
+])
+def test_new_questions_are_not_followups(message):
+    r = ConversationTracker().resolve(message, STATE, [])
+    assert not r.followup
+    assert r.query == message
+
+
+@pytest.mark.parametrize("message, focus", [
+    ("yang kedua gimana?", ["b"]),
+    ("nomor 1", ["a"]),
+    ("yang terakhir", ["b"]),
+    ("lanjut", []),
+    ("tadi bahannya apa aja", []),
+])
+def test_explicit_references_are_followups(message, focus):
+    r = ConversationTracker().resolve(message, STATE, [])
+    assert r.followup
+    assert r.query.startswith("resep sirup pala")
+    assert [f["chunk_id"] for f in r.focus] == focus
+
+
+def test_followup_falls_back_to_history_without_state():
+    class Msg:
+        def __init__(self, role, content):
+            self.role, self.content = role, content
+
+    r = ConversationTracker().resolve("lanjut", None, [Msg("user", "harga jual pala"), Msg("assistant", "...")])
+    assert r.followup and r.query == "harga jual pala"
+    assert not ConversationTracker().resolve("lanjut", None, []).followup
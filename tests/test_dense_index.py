@@ -0,0 +1,111 @@
+import json
+
+import pytest
+
+from my_agent import dense_index
+from my_agent.dense_index import DenseIndex, get_dense_index, reciprocal_rank_fusion
+
+np = pytest.importorskip("numpy")
+
+IDS = ["c1", "c2", "c3"]
+# Vektor satuan (sudah dinormalisasi L2), seperti keluaran build_dense_index.py
+MATRIX = np.array([[1.0, 0.0], [0.6, 0.8], [0.0, 1.0]], dtype=np.float32)
+
+
+def write_index(path, matrix=MATRIX, ids=IDS, model="m", int8=False):
+    dtype = "float32"
+    if int8:
+        scale = np.abs(matrix).max(axis=1) / 127.0
+        matrix = np.round(matrix / scale[:, None]).astype(np.int8)
+        np.save(path / dense_index.SCALE_FILE, scale.astype(np.float32))
+        dtype = "int8"
+    np.save(path / dense_index.MATRIX_FILE, matrix)
+    meta = {"model": model, "dtype": dtype, "chunk_ids": ids}
+    (path / dense_index.IDS_FILE).write_text(json.dumps(meta), encoding="utf-8")
+
+
+@pytest.fixture
+def open_index(monkeypatch):
+    """DenseIndex tanpa sentence-transformers (encoder tidak dipakai di search_vectors)."""
+
+    def open_(path):
+        with monkeypatch.context() as m:
+            m.setattr(dense_index.importlib.util, "find_spec", lambda name: object())
+            return DenseIndex(path)
+
+    return open_
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], rrf_k=60)
+    assert fused["a"] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused["c"] == pytest.approx(1 / 63 + 1 / 61)
+    assert fused["b"] == pytest.approx(1 / 62)
+    assert sorted(fused, key=fused.get, reverse=True) == ["a", "c", "b"]
+
+
+def test_rrf_of_no_rankings_is_empty():
+    assert reciprocal_rank_fusion([[], []]) == {}
+
+
+@pytest.mark.parametrize("int8", [False, True])
+def test_search_vectors_returns_top_k_per_query(tmp_path, open_index, int8):
+    write_index(tmp_path, int8=int8)
+    index = open_index(tmp_path)
+    q = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+
+    top = index.search_vectors(q, 2)
+
+    assert [[cid for cid, _ in row] for row in top] == [["c1", "c2"], ["c3", "c2"]]
+    assert top[0][0][1] == pytest.approx(1.0, abs=0.01)
+    assert len(index.search_vectors(q, 10)[0]) == 3
+
+
+def test_mismatched_side_table_is_rejected(tmp_path, open_index):
+    write_index(tmp_path, ids=IDS[:2])
+    with pytest.raises(ValueError):
+        open_index(tmp_path)
+
+
+@pytest.fixture
+def loader(tmp_path, monkeypatch):
+    monkeypatch.setattr(dense_index, "DENSE_DIR", tmp_path)
+    monkeypatch.setattr(dense_index, "DENSE_ENABLED", "auto")
+    monkeypatch.setattr(dense_index, "_dense", None)
+    monkeypatch.setattr(dense_index, "_dense_generation", None)
+    monkeypatch.setattr(dense_index, "_dense_loaded", False)
+    return tmp_path
+
+
+def test_missing_index_disables_dense(loader):
+    assert get_dense_index() is None
+
+
+def test_missing_dependency_disables_dense(loader, monkeypatch):
+    write_index(loader)
+    monkeypatch.setattr(dense_index.importlib.util, "find_spec", lambda name: None)
+    assert get_dense_index() is None
+
+
+def test_off_never_loads(loader, open_index, monkeypatch):
+    write_index(loader)
+    monkeypatch.setattr(dense_index, "DENSE_ENABLED", "off")
+    monkeypatch.setattr(dense_index, "DenseIndex", open_index)
+    assert get_dense_index() is None
+
+
+def test_rebuilt_index_is_reloaded_and_keeps_encoder(loader, open_index, monkeypatch):
+    monkeypatch.setattr(dense_index, "DenseIndex", open_index)
+    write_index(loader)
+    first = get_dense_index()
+    assert get_dense_index() is first
+    first._model = encoder = object()
+
+    write_index(loader, ids=["x10", "x20", "x30"])
+    second = get_dense_index()
+
+    assert second is not first and second.chunk_ids == ["x10", "x20", "x30"]
+    assert second._model is encoder
+
+    write_index(loader, ids=["y1", "y2", "y3"], model="lain")
+    assert get_dense_index()._model is None
@@ -0,0 +1,305 @@
+import asyncio
+
+import pytest
+
+from my_agent.app import hedging
+from my_agent.app.hedging import CircuitBreaker, HedgePolicy, LatencyTracker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(hedging.time, "monotonic", c)
+    return c
+
+
+def test_latency_tracker_percentile():
+    t = LatencyTracker(window=100)
+    assert t.percentile(95) is None
+    for i in range(1, 101):
+        t.observe(i / 100)
+    assert t.percentile(50) == 0.5
+    assert t.percentile(95) == 0.95
+    assert t.percentile(100) == 1.0
+
+
+def test_latency_tracker_window_drops_old_samples():
+    t = LatencyTracker(window=3)
+    for x in (10, 1, 2, 3):
+        t.observe(x)
+    assert len(t) == 3
+    assert t.percentile(100) == 3
+
+
+def test_hedge_delay_uses_initial_until_enough_samples():
+    p = HedgePolicy(percentile=95, min_delay=1, max_delay=10, initial_delay=8, min_samples=5)
+    for _ in range(4):
+        p.first_event.observe(0.1)
+    assert p.delay() == 8
+    p.first_event.observe(0.1)
+    # p95 = 0.1, dijepit ke min_delay
+    assert p.delay() == 1
+
+
+def test_hedge_delay_clamped_to_max():
+    p = HedgePolicy(percentile=95, min_delay=1, max_delay=10, initial_delay=8, min_samples=1)
+    p.first_event.observe(60)
+    assert p.delay() == 10
+
+
+def test_breaker_opens_after_threshold(clock):
+    b = CircuitBreaker(failure_threshold=3, cooldown_sec=30)
+    for _ in range(2):
+        b.record_failure()
+        assert b.state == "closed"
+    b.record_failure()
+    assert b.state == "open"
+    assert b.trips == 1
+    assert not b.allow_primary()
+
+
+def test_breaker_success_resets_failures(clock):
+    b = CircuitBreaker(failure_threshold=2, cooldown_sec=30)
+    b.record_failure()
+    b.record_success()
+    b.record_failure()
+    assert b.state == "closed"
+
+
+def test_breaker_half_open_allows_single_trial(clock):
+    b = CircuitBreaker(failure_threshold=1, cooldown_sec=30)
+    b.record_failure()
+    clock.now += 29
+    assert not b.allow_primary()
+    clock.now += 1
+    assert b.allow_primary()
+    assert b.state == "half_open"
+    # Percobaan sedang jalan: request lain tetap ke fallback
+    assert not b.allow_primary()
+
+
+def test_breaker_half_open_success_closes(clock):
+    b = CircuitBreaker(failure_threshold=1, cooldown_sec=30)
+    b.record_failure()
+    clock.now += 30
+    assert b.allow_primary()
+    b.record_success()
+    assert b.state == "closed"
+    assert b.allow_primary()
+
+
+def test_breaker_half_open_failure_reopens(clock):
+    b = CircuitBreaker(failure_threshold=3, cooldown_sec=30)
+    for _ in range(3):
+        b.record_failure()
+    clock.now += 30
+    assert b.allow_primary()
+    b.record_failure()
+    assert b.state == "open"
+    assert b.trips == 2
+    assert b.opened_at == clock.now
+
+
+def test_breaker_release_trial_reopens_with_new_cooldown(clock):
+    b = CircuitBreaker(failure_threshold=1, cooldown_sec=30)
+    b.record_failure()
+    clock.now += 30
+    assert b.allow_primary()
+    b.release_trial()
+    assert b.state == "open"
+    assert not b.allow_primary()
+    clock.now += 30
+    assert b.allow_primary()
+
+
+def test_breaker_release_trial_is_noop_when_closed(clock):
+    b = CircuitBreaker()
+    b.release_trial()
+    assert b.state == "closed"
+
+
+def test_breaker_ignores_late_success_while_open(clock):
+    b = CircuitBreaker(failure_threshold=1, cooldown_sec=30)
+    b.record_failure()
+    b.record_success()
+    assert b.state == "open"
+
+
+# ===== server: hedging + breaker di call_agent_async / stream_agent_async =====
+
+def _sessions(S):
+    return {
+        sid
+        for users in S.adk_session_service.sessions.values()
+        for user_sessions in users.values()
+        for sid in user_sessions
+    }
+
+
+def test_hedge_fallback_wins_and_primary_is_cancelled(server, fake_runs):
+    S = server
+    calls = fake_runs({"primary": (5, "slow"), "fallback": (0.01, "fast")})
+
+    async def go():
+        await S._ensure_adk_session("s1", 1)
+        return await S.call_agent_async("q", "s1", 1)
+
+    assert asyncio.run(go()) == "fast"
+    assert calls["cancelled"] == ["primary"]
+    assert calls["started"][1][1].startswith("s1::hedge-")
+    # Session hedge diadopsi lalu dihapus
+    assert _sessions(S) == {"s1"}
+    # Kalah cepat bukan kegagalan primary
+    assert S.breaker.failures == 0
+
+
+def test_lost_races_do_not_open_breaker(server, fake_runs):
+    S = server
+    fake_runs({"primary": (5, "slow"), "fallback": (0.01, "fast")})
+    served = {}
+
+    for _ in range(S.breaker.failure_threshold + 1):
+        assert asyncio.run(S.call_agent_async("q", "s1", 1, served)) == "fast"
+
+    assert S.breaker.state == "closed"
+    assert served == {"model": "fallback-model"}
+
+
+def test_primary_error_during_hedge_counts_as_failure(server, fake_runs):
+    S = server
+    fake_runs({"primary": (0.1, RuntimeError("boom")), "fallback": (0.2, "fast")})
+    assert asyncio.run(S.call_agent_async("q", "s1", 1)) == "fast"
+    assert S.breaker.failures == 1
+
+
+def test_stalled_primary_counts_as_failure(server, fake_runs, monkeypatch):
+    S = server
+    monkeypatch.setattr(S, "HEDGE_MAX_DELAY_SEC", 0.1)
+    fake_runs({"primary": (5, "slow"), "fallback": (0.1, "fast")})
+    assert asyncio.run(S.call_agent_async("q", "s1", 1)) == "fast"
+    assert S.breaker.failures == 1
+
+
+def test_hedge_primary_wins_and_hedge_session_is_deleted(server, fake_runs):
+    S = server
+    calls = fake_runs({"primary": (0.2, "primary"), "fallback": (5, "fallback")})
+
+    async def go():
+        await S._ensure_adk_session("s1", 1)
+        return await S.call_agent_async("q", "s1", 1)
+
+    assert asyncio.run(go()) == "primary"
+    assert calls["cancelled"] == ["fallback"]
+    assert _sessions(S) == {"s1"}
+    assert S.breaker.state == "closed" and S.breaker.failures == 0
+
+
+def test_no_hedge_when_primary_is_fast(server, fake_runs):
+    S = server
+    calls = fake_runs({"primary": (0, "primary"), "fallback": (0, "fallback")})
+    assert asyncio.run(S.call_agent_async("q", "s1", 1)) == "primary"
+    assert [name for name, _ in calls["started"]] == ["primary"]
+
+
+def test_open_breaker_goes_straight_to_fallback(server, fake_runs):
+    S = server
+    calls = fake_runs({"primary": (0, "primary"), "fallback": (0, "fallback")})
+    for _ in range(3):
+        S.breaker.record_failure()
+    assert asyncio.run(S.call_agent_async("q", "s1", 1)) == "fallback"
+    assert [name for name, _ in calls["started"]] == ["fallback"]
+
+
+def _half_open(S):
+    S.breaker.state = "open"
+    S.breaker.opened_at = 0.0
+
+
+def test_chat_timeout_releases_half_open_trial(server, fake_runs, monkeypatch):
+    S = server
+    monkeypatch.setattr(S, "HEDGE_ENABLED", False)
+    fake_runs({"primary": (5, "slow"), "fallback": (0, "fallback")})
+    _half_open(S)
+
+    async def go():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(S.call_agent_async("q", "s1", 1), timeout=0.05)
+
+    asyncio.run(go())
+    assert S.breaker.state == "open"
+
+
+def test_session_not_found_retry_records_success(server, monkeypatch):
+    S = server
+    monkeypatch.setattr(S, "HEDGE_ENABLED", False)
+    attempts = []
+
+    async def run(runner, message, session_id, user_id, first_event=None):
+        attempts.append(runner.name)
+        if len(attempts) == 1:
+            raise ValueError(f"Session not found: {session_id}")
+        return "ok"
+
+    monkeypatch.setattr(S, "_run_with_runner", run)
+    _half_open(S)
+    assert asyncio.run(S.call_agent_async("q", "s1", 1)) == "ok"
+    assert attempts == ["primary", "primary"]
+    assert S.breaker.state == "closed"
+
+
+def _fake_stream(S, monkeypatch, delay):
+    async def stream(runner, message, session_id, user_id):
+        yield "a"
+        await asyncio.sleep(delay)
+        yield "b"
+
+    monkeypatch.setattr(S, "_stream_with_runner", stream)
+
+
+def test_stream_timeout_releases_half_open_trial(server, monkeypatch):
+    S = server
+    _fake_stream(S, monkeypatch, 5)
+    _half_open(S)
+
+    async def go():
+        with pytest.raises(TimeoutError):
+            async with asyncio.timeout(0.05):
+                async for _ in S.stream_agent_async("q", "s1", 1):
+                    pass
+
+    asyncio.run(go())
+    assert S.breaker.state == "open"
+
+
+def test_stream_disconnect_releases_half_open_trial(server, monkeypatch):
+    S = server
+    _fake_stream(S, monkeypatch, 5)
+    _half_open(S)
+
+    async def go():
+        gen = S.stream_agent_async("q", "s1", 1)
+        assert await gen.__anext__() == "a"
+        await gen.aclose()
+
+    asyncio.run(go())
+    assert S.breaker.state == "open"
+
+
+def test_stream_success_closes_half_open_breaker(server, monkeypatch):
+    S = server
+    _fake_stream(S, monkeypatch, 0)
+    _half_open(S)
+
+    async def go():
+        return [d async for d in S.stream_agent_async("q", "s1", 1)]
+
+    assert asyncio.run(go()) == ["a", "b"]
+    assert S.breaker.state == "closed"
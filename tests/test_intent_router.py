@@ -0,0 +1,25 @@
+from my_agent.intent_router import IntentRouter, get_router
+
+
+def test_router_matches_whole_tokens_only():
+    router = IntentRouter({"Resep Olahan": {"gr": 3}})
+    assert router.route("program jualan").category is None
+    assert router.route("berapa gr gula").category == "Resep Olahan"
+
+
+def test_router_needs_margin_over_runner_up():
+    router = IntentRouter({"A": {"harga": 3}, "B": {"kemasan": 3}}, min_score=2, min_margin=1)
+    assert router.route("harga kemasan").category is None
+    assert router.route("harga").category == "A"
+
+
+def test_router_prefers_longest_phrase():
+    router = IntentRouter({"A": {"harga": 2}, "B": {"harga jual": 3}}, min_score=2, min_margin=1)
+    assert router.scores("harga jual sirup") == {"B": 3.0}
+
+
+def test_default_router_categories():
+    router = get_router()
+    assert router.route("resep sirup pala").is_recipe
+    assert router.route("cara hitung hpp sirup pala").category == "Penentuan Harga"
+    assert router.route("halo").category is None
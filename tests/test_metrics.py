@@ -0,0 +1,20 @@
+import pytest
+
+from my_agent import metrics
+
+
+def test_timer_records_stage_and_labels():
+    with metrics.timer("test_stage", runner="primary"):
+        pass
+    out = metrics.render()
+    assert 'tanya_dewi_stage_seconds_count{runner="primary",stage="test_stage"} 1' in out
+
+
+def test_inc_and_observe_use_registered_names():
+    metrics.inc("tanya_dewi_fallback_switch_total", reason="test")
+    metrics.observe("tanya_dewi_query_variants", 3)
+    out = metrics.render({"tanya_dewi_test_gauge": 2})
+    assert 'tanya_dewi_fallback_switch_total{reason="test"} 1' in out
+    assert "# TYPE tanya_dewi_test_gauge gauge\ntanya_dewi_test_gauge 2" in out
+    with pytest.raises(KeyError):
+        metrics.inc("fallback_switch_total")
@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+from my_agent.query_normalizer import QueryNormalizer, get_normalizer
+from my_agent.stemmer import stem
+
+ABBR = {"fb": "facebook", "hpp": "harga pokok produksi", "tik tok": "tiktok"}
+SYN = [["jualan", "berjualan", "menjual"], ["tiktok", "tik tok"], ["promosi", "pemasaran"], ["pemasaran", "marketing"]]
+
+
+@pytest.fixture
+def qn():
+    return QueryNormalizer(ABBR, SYN)
+
+
+def test_slots_expand_abbreviations_and_synonyms(qn):
+    assert qn.slots("Jualan di FB?") == [("jualan", "berjualan", "menjual"), ("di",), ("facebook",)]
+
+
+def test_slots_prefer_longest_match(qn):
+    # "tik tok" (2 token) menang atas token "tik" saja
+    assert qn.slots("promosi tik tok") == [("promosi", "pemasaran"), ("tiktok", "tik tok")]
+
+
+def test_words_in_several_groups_merge_alternatives(qn):
+    assert qn.slots("pemasaran") == [("promosi", "pemasaran", "marketing")]
+
+
+def test_variants_swap_one_alternative_at_a_time(qn):
+    slots = qn.slots("jualan fb")
+    assert qn.variants(slots) == ["jualan facebook", "berjualan facebook", "menjual facebook"]
+    assert qn.variants(slots, limit=2) == ["jualan facebook", "berjualan facebook"]
+    assert qn.variants([]) == []
+
+
+def test_match_expression_ands_slots_and_ors_alternatives(qn):
+    assert qn.match_expression(qn.slots("jualan fb")) == '("jualan" OR "berjualan" OR "menjual") AND "facebook"'
+
+
+def test_stemmed_expression_collapses_same_stem(qn):
+    expr = qn.match_expression(qn.slots("jualan fb"), stemmed=True)
+    assert expr == f'stem : ("{stem("jualan")}" AND "facebook")'
+
+
+def test_expressions_are_none_without_terms(qn):
+    assert qn.match_expression(qn.slots("?!")) is None
+    assert qn.fallback_expression(qn.slots("di ke")) is None
+
+
+def test_fallback_expression_uses_prefixes_of_long_terms(qn):
+    assert qn.fallback_expression(qn.slots("hpp di")) == '"harga"* OR "pokok"* OR "produksi"*'
+
+
+@pytest.mark.parametrize("query", ['resep "sirup', "harga OR NOT", "gula (aren) -pasir*", "a:b ^c"])
+def test_expressions_are_valid_fts5_for_hostile_input(qn, query):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE VIRTUAL TABLE t USING fts5(chunk, stem)")
+    conn.execute("INSERT INTO t VALUES ('resep sirup harga gula aren', 'resep sirup harga gula aren')")
+    slots = qn.slots(query)
+    for expr in (
+        qn.match_expression(slots),
+        qn.match_expression(slots, stemmed=True),
+        qn.fallback_expression(slots),
+        qn.fallback_expression(slots, stemmed=True),
+    ):
+        if expr:
+            conn.execute("SELECT rowid FROM t WHERE t MATCH ?", (expr,)).fetchall()
+
+
+def test_default_lexicon_loads():
+    assert get_normalizer().slots("ig") == [("instagram",)]
@@ -0,0 +1,118 @@
+import sqlite3
+import threading
+
+import pytest
+
+from my_agent import retrieval_engine
+from my_agent.retrieval_engine import RetrievalEngine
+from tests.conftest import chunk
+
+ROWS = [
+    chunk("c1", "Cara membuat sirup pala dengan gula pasir."),
+    chunk("c2", "Menjual manisan pala lewat marketplace.", category="Digital Marketing & Penjualan"),
+]
+
+
+@pytest.fixture
+def engine(knowledge_db):
+    e = RetrievalEngine(knowledge_db(ROWS), pool_size=2)
+    yield e
+    e.close()
+
+
+def test_schema_is_discovered_once(engine):
+    assert engine.has_meta_table and engine.has_stem
+    assert engine.select_cols == ["chunk", "source", "page", "category", "section_title", "fr_number", "chunk_id"]
+    assert engine.supports_category()
+
+
+def test_connections_are_reused(engine):
+    with engine.connection() as a:
+        pass
+    with engine.connection() as b:
+        pass
+    assert a is b
+    assert engine._opened == 1
+
+
+def test_pool_never_opens_more_than_pool_size(engine):
+    with engine.connection() as a, engine.connection() as b:
+        assert a is not b
+        got = []
+        t = threading.Thread(target=lambda: got.append(engine.connection().__enter__()))
+        t.start()
+        t.join(0.1)
+        # Pool penuh: thread ketiga menunggu koneksi dikembalikan
+        assert t.is_alive() and not got
+    t.join(1)
+    assert got[0] in (a, b)
+    assert engine._opened == 2
+
+
+def test_connections_are_read_only(engine):
+    with engine.connection() as conn, pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM chunks")
+
+
+def test_pinned_uses_one_connection_for_the_block(engine):
+    with engine.pinned() as p:
+        with engine.connection() as a, engine.connection() as b:
+            assert a is p and b is p
+    assert engine._local.conn is None
+
+
+def test_match_filters_by_category(engine):
+    with engine.connection() as conn:
+        rows = engine.match(conn, "pala", 5)
+        assert len(rows) == 2
+        rows = engine.match(conn, "pala", 5, category="Resep Olahan")
+    idx = engine.select_cols.index("chunk_id")
+    assert [r[idx] for r in rows] == ["c1"]
+
+
+def test_search_tiers_stops_at_first_tier_with_rows(engine):
+    rows = engine.search_tiers(['"tidakada"', '"sirup"', '"pala"'], 5)
+    idx = engine.select_cols.index("chunk_id")
+    assert [r[idx] for r in rows] == ["c1"]
+    # Ekspresi kosong dan sintaks FTS5 rusak dilewati
+    assert engine.search_tiers([None, '"sirup', '"manisan"'], 5)[0][idx] == "c2"
+
+
+def test_fetch_by_chunk_ids_keeps_requested_order(engine):
+    idx = engine.select_cols.index("chunk_id")
+    rows = engine.fetch_by_chunk_ids(["c2", "c1", "missing"])
+    assert [r[idx] for r in rows] == ["c2", "c1"]
+    assert [r[idx] for r in engine.fetch_by_chunk_ids(["c2", "c1"], category="Resep Olahan")] == ["c1"]
+
+
+def test_close_closes_returned_connections(engine):
+    with engine.connection() as conn:
+        engine.close()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+
+
+def test_rebuild_marks_engine_stale(knowledge_db, engine):
+    assert not engine.is_stale()
+    knowledge_db(ROWS + [chunk("c3", "Penentuan harga jual produk pala.")])
+    assert engine.is_stale()
+
+
+def test_get_engine_reopens_after_rebuild(knowledge_db, monkeypatch):
+    db = knowledge_db(ROWS)
+    monkeypatch.setattr(retrieval_engine, "DB_PATH", db)
+    monkeypatch.setattr(retrieval_engine, "_engine", None)
+
+    old = retrieval_engine.get_engine()
+    assert retrieval_engine.get_engine() is old
+    with old.connection():
+        pass
+
+    knowledge_db(ROWS + [chunk("c3", "Penentuan harga jual produk pala.")])
+    new = retrieval_engine.get_engine()
+
+    assert new is not old and new.generation != old.generation
+    assert old._closed and old._opened == 0
+    assert len(new.fetch_by_chunk_ids(["c3"])) == 1
+    new.close()
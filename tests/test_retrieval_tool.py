@@ -0,0 +1,246 @@
+import asyncio
+
+import pytest
+
+from my_agent import dense_index, retrieval_engine, retrieval_tool
+from my_agent.cache import TTLCache
+from my_agent.retrieval_engine import RetrievalEngine
+from tests.conftest import chunk
+
+ROWS = [
+    chunk("c1", "Cara membuat sirup pala dengan gula pasir."),
+    chunk("c2", "Menjual manisan pala lewat marketplace.", category="Digital Marketing & Penjualan"),
+    chunk("c3", "Sirup pala dijual dalam botol kaca.", category="Digital Marketing & Penjualan"),
+]
+
+
+@pytest.fixture
+def search(knowledge_db, monkeypatch):
+    """search_report atas knowledge.db sementara; search.matches = ekspresi MATCH yang dijalankan."""
+    db = knowledge_db(ROWS)
+    monkeypatch.setattr(retrieval_engine, "DB_PATH", db)
+    monkeypatch.setattr(retrieval_tool, "DB_PATH", db)
+    monkeypatch.setattr(retrieval_engine, "_engine", None)
+    monkeypatch.setattr(retrieval_tool, "_result_cache", TTLCache())
+    monkeypatch.setattr(retrieval_tool, "RETRIEVAL_MODE", "single")
+    monkeypatch.setattr(dense_index, "DENSE_ENABLED", "off")
+
+    matches = []
+    match = RetrievalEngine.match
+
+    def counting_match(self, conn, q, *args, **kwargs):
+        matches.append(q)
+        return match(self, conn, q, *args, **kwargs)
+
+    monkeypatch.setattr(RetrievalEngine, "match", counting_match)
+
+    def run(query, **kwargs):
+        return retrieval_tool.search_report(query, **kwargs)
+
+    run.matches = matches
+    run.db = db
+    yield run
+    if retrieval_engine._engine is not None:
+        retrieval_engine._engine.close()
+
+
+def ids(out):
+    return [r["chunk_id"] for r in out["results"]]
+
+
+def test_tier_one_ands_slots_in_one_statement(search):
+    out = search("resep sirup gula")
+
+    assert ids(out) == ["c1"]
+    assert len(search.matches) == 1
+    assert out["results"][0]["score"] == 1.0
+
+
+def test_tier_two_runs_only_when_tier_one_is_empty(search):
+    out = search("sirup marketplace")
+
+    assert sorted(ids(out)) == ["c1", "c2", "c3"]
+    assert len(search.matches) == 2
+    assert " AND " in search.matches[0] and " OR " in search.matches[1]
+
+
+def test_stemmed_terms_match_other_word_forms(search):
+    # "jualan" tidak ada di teks; "menjual" / "dijual" cocok lewat kolom stem
+    assert sorted(ids(search("jualan pala"))) == ["c2", "c3"]
+
+
+def test_category_filter_runs_in_sql(search):
+    assert ids(search("sirup pala", category="Resep Olahan")) == ["c1"]
+    assert ids(search("sirup pala", category="Penentuan Harga")) == []
+
+
+def test_results_are_capped_at_k(search):
+    out = search("pala", k=2)
+    assert len(out["results"]) == 2
+    assert out["results"][0]["score"] >= out["results"][1]["score"]
+
+
+def test_multi_mode_runs_one_statement_per_variant(search, monkeypatch):
+    monkeypatch.setattr(retrieval_tool, "RETRIEVAL_MODE", "multi")
+    variants = retrieval_tool._expand_queries("jualan pala")
+
+    search("jualan pala")
+
+    assert len(search.matches) == len(variants) > 1
+
+
+def test_repeated_query_is_served_from_cache(search):
+    first = search("sirup gula")
+    second = search("sirup gula")
+
+    assert second == first
+    assert len(search.matches) == 1
+    assert retrieval_tool.search_cache_stats()["hits"] == 1
+
+
+def test_cache_key_uses_cleaned_query(search):
+    search("sirup gula")
+    # "resep" dan "cara" stopword: query bersihnya sama
+    search("Resep cara sirup gula?")
+    assert len(search.matches) == 1
+
+
+def test_cache_key_includes_filters_and_k(search):
+    search("sirup pala")
+    search("sirup pala", k=2)
+    search("sirup pala", category="Resep Olahan")
+    search("sirup pala", source_like="Knowledge%")
+    assert len(search.matches) == 4
+
+
+def test_cached_result_is_not_shared_with_caller(search):
+    out = search("sirup gula")
+    out["results"][0]["text"] = "diubah"
+    out["results"].clear()
+
+    again = search("sirup gula")
+
+    assert ids(again) == ["c1"]
+    assert again["results"][0]["text"].startswith("Cara membuat")
+
+
+def test_rebuild_of_knowledge_db_misses_cache(search, knowledge_db):
+    assert ids(search("botol kaca")) == ["c3"]
+
+    knowledge_db([r for r in ROWS if r["id"] != "c3"] + [chunk("c4", "Botol kaca untuk sirup.")])
+
+    assert ids(search("botol kaca")) == ["c4"]
+    assert len(search.matches) == 2
+
+
+class FakeDense:
+    """Pengganti DenseIndex: hasil search tetap, tanpa model embedding."""
+
+    def __init__(self, hits, generation=("dense", 1)):
+        self.hits = hits
+        self.generation = generation
+        self.queries = []
+
+    def search(self, query, k):
+        self.queries.append((query, k))
+        if isinstance(self.hits, Exception):
+            raise self.hits
+        return self.hits[:k]
+
+
+@pytest.fixture
+def dense(search, monkeypatch):
+    def install(hits, **kwargs):
+        d = FakeDense(hits, **kwargs)
+        monkeypatch.setattr(retrieval_tool, "get_dense_index", lambda: d)
+        return d
+
+    return install
+
+
+def test_dense_hits_are_fused_with_bm25(search, dense):
+    dense([("c3", 0.9), ("c1", 0.8)])
+
+    out = search("sirup gula")
+
+    # c1: rank 1 di bm25 + rank 2 di dense; c3 hanya dari dense
+    assert ids(out) == ["c1", "c3"]
+    assert out["results"][0]["score"] == 1.0
+    assert out["results"][1]["bm25"] is None
+
+
+def test_dense_hits_respect_category_filter(search, dense):
+    d = dense([("c3", 0.9), ("c1", 0.8)])
+
+    out = search("sirup gula", k=5, category="Resep Olahan")
+
+    assert ids(out) == ["c1"]
+    # Kandidat dense dilebihkan karena sebagian tersaring filter
+    assert d.queries == [("sirup gula", 15)]
+
+
+def test_dense_failure_falls_back_to_bm25(search, dense):
+    dense(RuntimeError("encoder down"))
+    assert ids(search("sirup gula")) == ["c1"]
+
+
+def test_dense_limits_lexical_variants(search, dense, monkeypatch):
+    monkeypatch.setattr(retrieval_tool, "RETRIEVAL_MODE", "multi")
+    dense([])
+    assert len(retrieval_tool._expand_queries("jualan pala")) > retrieval_tool.DENSE_MAX_VARIANTS
+
+    search("jualan pala")
+
+    # Tanpa "*" = varian; sisanya query prefix fallback per varian
+    variants = [q for q in search.matches if "*" not in q]
+    assert len(variants) == retrieval_tool.DENSE_MAX_VARIANTS
+
+
+def test_cache_key_includes_dense_generation(search, dense):
+    dense([("c3", 0.9)])
+    assert ids(search("sirup gula")) == ["c1", "c3"]
+
+    dense([("c2", 0.9)], generation=("dense", 2))
+
+    assert ids(search("sirup gula")) == ["c1", "c2"]
+
+
+def test_search_many_uses_one_connection(search, monkeypatch):
+    search("pala")
+    engine = retrieval_engine._engine
+    opened = []
+    monkeypatch.setattr(engine, "_open", lambda: opened.append(1))
+
+    outs = retrieval_tool.search_many([{"query": "sirup gula"}, {"query": "manisan", "k": 1}, {"query": "botol"}])
+
+    assert [ids(o) for o in outs] == [["c1"], ["c2"], ["c3"]]
+    assert opened == []
+    assert engine._opened == 1
+
+
+def test_search_batch_runs_one_pass_per_event_loop_turn(search):
+    batch = retrieval_tool.SearchBatch()
+
+    async def go():
+        first = await asyncio.gather(batch("sirup gula"), batch("manisan"), batch("pala", k=1, category="Resep Olahan"))
+        # Tahap berikutnya (setelah await) jadi batch baru
+        second = await asyncio.gather(batch("botol"))
+        return first + second
+
+    outs = asyncio.run(go())
+
+    assert [ids(o) for o in outs] == [["c1"], ["c2"], ["c1"], ["c3"]]
+    assert (batch.batches, batch.searches) == (2, 4)
+
+
+def test_search_batch_propagates_errors(search, monkeypatch):
+    def boom(specs):
+        raise RuntimeError("db gone")
+
+    monkeypatch.setattr(retrieval_tool, "search_many", boom)
+    batch = retrieval_tool.SearchBatch()
+
+    async def go():
+        return await asyncio.gather(batch("a"), batch("b"), return_exceptions=True)
+
+    assert [str(e) for e in asyncio.run(go())] == ["db gone", "db gone"]
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import time
+
+import pytest
+from google.adk.events.event import Event
+from google.genai import types
+
+from my_agent.app.session_service import BoundedSessionService, SessionOwnershipError, make_session_service
+
+APP = "app"
+USER = "1"
+
+
+def ev(author: str, text: str) -> Event:
+    role = "user" if author == "user" else "model"
+    return Event(author=author, invocation_id="inv", content=types.Content(role=role, parts=[types.Part(text=text)]))
+
+
+async def add_turns(svc, session_id: str, n: int, start: int = 0):
+    for i in range(start, start + n):
+        s = await svc.get_session(app_name=APP, user_id=USER, session_id=session_id)
+        await svc.append_event(s, ev("user", f"q{i}"))
+        await svc.append_event(s, ev("agent", f"a{i}"))
+
+
+def texts(events) -> list:
+    return ["".join(p.text for p in e.content.parts) for e in events]
+
+
+def stored_texts(svc, session_id: str) -> list:
+    rows = svc.store.get_messages(session_id, role=svc.EVENT_ROLE)
+    return [json.loads(r["content"])["content"]["parts"][0]["text"] for r in rows]
+
+
+@pytest.fixture
+def sqlite_service(tmp_path):
+    services = []
+
+    def make(**limits):
+        svc = make_session_service("sqlite", str(tmp_path / "chat.db"), **limits)
+        services.append(svc)
+        return svc
+
+    yield make
+    for svc in services:
+        svc.store.close()
+
+
+def test_max_events_truncates_whole_turns():
+    svc = BoundedSessionService(max_events=5, max_tokens=10**6)
+
+    async def go():
+        await svc.create_session(app_name=APP, user_id=USER, session_id="s")
+        await add_turns(svc, "s", 4)
+        return await svc.get_session(app_name=APP, user_id=USER, session_id="s")
+
+    s = asyncio.run(go())
+    assert texts(s.events) == ["q2", "a2", "q3", "a3"]
+    assert s.events[0].author == "user"
+
+
+def test_lru_evicts_least_recently_used_session():
+    svc = BoundedSessionService(max_sessions=2)
+
+    async def go():
+        for sid in ("a", "b"):
+            await svc.create_session(app_name=APP, user_id=USER, session_id=sid)
+        await svc.get_session(app_name=APP, user_id=USER, session_id="a")
+        await svc.create_session(app_name=APP, user_id=USER, session_id="c")
+        return [await svc.get_session(app_name=APP, user_id=USER, session_id=sid) for sid in "abc"]
+
+    a, b, c = asyncio.run(go())
+    assert a is not None and b is None and c is not None
+    assert svc.evicted_lru == 1
+
+
+def test_idle_session_is_dropped(monkeypatch):
+    svc = BoundedSessionService(idle_ttl_sec=10)
+
+    async def go():
+        await svc.create_session(app_name=APP, user_id=USER, session_id="s")
+        key = (APP, USER, "s")
+        svc._last_access[key] -= 11
+        return await svc.get_session(app_name=APP, user_id=USER, session_id="s")
+
+    assert asyncio.run(go()) is None
+    assert svc.evicted_idle == 1
+
+
+def test_fork_skips_pending_turn_and_adopt_replaces_events():
+    svc = BoundedSessionService()
+
+    async def go():
+        await svc.create_session(app_name=APP, user_id=USER, session_id="s")
+        await add_turns(svc, "s", 2)
+        s = await svc.get_session(app_name=APP, user_id=USER, session_id="s")
+        await svc.append_event(s, ev("user", "pending"))
+
+        await svc.fork_session(
+            app_name=APP, user_id=USER, session_id="s", new_session_id="s::h", pending_message="pending"
+        )
+        fork = await svc.get_session(app_name=APP, user_id=USER, session_id="s::h")
+        fork_events = texts(fork.events)
+        await svc.append_event(fork, ev("user", "pending"))
+        await svc.append_event(fork, ev("agent", "from fallback"))
+
+        assert await svc.adopt_session(app_name=APP, user_id=USER, session_id="s", from_session_id="s::h")
+        s = await svc.get_session(app_name=APP, user_id=USER, session_id="s")
+        gone = await svc.get_session(app_name=APP, user_id=USER, session_id="s::h")
+        return fork_events, texts(s.events), gone
+
+    fork_events, adopted, gone = asyncio.run(go())
+    assert fork_events == ["q0", "a0", "q1", "a1"]
+    assert adopted == ["q0", "a0", "q1", "a1", "pending", "from fallback"]
+    assert gone is None
+
+
+def test_sqlite_session_survives_restart(sqlite_service):
+    async def write():
+        svc = sqlite_service()
+        await svc.create_session(app_name=APP, user_id=USER, session_id="s")
+        await add_turns(svc, "s", 2)
+
+    async def read():
+        svc = sqlite_service()
+        return await svc.get_session(app_name=APP, user_id=USER, session_id="s")
+
+    asyncio.run(write())
+    s = asyncio.run(read())
+    assert texts(s.events) == ["q0", "a0", "q1", "a1"]
+
+
+def test_sqlite_rejects_other_users_session(sqlite_service):
+    async def go():
+        svc = sqlite_service()
+        await svc.create_session(app_name=APP, user_id=USER, session_id="s")
+        fresh = sqlite_service()
+        return await fresh.get_session(app_name=APP, user_id="2", session_id="s")
+
+    assert asyncio.run(go()) is None
+
+
+def test_sqlite_adopt_keeps_history_beyond_memory_budget(sqlite_service):
+    svc = sqlite_service(max_events=4, max_tokens=10**6)
+
+    async def go():
+        await svc.create_session(app_name=APP, user_id=USER, session_id="s")
+        await add_turns(svc, "s", 10)
+        s = await svc.get_session(app_name=APP, user_id=USER, session_id="s")
+        await svc.append_event(s, ev("user", "pending"))
+
+        await svc.fork_session(
+            app_name=APP, user_id=USER, session_id="s", new_session_id="s::h", pending_message="pending"
+        )
+        # Primary sempat menulis sebagian turn sebelum kalah
+        await svc.append_event(s, ev("agent", "partial primary"))
+        fork = await svc.get_session(app_name=APP, user_id=USER, session_id="s::h")
+        await svc.append_event(fork, ev("user", "pending"))
+        await svc.append_event(fork, ev("agent", "from fallback"))
+        await svc.adopt_session(app_name=APP, user_id=USER, session_id="s", from_session_id="s::h")
+
+    asyncio.run(go())
+    stored = stored_texts(svc, "s")
+    assert len(stored) == 22
+    assert stored[:20] == [t for i in range(10) for t in (f"q{i}", f"a{i}")]
+    assert stored[20:] == ["pending", "from fallback"]
+    # Fork hanya di memori, tidak pernah ditulis ke DB
+    assert svc.store.count_messages("s::h") == 0
+
+
+def test_sqlite_delete_removes_rows(sqlite_service):
+    svc = sqlite_service()
+
+    async def go():
+        await svc.create_session(app_name=APP, user_id=USER, session_id="s")
+        await add_turns(svc, "s", 1)
+        await svc.delete_session(app_name=APP, user_id=USER, session_id="s")
+        return await svc.get_session(app_name=APP, user_id=USER, session_id="s")
+
+    assert asyncio.run(go()) is None
+    assert svc.store.count_messages("s") == 0
+
+
+def test_sqlite_refuses_session_id_of_another_user(sqlite_service):
+    svc = sqlite_service()
+
+    async def go():
+        await svc.create_session(app_name=APP, user_id=USER, session_id="s")
+        await add_turns(svc, "s", 1)
+        fresh = sqlite_service()
+        with pytest.raises(SessionOwnershipError):
+            await fresh.create_session(app_name=APP, user_id="2", session_id="s")
+        return fresh._storage(APP, "2", "s")
+
+    assert asyncio.run(go()) is None
+    assert stored_texts(svc, "s") == ["q0", "a0"]
+    assert svc.store.session_owner("s") == 1
+
+
+def test_sqlite_adopt_waits_for_cancelled_primary_write(sqlite_service, monkeypatch):
+    svc = sqlite_service()
+    add_message = svc.store.add_message
+
+    def slow_add_message(*args, **kwargs):
+        # Thread penulis primary baru mengantre barisnya setelah task-nya dibatalkan
+        time.sleep(0.2)
+        add_message(*args, **kwargs)
+
+    async def go():
+        await svc.create_session(app_name=APP, user_id=USER, session_id="s")
+        await add_turns(svc, "s", 1)
+        s = await svc.get_session(app_name=APP, user_id=USER, session_id="s")
+        await svc.append_event(s, ev("user", "pending"))
+        await svc.fork_session(
+            app_name=APP, user_id=USER, session_id="s", new_session_id="s::h", pending_message="pending"
+        )
+
+        monkeypatch.setattr(svc.store, "add_message", slow_add_message)
+        primary = asyncio.create_task(svc.append_event(s, ev("agent", "partial primary")))
+        await asyncio.sleep(0.05)
+        primary.cancel()
+        monkeypatch.setattr(svc.store, "add_message", add_message)
+
+        fork = await svc.get_session(app_name=APP, user_id=USER, session_id="s::h")
+        await svc.append_event(fork, ev("user", "pending"))
+        await svc.append_event(fork, ev("agent", "from fallback"))
+        await svc.adopt_session(app_name=APP, user_id=USER, session_id="s", from_session_id="s::h")
+        await asyncio.sleep(0.3)
+
+    asyncio.run(go())
+    assert stored_texts(svc, "s") == ["q0", "a0", "pending", "from fallback"]
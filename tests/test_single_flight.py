@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from my_agent.app.single_flight import SingleFlight
+
+
+def counting(result="answer", delay=0.05, exc=None):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if exc is not None:
+            raise exc
+        return result
+
+    return fn, calls
+
+
+def test_identical_calls_share_one_execution():
+    sf = SingleFlight()
+    fn, calls = counting()
+
+    async def go():
+        return await asyncio.gather(*(sf.do("k", fn) for _ in range(5)))
+
+    out = asyncio.run(go())
+    assert len(calls) == 1
+    assert [r for r, _ in out] == ["answer"] * 5
+    assert sorted(shared for _, shared in out) == [False, True, True, True, True]
+    assert sf.stats() == {"inflight": 0, "leaders": 1, "followers": 4}
+
+
+def test_different_keys_run_separately():
+    sf = SingleFlight()
+    fn, calls = counting()
+
+    async def go():
+        await asyncio.gather(sf.do("a", fn), sf.do("b", fn))
+
+    asyncio.run(go())
+    assert len(calls) == 2
+
+
+def test_sequential_calls_do_not_share():
+    sf = SingleFlight()
+    fn, calls = counting(delay=0)
+
+    async def go():
+        await sf.do("k", fn)
+        return await sf.do("k", fn)
+
+    assert asyncio.run(go()) == ("answer", False)
+    assert len(calls) == 2
+
+
+def test_exception_reaches_every_waiter_and_key_is_forgotten():
+    sf = SingleFlight()
+    fn, calls = counting(exc=RuntimeError("boom"))
+
+    async def go():
+        return await asyncio.gather(sf.do("k", fn), sf.do("k", fn), return_exceptions=True)
+
+    out = asyncio.run(go())
+    assert len(calls) == 1
+    assert all(isinstance(e, RuntimeError) for e in out)
+    assert sf.stats()["inflight"] == 0
+
+
+def test_one_waiter_timing_out_does_not_cancel_shared_task():
+    sf = SingleFlight()
+    fn, calls = counting(delay=0.1)
+
+    async def go():
+        short = asyncio.wait_for(sf.do("k", fn), timeout=0.01)
+        long = sf.do("k", fn)
+        return await asyncio.gather(short, long, return_exceptions=True)
+
+    short, long = asyncio.run(go())
+    assert isinstance(short, asyncio.TimeoutError)
+    assert long[0] == "answer"
+    assert len(calls) == 1
+
+
+def test_shared_task_cancelled_when_all_waiters_leave():
+    sf = SingleFlight()
+    cancelled = []
+
+    async def fn():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def go():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(asyncio.gather(sf.do("k", fn), sf.do("k", fn)), timeout=0.02)
+        await asyncio.sleep(0)
+
+    asyncio.run(go())
+    assert cancelled == [1]
+    assert sf.stats()["inflight"] == 0
@@ -0,0 +1,19 @@
+import pytest
+
+from my_agent.stemmer import stem, stem_text
+
+
+@pytest.mark.parametrize("words", [
+    ("jualan", "berjualan", "menjual", "penjualan", "dijual"),
+    ("kemas", "kemasan"),
+    ("olah", "mengolah", "pengolahan", "diolah"),
+    ("simpan", "menyimpan", "penyimpanan"),
+])
+def test_stemmer_groups_morphological_variants(words):
+    assert len({stem(w) for w in words}) == 1
+
+
+def test_stemmer_keeps_short_and_non_alpha_tokens():
+    assert stem("pala") == "pala"
+    assert stem("100ml") == "100ml"
+    assert stem_text("Menjual Pala!") == f"{stem('menjual')} pala"